@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+性能基准测试脚本
+
+用法:
+    python benchmark.py xor [--sizes 1024 32768 262144] [--repeat 20]
+    python benchmark.py log [--file showlog.txt] [--megabytes 4] [--repeat 5]
+    python benchmark.py storage [--events 2000] [--players 100] [--profiles durable fast]
+"""
+import argparse
+import array
+import asyncio
+import logging
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+from connection import XorCipher, np
+from dataStorage import DataStorage
+from log_loop import LogCursor, LogEvent, classify_log_line
+from storage_profile import STORAGE_PROFILES
+
+
+def _legacy_xor(msg: bytes, xorkey: bytes) -> bytes:
+    """旧版逐字节XOR实现，仅作为基准对照"""
+    n = []
+    for i in range(len(msg)):
+        n.append(msg[i] ^ xorkey[i % len(xorkey)])
+
+    return array.array("B", n).tobytes()
+
+
+# 旧版日志解析使用的正则表达式，仅作为基准对照
+_LEGACY_LOG_TIME = re.compile(r".*\((\d+)\).*")
+_LEGACY_RULES = (
+    ("TEAM KILL:", "TEAM KILL", re.compile(r"TEAM KILL: (?P<attacker>.*)\((?:Allies|Axis)/(?P<attacker_id>.*)\) -> "
+                                           r"(?P<victim>.*)\((?:Allies|Axis)/(?P<victim_id>.*)\) with (?P<weapon>.*)")),
+    ("KILL:", "KILL", re.compile(r"KILL: (?P<attacker>.*)\((?:Allies|Axis)/(?P<attacker_id>.*)\) -> "
+                                 r"(?P<victim>.*)\((?:Allies|Axis)/(?P<victim_id>.*)\) with (?P<weapon>.*)")),
+    ("CHAT", "CHAT", re.compile(r"CHAT\[(Team|Unit)]\[(.*)\((Allies|Axis)/(.*)\)]: (.*)")),
+    ("CHAT", "CHAT", re.compile(r"CHAT.*\[(.*?)]:\s*(.*)")),
+    ("DISCONNECTED", "DISCONNECTED", re.compile(r"DISCONNECTED (?P<player>.*) \((?P<player_id>[^()]*)\)")),
+    ("CONNECTED", "CONNECTED", re.compile(r"\bCONNECTED (?P<player>.*) \((?P<player_id>[^()]*)\)")),
+    ("TEAMSWITCH", "TEAMSWITCH", re.compile(r"TEAMSWITCH (?P<player>.*) \((?P<old_team>.*) > (?P<new_team>.*)\)")),
+    ("MATCH START", "MATCH START", re.compile(r"MATCH START (?P<map>.*)")),
+    ("MATCH ENDED", "MATCH ENDED", re.compile(r"MATCH ENDED (?P<result>.*)")),
+    ("MESSAGE:", "MESSAGE", re.compile(r"MESSAGE: player \[(?P<player>.*)\((?P<player_id>[^()]*)\)], "
+                                       r"content \[(?P<content>.*)]")),
+)
+
+
+def _legacy_parse_line(line: str):
+    """旧版日志解析：贪婪匹配时间戳，再逐条规则搜索事件类型"""
+    time_match = _LEGACY_LOG_TIME.match(line)
+    if not time_match:
+        return None
+    timestamp = time_match.group(1)
+    relative_time = "00:00:00"
+    if "[" in line and "]" in line:
+        time_part = line[line.find("[") + 1:line.find("]")]
+        if ":" in time_part:
+            relative_time = time_part
+    for keyword, event_type, pattern in _LEGACY_RULES:
+        if keyword in line:
+            match = pattern.search(line)
+            if match:
+                return LogEvent(event_type, timestamp, relative_time, line, match.groups(), match.groupdict())
+    return None
+
+
+def _synthetic_log(megabytes: float) -> list:
+    """生成接近真实对局比例的日志行，击杀占多数，其次是聊天和进出服务器"""
+    rng = random.Random(0)
+    weapons = ["M1 GARAND", "MP40", "KARABINER 98K", "M1919 BROWNING", "MG42", "Sherman M4A3(75)W", "GRENADE"]
+    names = [f"Player{i} [{rng.choice(['CN', 'EU', 'NA'])}]" for i in range(100)]
+    ids = [str(76561198000000000 + i) for i in range(100)]
+    teams = ["Allies", "Axis"]
+
+    lines = []
+    size = 0
+    timestamp = 1_700_000_000
+    while size < megabytes * 1024 * 1024:
+        timestamp += rng.randint(0, 2)
+        header = f"[{rng.randint(0, 59)}:{rng.randint(0, 59):02d} min ({timestamp})] "
+        a, b = rng.randrange(100), rng.randrange(100)
+        kind = rng.random()
+        if kind < 0.6:
+            body = (f"KILL: {names[a]}({teams[a % 2]}/{ids[a]}) -> "
+                    f"{names[b]}({teams[b % 2]}/{ids[b]}) with {rng.choice(weapons)}")
+        elif kind < 0.63:
+            body = (f"TEAM KILL: {names[a]}({teams[a % 2]}/{ids[a]}) -> "
+                    f"{names[b]}({teams[a % 2]}/{ids[b]}) with {rng.choice(weapons)}")
+        elif kind < 0.8:
+            body = f"CHAT[{rng.choice(['Team', 'Unit'])}][{names[a]}({teams[a % 2]}/{ids[a]})]: gg (wp) {rng.random()}"
+        elif kind < 0.87:
+            body = f"CONNECTED {names[a]} ({ids[a]})"
+        elif kind < 0.94:
+            body = f"DISCONNECTED {names[a]} ({ids[a]})"
+        elif kind < 0.98:
+            body = f"TEAMSWITCH {names[a]} (None > {teams[a % 2]})"
+        else:
+            body = f"VOTESYS: Player [{names[a]}] voted [PV_Favour] for VoteID[{rng.randint(1, 99)}]"
+        line = header + body
+        lines.append(line)
+        size += len(line) + 1
+    return lines
+
+
+def _measure(func, repeat: int) -> float:
+    """返回多次执行中最快一次的耗时（秒）"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_xor(sizes, repeat: int) -> None:
+    """比较旧版逐字节XOR与XorCipher整块XOR的耗时"""
+    key = os.urandom(4)
+    cipher = XorCipher(key)
+
+    print(f"XOR基准测试 (密钥长度 {len(key)}，NumPy: {'可用' if np is not None else '不可用'}，取 {repeat} 次最快值)")
+    print(f"{'大小':>10} {'旧版(ms)':>12} {'新版(ms)':>12} {'加速比':>8}")
+
+    for size in sizes:
+        payload = os.urandom(size)
+
+        # 确认两种实现结果一致
+        if cipher.apply(payload) != _legacy_xor(payload, key):
+            print(f"{size:>10} 结果不一致！")
+            sys.exit(1)
+
+        legacy = _measure(lambda: _legacy_xor(payload, key), repeat)
+        current = _measure(lambda: cipher.apply(payload), repeat)
+        print(f"{size:>10} {legacy * 1000:>12.3f} {current * 1000:>12.3f} {legacy / current:>7.1f}x")
+
+
+def bench_log(path, megabytes: float, repeat: int) -> None:
+    """比较旧版多次正则搜索与单次分类匹配解析整份日志的耗时"""
+    if path:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            lines = [line.strip() for line in f if line.strip()]
+        source = path
+    else:
+        lines = _synthetic_log(megabytes)
+        source = "合成日志"
+
+    size = sum(len(line) + 1 for line in lines) / 1024 / 1024
+    print(f"日志解析基准测试 ({source}，{len(lines)} 行，{size:.1f} MB，取 {repeat} 次最快值)")
+
+    # 确认两种实现识别出的事件数量一致
+    legacy_hits = sum(1 for line in lines if _legacy_parse_line(line) is not None)
+    current_hits = sum(1 for line in lines if classify_log_line(line) is not None)
+    print(f"识别事件数: 旧版 {legacy_hits}，新版 {current_hits}")
+
+    # 确认同一日志行的相对时间在下次轮询中变化后，游标不会再次返回它
+    cursor = LogCursor()
+    window = lines[-500:]
+    first = cursor.new_lines(window)
+    aged = [re.sub(r"^\[[^\]\(]*? \(", "[9:59 min (", line) for line in window]
+    repeated = cursor.new_lines(aged)
+    print(f"游标去重: 首次返回 {len(first)} 行，相对时间变化后重复返回 {len(repeated)} 行")
+
+    legacy = _measure(lambda: [_legacy_parse_line(line) for line in lines], repeat)
+    current = _measure(lambda: [classify_log_line(line) for line in lines], repeat)
+    print(f"{'旧版(ms)':>12} {'新版(ms)':>12} {'加速比':>8} {'新版(行/秒)':>14}")
+    print(f"{legacy * 1000:>12.1f} {current * 1000:>12.1f} {legacy / current:>7.1f}x {len(lines) / current:>14.0f}")
+
+
+def _kill_events(count: int, players: int) -> list:
+    """生成击杀事件对应的统计增量，每个事件包含击杀者和被击杀者两条记录"""
+    rng = random.Random(0)
+    events = []
+    for _ in range(count):
+        killer, victim = rng.sample(range(players), 2)
+        events.append({
+            str(76561198000000000 + killer): {"name": f"Player{killer}", "total_kill": 1, "infantry_kill": 1},
+            str(76561198000000000 + victim): {"name": f"Player{victim}", "total_death": 1},
+        })
+    return events
+
+
+def bench_storage(events: int, players: int, profiles) -> None:
+    """比较各存储配置下击杀事件的写入吞吐：每个事件单独提交，以及通过写线程组提交"""
+    kill_events = _kill_events(events, players)
+    print(f"击杀统计写入基准测试 ({events} 个事件，{players} 名玩家)")
+    print(f"{'配置':>8} {'逐个提交(事件/秒)':>18} {'组提交(事件/秒)':>16} {'提交次数':>8}")
+
+    for name in profiles:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            data = DataStorage(os.path.join(tmpdir, "bench.db"), profile=name)
+            data.logger.setLevel(logging.WARNING)
+            data.first_run()
+
+            # 旧的写入方式：每个事件一个事务，在调用线程中提交
+            start = time.perf_counter()
+            for increments in kill_events:
+                data.increment_player_stats(increments)
+            single = events / (time.perf_counter() - start)
+
+            # 事件并发提交给写线程，积压的事件合并为一个事务
+            async def grouped():
+                await asyncio.gather(*(data.async_increment_player_stats(increments) for increments in kill_events))
+
+            start = time.perf_counter()
+            asyncio.run(grouped())
+            group = events / (time.perf_counter() - start)
+            commits = data.engine.commits
+            data.close()
+
+        print(f"{name:>8} {single:>18.0f} {group:>16.0f} {commits:>8}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="HLL服务器工具性能基准测试")
+    subparsers = parser.add_subparsers(dest="target", required=True)
+
+    xor_parser = subparsers.add_parser("xor", help="RCON负载XOR加解密")
+    xor_parser.add_argument("--sizes", type=int, nargs="+", default=[64, 1024, 32_768, 262_144])
+    xor_parser.add_argument("--repeat", type=int, default=20)
+
+    log_parser = subparsers.add_parser("log", help="游戏日志解析")
+    log_parser.add_argument("--file", help="录制的showlog输出文件，不提供时使用合成日志")
+    log_parser.add_argument("--megabytes", type=float, default=4)
+    log_parser.add_argument("--repeat", type=int, default=5)
+
+    storage_parser = subparsers.add_parser("storage", help="击杀统计写入吞吐（各存储配置）")
+    storage_parser.add_argument("--events", type=int, default=2000)
+    storage_parser.add_argument("--players", type=int, default=100)
+    storage_parser.add_argument("--profiles", nargs="+", choices=list(STORAGE_PROFILES), default=list(STORAGE_PROFILES))
+
+    args = parser.parse_args()
+
+    if args.target == "xor":
+        bench_xor(args.sizes, args.repeat)
+    elif args.target == "log":
+        bench_log(args.file, args.megabytes, args.repeat)
+    elif args.target == "storage":
+        bench_storage(args.events, args.players, args.profiles)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
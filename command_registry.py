@@ -0,0 +1,126 @@
+# command_registry.py
+import time
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+from Log import log
+
+logger = log()
+
+# 参数解析方式
+ARGS_QUOTED = "quoted"  # 按空格分割，支持用引号包含空格
+ARGS_SPLIT = "split"  # 按单个空格分割
+ARGS_RAW = "raw"  # 不分割，整段参数文本作为一个参数
+
+
+class CommandCall(NamedTuple):
+    """一次命令调用"""
+    command: str  # 实际使用的命令名（小写）
+    args: List[str]  # 按命令声明的方式解析后的参数
+    raw: str  # 命令名之后的原始参数文本
+    caller: Any = None  # 调用方，游戏内命令为玩家名
+
+
+class CommandSpec(NamedTuple):
+    """命令声明"""
+    name: str
+    aliases: tuple
+    handler: Callable[[CommandCall], Awaitable[Any]]
+    admin: bool  # 是否只允许管理员使用
+    min_args: int  # 参数不足时不调用处理函数，直接返回 usage
+    usage: str
+    parse: str
+
+
+class CommandStats:
+    """单个命令的调用统计"""
+    __slots__ = ("calls", "errors", "rejected", "total_time", "max_time")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.rejected = 0  # 参数不足的调用
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def summary(self) -> str:
+        average = self.total_time / self.calls if self.calls else 0
+        return (f"{self.calls} 次（错误 {self.errors}，参数错误 {self.rejected}），"
+                f"平均 {average * 1000:.0f}ms，最长 {self.max_time * 1000:.0f}ms")
+
+
+def parse_args(text: str, mode: str, quoted_parser: Callable[[str], List[str]]) -> List[str]:
+    """按声明的方式解析参数文本"""
+    text = text.strip()
+    if not text:
+        return []
+    if mode == ARGS_QUOTED:
+        return quoted_parser(text)
+    if mode == ARGS_SPLIT:
+        return text.split(" ")
+    return [text]
+
+
+class CommandRegistry:
+    """
+    命令注册表
+
+    命令名和别名统一注册到一个字典中，分发是一次字典查找，新增命令不会加长其他命令的匹配路径；
+    参数按命令声明的方式只解析一次，并记录每个命令的调用次数和耗时
+    """
+
+    def __init__(self, name: str, quoted_parser: Callable[[str], List[str]]):
+        self.name = name
+        self.quoted_parser = quoted_parser
+        self._commands: Dict[str, CommandSpec] = {}
+        self._stats: Dict[str, CommandStats] = {}
+
+    def command(self, name: str, *aliases: str, admin: bool = True, min_args: int = 0, usage: str = "",
+                parse: str = ARGS_QUOTED) -> Callable:
+        """注册命令的装饰器，命令名和别名不区分大小写"""
+        def decorator(handler: Callable[[CommandCall], Awaitable[Any]]):
+            spec = CommandSpec(name, aliases, handler, admin, min_args, usage, parse)
+            for key in (name, *aliases):
+                key = key.lower()
+                if key in self._commands:
+                    raise ValueError(f"{self.name}命令重复注册: {key}")
+                self._commands[key] = spec
+            self._stats[name] = CommandStats()
+            return handler
+        return decorator
+
+    def get(self, command: str) -> Optional[CommandSpec]:
+        return self._commands.get(command.lower())
+
+    def __contains__(self, command: str) -> bool:
+        return command.lower() in self._commands
+
+    def prepare(self, spec: CommandSpec, command: str, raw: str, caller: Any = None) -> Optional[CommandCall]:
+        """解析参数，参数不足时返回None"""
+        args = parse_args(raw, spec.parse, self.quoted_parser)
+        if len(args) < spec.min_args:
+            self._stats[spec.name].rejected += 1
+            return None
+        return CommandCall(command.lower(), args, raw, caller)
+
+    async def invoke(self, spec: CommandSpec, call: CommandCall) -> Any:
+        """调用命令处理函数并记录耗时，异常继续向上抛出"""
+        stats = self._stats[spec.name]
+        stats.calls += 1
+        start = time.perf_counter()
+        try:
+            return await spec.handler(call)
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            stats.total_time += elapsed
+            stats.max_time = max(stats.max_time, elapsed)
+
+    def summary(self) -> str:
+        """所有被调用过的命令的统计，用于关闭时的日志"""
+        used = [(name, stats) for name, stats in self._stats.items() if stats.calls or stats.rejected]
+        if not used:
+            return f"{self.name}命令: 无调用"
+        used.sort(key=lambda item: item[1].total_time, reverse=True)
+        return f"{self.name}命令: " + "；".join(f"{name} {stats.summary()}" for name, stats in used)
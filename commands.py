@@ -1,43 +1,202 @@
+import asyncio
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
 from Log import log
-from connection import HLLConnectionPool, async_send_command
+from connection import AsyncHLLConnectionPool, async_send_command, get_connection_pool
 from dataStorage import DataStorage
 from credentials_manager import CredentialsManager
 
 SUCCESS = "SUCCESS"
 
+# 群发消息时失败接收者的重试次数
+BROADCAST_RETRIES = 1
+
+# 很少变化的只读命令及其缓存时间（秒）
+CACHED_COMMAND_TTLS = {
+    "get name": 300,
+    "get mapsforrotation": 600,
+    "rotlist": 60,
+    "get adminids": 60,
+    "get vipids": 60,
+    "get votekickthreshold": 60,
+}
+
+# 写命令 -> 执行后需要失效的缓存命令
+CACHE_INVALIDATIONS = {
+    "vipadd": ("get vipids",),
+    "vipdel": ("get vipids",),
+    "rotadd": ("rotlist",),
+    "rotdel": ("rotlist",),
+    "adminadd": ("get adminids",),
+    "admindel": ("get adminids",),
+    "setvotekickthreshold": ("get votekickthreshold",),
+}
+
 
 def convert_tabs_to_spaces(value: str) -> str:
     return value.replace("\t", " ")
 
 
-class Commands:
-    def __init__(self):
-        # 获取凭证
-        cred_manager = CredentialsManager()
-        credentials = cred_manager.get_credentials()
-        
-        if not credentials:
-            self.logger = log()
-            self.logger.error("未找到服务器凭证，请先运行 reset_credentials.py 设置凭证")
-            raise ValueError("未找到服务器凭证")
+def parse_map_rotation(result: str) -> list[str]:
+    """解析 rotlist 的返回值为地图ID列表"""
+    if not result:
+        return []
+
+    # 分行处理
+    map_list = []
+    lines = result.split("\n")
+    for line in lines:
+        if not line.strip():
+            continue
             
-        # 创建连接池 - 使用从凭证管理器获取的信息
-        self.connection_pool = HLLConnectionPool(
-            credentials["host"], 
-            int(credentials["port"]),  # 确保端口是整数类型
-            credentials["password"]
-        )
+        # 处理可能的格式：序号+地图ID，如 "1 stmariedumont_warfare"
+        parts = line.strip().split(" ", 1)
+        if len(parts) == 2 and parts[0].isdigit():
+            map_list.append(parts[1].strip())
+        else:
+            map_list.append(line.strip())
+            
+    # 过滤掉所有纯数字项
+    map_list = [x for x in map_list if not x.isdigit()]
+    return map_list
+
+
+class ResponseCache:
+    """
+    只读命令结果的TTL缓存
+
+    只缓存 CACHED_COMMAND_TTLS 中列出的命令，执行 CACHE_INVALIDATIONS 中的写命令后
+    立即失效对应的缓存，记录命中和未命中次数
+    """
+
+    def __init__(self, ttls: Dict[str, float] = CACHED_COMMAND_TTLS,
+                 invalidations: Dict[str, Tuple[str, ...]] = CACHE_INVALIDATIONS):
+        self.ttls = ttls
+        self.invalidations = invalidations
+        self._entries: Dict[str, Tuple[float, str]] = {}
+        # 每次失效都会递增，查询期间发生过失效的结果不再写入缓存
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, command: str) -> Optional[str]:
+        """取未过期的缓存结果，不可缓存或未命中时返回None"""
+        if command not in self.ttls:
+            return None
+        entry = self._entries.get(command)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        return None
+
+    def put(self, command: str, result: str, generation: int) -> None:
+        """
+        保存可缓存命令的结果，空结果（命令失败）不缓存
+
+        Args:
+            command: 命令
+            result: 命令结果
+            generation: 发送命令前的 self.generation
+        """
+        ttl = self.ttls.get(command)
+        if ttl and result and generation == self.generation:
+            self._entries[command] = (time.monotonic() + ttl, result)
+
+    def invalidate(self, *commands: str) -> None:
+        """失效指定命令的缓存，不指定时清空全部缓存"""
+        self.generation += 1
+        if not commands:
+            self._entries.clear()
+        for command in commands:
+            self._entries.pop(command, None)
+
+    def invalidate_for(self, command: str) -> None:
+        """按写命令失效相关的缓存"""
+        affected = self.invalidations.get(command.split(" ", 1)[0])
+        if affected:
+            self.invalidate(*affected)
+
+    def stats(self) -> Dict[str, float]:
+        """缓存大小和命中情况"""
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+# 每个连接池（即每台服务器）一个缓存，同一进程内的命令实例共享
+_response_caches: Dict[AsyncHLLConnectionPool, ResponseCache] = {}
+
+
+def get_response_cache(connection_pool: AsyncHLLConnectionPool) -> ResponseCache:
+    """获取连接池对应的共享缓存，不存在时创建"""
+    cache = _response_caches.get(connection_pool)
+    if cache is None:
+        cache = _response_caches[connection_pool] = ResponseCache()
+    return cache
+
+
+class BroadcastResult(NamedTuple):
+    """群发消息的结果"""
+    sent: List[str]  # 发送成功的接收者
+    failed: List[str]  # 重试后仍失败的接收者
+    latencies: Dict[str, float]  # 每个接收者最后一次发送的耗时（秒）
+    elapsed: float  # 群发总耗时（秒）
+
+
+class Commands:
+    def __init__(self, connection_pool: AsyncHLLConnectionPool | None = None, data: DataStorage | None = None):
+        """
+        Args:
+            connection_pool: 使用的连接池，为None时使用进程内共享的连接池
+            data: 使用的数据存储，为None时新建
+
+        只读元数据命令的结果缓存在与连接池对应的 ResponseCache 中（见 CACHED_COMMAND_TTLS）
+        """
         self.logger = log()
-        self.data = DataStorage("data.db")  # 初始化数据存储
+
+        if connection_pool is None:
+            # 获取凭证
+            cred_manager = CredentialsManager()
+            credentials = cred_manager.get_credentials()
+
+            if not credentials:
+                self.logger.error("未找到服务器凭证，请先运行 reset_credentials.py 设置凭证")
+                raise ValueError("未找到服务器凭证")
+
+            # 同一进程内的所有命令实例共享一个连接池
+            connection_pool = get_connection_pool(
+                credentials["host"],
+                credentials["port"],
+                credentials["password"]
+            )
+
+        self.connection_pool = connection_pool
+        self.cache = get_response_cache(connection_pool)
+        self.data = data if data is not None else DataStorage("data.db")  # 初始化数据存储
 
     async def __send_quest(self, command: str, can_fail=True, log_info=False) -> str:
-        """使用连接池发送命令，使用异步包装函数调用同步方法"""
+        """使用异步连接池发送命令，等待响应期间不阻塞事件循环"""
         try:
+            cached = self.cache.get(command)
+            if cached is not None:
+                return cached
+
             if log_info:
                 self.logger.info(f"发送命令: {command}")
 
-            # 使用异步包装函数，保持异步API兼容性
-            result = await async_send_command(self.connection_pool, command)
+            generation = self.cache.generation
+            try:
+                result = await async_send_command(self.connection_pool, command)
+            finally:
+                # 写命令无论成功与否都失效相关缓存，下次读取时重新查询
+                self.cache.invalidate_for(command)
+            self.cache.put(command, result, generation)
 
             if log_info:
                 self.logger.info(f"命令结果: {result}")
@@ -49,6 +208,23 @@ class Commands:
             self.logger.error(f"命令 '{command}' 执行失败: {e}")
             return ""
 
+    async def batch(self, commands: Iterable[str]) -> Dict[str, str]:
+        """
+        同时发送多条只读命令并一起返回结果
+
+        相同的命令只发送一次；各命令在连接池的不同连接上并发执行，
+        因此总耗时约为一次往返而不是逐条累加
+
+        Args:
+            commands: 命令列表，如 ["get slots", "get name", "get map"]
+
+        Returns:
+            命令 -> 结果 的字典，失败的命令结果为空字符串
+        """
+        unique = list(dict.fromkeys(commands))
+        results = await asyncio.gather(*(self.__send_quest(command) for command in unique))
+        return dict(zip(unique, results))
+
     async def get_map(self) -> str:
         return await self.__send_quest("get map")
 
@@ -116,49 +292,33 @@ class Commands:
             地图ID列表，如 ["stmariedumont_warfare", "foy_offensive_ger", ...]
         """
         result = await self.__send_quest("rotlist", can_fail=False)
-        if not result:
-            return []
-            
-        # 分行处理
-        map_list = []
-        lines = result.split("\n")
-        for line in lines:
-            if not line.strip():
-                continue
-                
-            # 处理可能的格式：序号+地图ID，如 "1 stmariedumont_warfare"
-            parts = line.strip().split(" ", 1)
-            if len(parts) == 2 and parts[0].isdigit():
-                map_list.append(parts[1].strip())
-            else:
-                map_list.append(line.strip())
-                
-        # 过滤掉所有纯数字项
-        map_list = [x for x in map_list if not x.isdigit()]
-        
+        map_list = parse_map_rotation(result)
+
         # 记录日志以便调试
         self.logger.debug(f"地图轮换列表解析结果: {map_list}")
         
         return map_list
 
-    async def get_vip_ids(self):
+    async def get_vip_ids(self) -> list[dict] | None:
+        """获取游戏中的VIP列表，查询失败或无法解析时返回None，与没有VIP的空列表区分"""
         res = await self.__send_quest("get vipids")
         if not res:
-            return []
+            return None
 
         try:
             # 分割结果
             parts = res.split("\t")
             if len(parts) < 2:
+                if parts[0].strip() == "0":
+                    return []
                 self.logger.warning(f"VIP列表格式错误: {res}")
-                return []
+                return None
 
             # 跳过第一个数字（VIP数量）
-            vip_list = parts[1]
             vip_ids = []
 
             # 处理VIP列表
-            for item in vip_list.split("\t"):
+            for item in parts[1:]:
                 if not item:
                     continue
 
@@ -180,7 +340,7 @@ class Commands:
             return vip_ids
         except Exception as e:
             self.logger.error(f"处理VIP列表失败: {e}")
-            return []
+            return None
 
     async def get_admin_groups(self):
         return await self.__send_quest("get admingroups")
@@ -367,6 +527,14 @@ class Commands:
             self.logger.error(f"添加游戏VIP失败: {str(e)}")
             return False
 
+    async def remove_game_vip(self, player_id: str) -> bool:
+        """只从游戏VIP系统移除，不检查也不修改数据库"""
+        try:
+            return await self.__send_quest(f"vipdel {player_id}", log_info=True) == SUCCESS
+        except Exception as e:
+            self.logger.error(f"移除游戏VIP失败: {str(e)}")
+            return False
+
     async def remove_vip(self, player_id) -> bool:
         """移除VIP
         
@@ -384,7 +552,7 @@ class Commands:
                 return True
 
             # 从游戏VIP系统移除
-            game_vip_removed = await self.__send_quest(f"vipdel {player_id}", log_info=True) == SUCCESS
+            game_vip_removed = await self.remove_game_vip(player_id)
             if not game_vip_removed:
                 self.logger.error(f"从游戏移除VIP失败: {player_id}")
                 return False
@@ -401,5 +569,50 @@ class Commands:
             self.logger.error(f"移除VIP失败: {str(e)}")
             return False
 
-    async def message_player(self, player_name: str, message: str) -> None:
-        await self.__send_quest(f'message {player_name} {message}')
+    async def message_player(self, player_name: str, message: str) -> str:
+        return await self.__send_quest(f'message {player_name} {message}')
+
+    async def broadcast(self, recipients: Iterable[str], message: str, concurrency: int | None = None,
+                        retries: int = BROADCAST_RETRIES) -> BroadcastResult:
+        """
+        向多名玩家发送同一条消息
+
+        同时进行的请求数不超过连接池大小，消息分散到池中的各个连接上，
+        失败的接收者单独重试，不会重复发送给已成功的接收者
+
+        Args:
+            recipients: 玩家名称或ID，重复和空值会被忽略
+            message: 消息内容
+            concurrency: 同时发送的请求数，为None时使用连接池的最大连接数
+            retries: 失败接收者的重试次数
+
+        Returns:
+            群发结果，包含每个接收者的耗时和总耗时
+        """
+        start = time.perf_counter()
+        pending = list(dict.fromkeys(recipient for recipient in recipients if recipient))
+        semaphore = asyncio.Semaphore(concurrency or self.connection_pool.max_connections)
+        latencies: Dict[str, float] = {}
+
+        async def send(recipient: str) -> bool:
+            async with semaphore:
+                sent_at = time.perf_counter()
+                result = await self.message_player(recipient, message)
+                latencies[recipient] = time.perf_counter() - sent_at
+            return bool(result) and result != "FAIL"
+
+        sent = []
+        for attempt in range(retries + 1):
+            if not pending:
+                break
+            if attempt:
+                self.logger.info(f"重试向 {len(pending)} 名玩家发送消息 (第 {attempt} 次)")
+            results = await asyncio.gather(*(send(recipient) for recipient in pending))
+            sent.extend(recipient for recipient, ok in zip(pending, results) if ok)
+            pending = [recipient for recipient, ok in zip(pending, results) if not ok]
+
+        elapsed = time.perf_counter() - start
+        slowest = max(latencies.values(), default=0.0)
+        self.logger.info(f"群发消息完成: 成功 {len(sent)}，失败 {len(pending)}，"
+                         f"总耗时 {elapsed * 1000:.0f}ms，最慢 {slowest * 1000:.0f}ms")
+        return BroadcastResult(sent, pending, latencies, elapsed)
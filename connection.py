@@ -1,18 +1,47 @@
-import array
+import asyncio
 import logging
 import socket
 import time
 import uuid
 import threading
+from collections import deque
 from threading import get_ident
 from queue import Queue
-from typing import Optional, Tuple
+from typing import Deque, Dict, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # NumPy为可选依赖，未安装时使用大整数XOR
+    np = None
 
 # 基础配置
 MSGLEN = 32_768
 TIMEOUT_SEC = None  # 移除超时时间，允许无限等待
 MAX_CONNECTIONS = 3  # 减少最大连接数
 
+# 异步连接配置
+CONNECT_TIMEOUT_SEC = 10  # 建立连接和认证的超时时间
+COMMAND_TIMEOUT_SEC = 20  # 单条命令的最长等待时间，超时只影响当前连接
+ACQUIRE_TIMEOUT_SEC = 30  # 等待空闲连接的最长时间
+IDLE_THRESHOLD_SEC = 300  # 空闲超过5分钟的连接在取用时丢弃
+
+# 数据块超过该长度且安装了NumPy时使用NumPy计算XOR
+NUMPY_XOR_THRESHOLD = 64 * 1024
+
+# 响应接收配置
+INITIAL_RESPONSE_BUFFER = 4096  # 接收缓冲区初始大小，不够时成倍扩容
+RESPONSE_IDLE_SEC = 0.05  # 无法确定响应是否结束时，等待后续数据的空闲窗口
+RESPONSE_MORE_TIMEOUT_SEC = 5  # 已知响应未接收完整时，等待后续数据的最长时间
+# 响应以条目数量开头（数量\t条目\t条目...）的命令
+COUNTED_RESPONSE_COMMANDS = ("get playerids", "get vipids", "get players")
+# 响应没有结束标记、总是需要等待空闲窗口的命令
+IDLE_FRAMED_COMMANDS = ("showlog",)
+
+# ResponseReader.state 的返回值
+RESPONSE_DONE = "done"  # 响应已完整
+RESPONSE_IDLE = "idle"  # 可能已完整，在空闲窗口内没有新数据即结束
+RESPONSE_MORE = "more"  # 确定还有后续数据
+
 logger = logging.getLogger(__name__)
 
 
@@ -21,14 +50,165 @@ class HLLAuthError(Exception):
     pass
 
 
+class XorCipher:
+    """RCON协议的XOR加解密器
+
+    密钥预先展开为重复的缓冲区，每次对整块数据做一次XOR，
+    并记录密钥偏移量，使分块接收的响应可以逐块正确解密
+    """
+
+    def __init__(self, key: bytes):
+        if not key:
+            raise RuntimeError("游戏服务器没有返回密钥")
+        self.key = bytes(key)
+        self.offset = 0
+        self._expanded = self.key
+
+    def reset(self) -> None:
+        """从密钥开头重新开始，每条消息开始前调用"""
+        self.offset = 0
+
+    def _keystream(self, length: int) -> memoryview:
+        """返回从当前偏移量开始、长度为length的密钥流"""
+        end = self.offset + length
+        if len(self._expanded) < end:
+            self._expanded = self.key * (end // len(self.key) + 1)
+        return memoryview(self._expanded)[self.offset:end]
+
+    def process(self, data) -> bytes:
+        """加密/解密一块数据，并把偏移量推进到下一块的位置"""
+        length = len(data)
+        if not length:
+            return b""
+
+        keystream = self._keystream(length)
+        if np is not None and length >= NUMPY_XOR_THRESHOLD:
+            result = np.bitwise_xor(
+                np.frombuffer(data, dtype=np.uint8), np.frombuffer(keystream, dtype=np.uint8)
+            ).tobytes()
+        else:
+            result = (int.from_bytes(data, "big") ^ int.from_bytes(keystream, "big")).to_bytes(length, "big")
+
+        self.offset = (self.offset + length) % len(self.key)
+        return result
+
+    def apply(self, data) -> bytes:
+        """从密钥开头处理一条完整的消息"""
+        self.reset()
+        return self.process(data)
+
+
+class ResponseReader:
+    """RCON响应接收缓冲区
+
+    数据直接写入预分配的bytearray并原地解密，避免反复拼接字节串。
+    对以数量字段开头的列表命令，根据已收到的条目数判断响应是否完整；
+    其他命令在缓冲区被填满或命令本身没有结束标记时，等待一个短暂的空闲窗口
+    """
+
+    def __init__(self, size: int = INITIAL_RESPONSE_BUFFER):
+        self.buffer = bytearray(size)
+        self.length = 0
+        self._counted = False
+        self._idle_framed = False
+        self._expected: Optional[int] = None
+        self._tabs = 0
+
+    def start(self, command: Optional[str] = None) -> None:
+        """开始接收一条新的响应"""
+        command = (command or "").strip()
+        self.length = 0
+        self._counted = command in COUNTED_RESPONSE_COMMANDS
+        self._idle_framed = command.startswith(IDLE_FRAMED_COMMANDS)
+        self._expected = None
+        self._tabs = 0
+
+    def _reserve(self, nbytes: int) -> None:
+        """确保缓冲区还能写入nbytes字节"""
+        while len(self.buffer) - self.length < nbytes:
+            self.buffer.extend(bytes(len(self.buffer)))
+
+    def free_space(self, limit: int = MSGLEN) -> memoryview:
+        """返回可供recv_into写入的空闲区域，用完后应立即释放"""
+        if self.length == len(self.buffer):
+            self._reserve(1)
+        end = min(len(self.buffer), self.length + limit)
+        return memoryview(self.buffer)[self.length:end]
+
+    def commit(self, nbytes: int, cipher: XorCipher) -> None:
+        """对recv_into刚写入的nbytes字节原地解密"""
+        start, end = self.length, self.length + nbytes
+        self.buffer[start:end] = cipher.process(memoryview(self.buffer)[start:end])
+        self._advance(start, end)
+
+    def write(self, data: bytes, cipher: XorCipher) -> None:
+        """解密一块数据并追加到缓冲区"""
+        start, end = self.length, self.length + len(data)
+        self._reserve(len(data))
+        self.buffer[start:end] = cipher.process(data)
+        self._advance(start, end)
+
+    def _advance(self, start: int, end: int) -> None:
+        self.length = end
+        if not self._counted:
+            return
+
+        self._tabs += self.buffer.count(b"\t", start, end)
+        if self._expected is None and self._tabs:
+            head = bytes(self.buffer[:self.buffer.find(b"\t")]).strip()
+            if head.isdigit():
+                self._expected = int(head)
+            else:
+                # 不是列表格式（例如FAIL），按普通命令处理
+                self._counted = False
+
+    def state(self, filled: bool) -> str:
+        """判断响应是否接收完整
+
+        Args:
+            filled: 最近一次读取是否用满了请求的长度
+        """
+        if self._counted and self._expected is not None:
+            # 条目之间以及末尾都有制表符，制表符数量超过条目数即表示结束
+            if self._tabs > self._expected:
+                return RESPONSE_DONE
+            if self._tabs < self._expected:
+                return RESPONSE_MORE
+            return RESPONSE_IDLE
+        if filled or self._idle_framed:
+            return RESPONSE_IDLE
+        return RESPONSE_DONE
+
+    def getvalue(self) -> bytes:
+        """返回已接收的完整响应"""
+        return memoryview(self.buffer)[:self.length].tobytes()
+
+
+def _decode_response(response: bytes) -> str:
+    """依次尝试多种编码解码服务器响应"""
+    for encoding in ['utf-8', 'gbk', 'latin1']:
+        try:
+            return response.decode(encoding).strip()
+        except UnicodeDecodeError:
+            continue
+
+    # 如果所有编码都失败，使用latin1
+    return response.decode('latin1').strip()
+
+
 class HLLConnection:
     """HLL服务器socket连接类，包含XOR加密"""
 
+    # 加解密器类型，可替换为其他实现相同接口的类
+    cipher_class = XorCipher
+
     def __init__(self, host: str, port: int, password: str):
         self.host = host
         self.port = port
         self.password = password
         self.xorkey = None
+        self.cipher: Optional[XorCipher] = None
+        self.response_reader = ResponseReader()
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.sock.settimeout(None)  # 移除超时设置，让连接永久保持
         self.last_activity = time.time()
@@ -59,6 +239,7 @@ class HLLConnection:
                 
                 # 接收XOR密钥
                 self.xorkey = self.sock.recv(MSGLEN)
+                self.cipher = self.cipher_class(self.xorkey)
                 logger.debug(f"接收到密钥，长度: {len(self.xorkey)}")
                 
                 # 设置保活选项
@@ -101,6 +282,7 @@ class HLLConnection:
             self._is_connected = False
             self.sock = None
             self.xorkey = None
+            self.cipher = None
 
     def send(self, msg) -> int:
         """发送加密消息"""
@@ -112,28 +294,51 @@ class HLLConnection:
 
     def _xor(self, msg) -> bytes:
         """XOR加密/解密"""
-        if not self.xorkey:
+        if not self.cipher:
             raise RuntimeError("游戏服务器没有返回密钥")
-        
-        n = []
-        for i in range(len(msg)):
-            n.append(msg[i] ^ self.xorkey[i % len(self.xorkey)])
+        return self.cipher.apply(msg)
 
-        return array.array("B", n).tobytes()
+    def receive(self, msglen=MSGLEN, command: Optional[str] = None) -> bytes:
+        """接收和解密消息
 
-    def receive(self, msglen=MSGLEN) -> bytes:
-        """接收和解密消息"""
-        buff = self.sock.recv(msglen)
-        msg = self._xor(buff)
+        Args:
+            msglen: 单次读取的最大长度
+            command: 对应的命令，用于判断响应何时接收完整
+        """
+        if not self.cipher:
+            raise RuntimeError("游戏服务器没有返回密钥")
+        self.cipher.reset()
+        reader = self.response_reader
+        reader.start(command)
 
-        while len(buff) >= msglen:
-            try:
-                buff = self.sock.recv(msglen)
-            except socket.timeout:
-                break
-            msg += self._xor(buff)
+        timeout = TIMEOUT_SEC
+        try:
+            while True:
+                self.sock.settimeout(timeout)
+                view = reader.free_space(msglen)
+                requested = len(view)
+                try:
+                    nbytes = self.sock.recv_into(view)
+                except socket.timeout:
+                    break
+                finally:
+                    view.release()
+
+                if not nbytes:
+                    if reader.length:
+                        break
+                    raise ConnectionError("socket连接中断")
 
-        return msg
+                reader.commit(nbytes, self.cipher)
+                state = reader.state(filled=nbytes == requested)
+                if state == RESPONSE_DONE:
+                    break
+                timeout = RESPONSE_IDLE_SEC if state == RESPONSE_IDLE else RESPONSE_MORE_TIMEOUT_SEC
+        finally:
+            if self.sock:
+                self.sock.settimeout(TIMEOUT_SEC)
+
+        return reader.getvalue()
 
     def send_command(self, command: str) -> str:
         """发送命令并等待响应，带自动重连"""
@@ -150,22 +355,10 @@ class HLLConnection:
                     self.send(command.encode())
                     
                     # 接收响应
-                    response = self.receive()
+                    response = self.receive(command=command)
                     
                     # 解码响应
-                    decoded_response = None
-                    for encoding in ['utf-8', 'gbk', 'latin1']:
-                        try:
-                            decoded_response = response.decode(encoding).strip()
-                            break
-                        except UnicodeDecodeError:
-                            continue
-                    
-                    # 如果所有编码都失败，使用latin1
-                    if decoded_response is None:
-                        decoded_response = response.decode('latin1').strip()
-                    
-                    return decoded_response
+                    return _decode_response(response)
                     
                 except Exception as e:
                     # 第一次失败时尝试重新连接
@@ -299,20 +492,282 @@ class HLLConnectionPool:
             self.active_connections = 0
             logger.info("已关闭所有连接")
 
-# 为了保持与异步代码的兼容性，添加异步接口
-async def async_send_command(connection_pool, command):
-    """异步接口函数，实际在同步上下文中执行"""
-    conn = None
-    try:
-        conn = connection_pool.get_connection()
+
+class AsyncHLLConnection:
+    """HLL服务器异步连接类，基于asyncio流实现，收发数据时不阻塞事件循环"""
+
+    # 加解密器类型，可替换为其他实现相同接口的类
+    cipher_class = XorCipher
+
+    def __init__(self, host: str, port: int, password: str):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.xorkey = None
+        self.cipher: Optional[XorCipher] = None
+        self.response_reader = ResponseReader()
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.last_activity = time.time()
+        self.lock = asyncio.Lock()
+        self._is_connected = False
+        self.id = f"async-{uuid.uuid4()}"
+
+    async def connect(self) -> bool:
+        """建立连接并发送密码"""
+        async with self.lock:
+            return await self._connect()
+
+    async def _connect(self) -> bool:
+        # 如果已连接，直接返回
+        if self._is_connected and self.writer:
+            return True
+
+        # 确保关闭任何现有连接
+        await self._close_connection()
+
+        try:
+            logger.info(f"正在连接到服务器 {self.host}:{self.port}")
+            self.reader, self.writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), CONNECT_TIMEOUT_SEC
+            )
+
+            # 设置保活选项
+            sock = self.writer.get_extra_info("socket")
+            if sock is not None:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+            # 接收XOR密钥
+            self.xorkey = await asyncio.wait_for(self.reader.read(MSGLEN), CONNECT_TIMEOUT_SEC)
+            if not self.xorkey:
+                raise ConnectionError("游戏服务器没有返回密钥")
+            self.cipher = self.cipher_class(self.xorkey)
+            logger.debug(f"接收到密钥，长度: {len(self.xorkey)}")
+
+            self._is_connected = True
+            self.last_activity = time.time()
+
+            # 发送密码
+            logger.info("正在发送认证信息...")
+            await self.send(f"login {self.password}".encode())
+            result = await asyncio.wait_for(self.receive(), CONNECT_TIMEOUT_SEC)
+
+            if result != b"SUCCESS":
+                await self._close_connection()
+                logger.error(f"认证失败: {result}")
+                raise HLLAuthError("认证失败")
+
+            logger.info("认证完成")
+            return True
+
+        except Exception as e:
+            logger.error(f"连接失败: {e}")
+            await self._close_connection()
+            return False
+
+    async def _close_connection(self) -> None:
+        """关闭连接并清理资源"""
+        try:
+            if self.writer:
+                self.writer.close()
+                try:
+                    await self.writer.wait_closed()
+                except (OSError, ConnectionError):
+                    logger.debug("无法发送socket关闭指令")
+        except Exception as e:
+            logger.error(f"关闭连接出错: {e}")
+        finally:
+            self._is_connected = False
+            self.reader = None
+            self.writer = None
+            self.xorkey = None
+            self.cipher = None
+
+    async def send(self, msg) -> int:
+        """发送加密消息"""
+        self.writer.write(self._xor(msg))
+        await self.writer.drain()
+        return len(msg)
+
+    def _xor(self, msg) -> bytes:
+        """XOR加密/解密"""
+        if not self.cipher:
+            raise RuntimeError("游戏服务器没有返回密钥")
+        return self.cipher.apply(msg)
+
+    async def receive(self, msglen=MSGLEN, command: Optional[str] = None) -> bytes:
+        """接收和解密消息
+
+        Args:
+            msglen: 单次读取的最大长度
+            command: 对应的命令，用于判断响应何时接收完整
+        """
+        if not self.cipher:
+            raise RuntimeError("游戏服务器没有返回密钥")
+        self.cipher.reset()
+        reader = self.response_reader
+        reader.start(command)
+
+        buff = await self.reader.read(msglen)
+        while True:
+            if not buff:
+                if reader.length:
+                    break
+                raise ConnectionError("socket连接中断")
+
+            reader.write(buff, self.cipher)
+            state = reader.state(filled=len(buff) == msglen)
+            if state == RESPONSE_DONE:
+                break
+
+            timeout = RESPONSE_IDLE_SEC if state == RESPONSE_IDLE else RESPONSE_MORE_TIMEOUT_SEC
+            try:
+                buff = await asyncio.wait_for(self.reader.read(msglen), timeout)
+            except asyncio.TimeoutError:
+                break
+
+        return reader.getvalue()
+
+    async def send_command(self, command: str) -> str:
+        """发送命令并等待响应，带自动重连"""
+        async with self.lock:
+            for attempt in range(2):
+                # 检查连接状态，尝试重连
+                if not self._is_connected or not self.writer:
+                    if not await self._connect():
+                        raise ConnectionError("无法建立连接")
+
+                try:
+                    self.last_activity = time.time()
+                    await self.send(command.encode())
+                    response = await asyncio.wait_for(self.receive(command=command), COMMAND_TIMEOUT_SEC)
+                    return _decode_response(response)
+
+                except Exception as e:
+                    # 第一次失败时尝试重新连接
+                    if attempt == 0:
+                        logger.warning(f"发送命令失败，准备重连: {e!r}")
+                        await self._close_connection()
+                        await asyncio.sleep(1)  # 短暂等待后重试
+                    else:
+                        logger.error(f"发送命令最终失败: {e!r}")
+                        raise ConnectionError(f"发送命令失败: {e!r}")
+
+            raise ConnectionError("发送命令失败")
+
+    async def close(self):
+        """关闭连接"""
+        async with self.lock:
+            await self._close_connection()
+            logger.info("连接已关闭")
+
+
+class AsyncHLLConnectionPool:
+    """HLL异步连接池
+
+    连接数达到上限时协程会等待其他命令归还连接，而不是直接失败，
+    因此多个命令可以同时在不同的连接上执行
+    """
+
+    def __init__(self, host: str, port: int, password: str, max_connections: int = MAX_CONNECTIONS,
+                 acquire_timeout: float = ACQUIRE_TIMEOUT_SEC):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.max_connections = max_connections
+        self.acquire_timeout = acquire_timeout
+        self.connections: Deque[AsyncHLLConnection] = deque()
+        self.active_connections = 0
+        self._semaphore = asyncio.Semaphore(max_connections)
+
+    async def get_connection(self) -> Optional[AsyncHLLConnection]:
+        """获取一个可用的连接，连接全部占用时等待归还"""
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.acquire_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"已达到最大连接数 {self.max_connections}，等待空闲连接超时")
+            return None
+
+        try:
+            # 优先复用最近归还的连接，丢弃失效或空闲过久的连接
+            while self.connections:
+                conn = self.connections.pop()
+                if conn._is_connected and time.time() - conn.last_activity <= IDLE_THRESHOLD_SEC:
+                    return conn
+                await conn.close()
+                self.active_connections -= 1
+
+            conn = AsyncHLLConnection(self.host, self.port, self.password)
+            if await conn.connect():
+                self.active_connections += 1
+                return conn
+        except Exception as e:
+            logger.error(f"获取连接出错: {e}")
+
+        self._semaphore.release()
+        return None
+
+    def release_connection(self, conn: AsyncHLLConnection):
+        """释放连接回连接池"""
+        if not conn:
+            return
+        if conn._is_connected:
+            # 刷新最后活动时间
+            conn.last_activity = time.time()
+            self.connections.append(conn)
+        else:
+            # 无效连接不放回池中
+            self.active_connections -= 1
+        self._semaphore.release()
+
+    async def send_command(self, command: str) -> str:
+        """从池中取出连接执行一条命令"""
+        conn = await self.get_connection()
         if not conn:
             raise ConnectionError("无法获取连接")
-        
-        return conn.send_command(command)
-    finally:
-        if conn:
-            connection_pool.release_connection(conn)
+        try:
+            return await conn.send_command(command)
+        finally:
+            self.release_connection(conn)
+
+    async def close_all(self):
+        """关闭所有空闲连接"""
+        while self.connections:
+            conn = self.connections.pop()
+            await conn.close()
+        self.active_connections = 0
+        logger.info("已关闭所有连接")
+
+
+# 进程内共享的连接池，按服务器地址区分，保证同一服务器只有一个连接上限
+_shared_pools: Dict[Tuple[str, int, str], AsyncHLLConnectionPool] = {}
+
+
+def get_connection_pool(host: str, port: int, password: str) -> AsyncHLLConnectionPool:
+    """获取进程内共享的异步连接池，不存在时创建
+
+    Args:
+        host: 服务器地址
+        port: RCON端口
+        password: RCON密码
+
+    Returns:
+        该服务器对应的连接池
+    """
+    key = (host, int(port), password)
+    pool = _shared_pools.get(key)
+    if pool is None:
+        pool = AsyncHLLConnectionPool(host, int(port), password)
+        _shared_pools[key] = pool
+        logger.info(f"创建共享连接池 {host}:{port}，最大连接数 {pool.max_connections}")
+    return pool
+
+
+# 异步代码使用的命令接口
+async def async_send_command(connection_pool, command):
+    """从异步连接池取出连接并发送命令，不阻塞事件循环"""
+    return await connection_pool.send_command(command)
 
 async def async_close_all(connection_pool):
     """异步关闭所有连接的接口函数"""
-    connection_pool.close_all()
+    await connection_pool.close_all()
@@ -3,10 +3,44 @@ import base64
 import logging
 import sqlite3
 import hashlib
-from typing import Dict, Optional, Tuple
+import threading
+import time
+from typing import Dict, Optional, Set, Tuple
 
 logger = logging.getLogger(__name__)
 
+# 进程级缓存：按盐值缓存派生出的密钥，按数据库路径缓存解密后的凭证
+_cache_lock = threading.Lock()
+_key_cache: Dict[bytes, bytes] = {}
+_credentials_cache: Dict[str, Dict[str, str]] = {}
+_initialized_databases: Set[str] = set()
+_cache_stats = {
+    "derivations": 0,  # 实际执行PBKDF2的次数
+    "derive_seconds": 0.0,  # PBKDF2累计耗时
+    "key_hits": 0,  # 密钥缓存命中次数
+    "credential_hits": 0,  # 凭证缓存命中次数
+}
+
+
+def invalidate_credentials_cache() -> None:
+    """清空凭证和密钥缓存，凭证被重置或修改后调用"""
+    with _cache_lock:
+        _key_cache.clear()
+        _credentials_cache.clear()
+    logger.debug("凭证缓存已清空")
+
+
+def credentials_cache_report() -> str:
+    """生成凭证缓存的耗时报告，用于启动日志"""
+    with _cache_lock:
+        derivations = _cache_stats["derivations"]
+        derive_seconds = _cache_stats["derive_seconds"]
+        hits = _cache_stats["key_hits"] + _cache_stats["credential_hits"]
+
+    average = derive_seconds / derivations if derivations else 0.0
+    return (f"凭证缓存: 密钥派生 {derivations} 次，耗时 {derive_seconds:.3f}s；"
+            f"缓存命中 {hits} 次，节省约 {average * hits:.3f}s")
+
 
 class CredentialsManager:
     """用于安全存储和检索服务器连接凭证的管理器"""
@@ -19,7 +53,10 @@ class CredentialsManager:
         """
         self.db_path = os.path.join(os.path.dirname(__file__), db_path)
         self._setup_logging()
-        self._setup_database()
+        # 同一进程内每个数据库只需建表一次
+        if self.db_path not in _initialized_databases:
+            self._setup_database()
+            _initialized_databases.add(self.db_path)
         self._encryption_key = None
     
     def _setup_logging(self):
@@ -68,14 +105,27 @@ class CredentialsManager:
         """
         if salt is None:
             salt = os.urandom(16)
+        else:
+            # 已派生过的盐值直接使用缓存的密钥
+            with _cache_lock:
+                key = _key_cache.get(salt)
+                if key is not None:
+                    _cache_stats["key_hits"] += 1
+                    return key, salt
         
         # 使用简单的机器标识作为密码
         # 在生产环境中，应该使用更强的密码策略
         password = (os.name + os.environ.get('USER', os.environ.get('USERNAME', 'user'))).encode()
         
         # 使用hashlib代替cryptography
+        start = time.perf_counter()
         key = hashlib.pbkdf2_hmac('sha256', password, salt, 100000, 32)
         key = base64.urlsafe_b64encode(key)
+
+        with _cache_lock:
+            _key_cache[salt] = key
+            _cache_stats["derivations"] += 1
+            _cache_stats["derive_seconds"] += time.perf_counter() - start
         
         return key, salt
     
@@ -137,6 +187,9 @@ class CredentialsManager:
             操作是否成功
         """
         try:
+            # 旧凭证的缓存即将失效
+            invalidate_credentials_cache()
+
             # 加密密码
             encrypted_password, salt = self._encrypt(password)
             
@@ -171,6 +224,12 @@ class CredentialsManager:
         Returns:
             包含host, port, password的字典，如果没有找到则返回None
         """
+        with _cache_lock:
+            cached = _credentials_cache.get(self.db_path)
+            if cached is not None:
+                _cache_stats["credential_hits"] += 1
+                return dict(cached)
+
         try:
             conn, cursor = self._get_connection()
             
@@ -193,11 +252,14 @@ class CredentialsManager:
             # 解密密码
             password = self._decrypt(encrypted_password, salt)
             
-            return {
+            credentials = {
                 "host": host,
                 "port": port,
                 "password": password
             }
+            with _cache_lock:
+                _credentials_cache[self.db_path] = credentials
+            return dict(credentials)
         except Exception as e:
             logger.error(f"获取凭证失败: {e}")
             return None
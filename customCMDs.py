@@ -7,16 +7,25 @@ from typing import Dict, Any, List
 
 import Log
 from MapList import MapList
-from commands import Commands
-from connection import HLLConnectionPool
+from command_registry import ARGS_RAW, ARGS_SPLIT, CommandCall, CommandRegistry
+from commands import Commands, parse_map_rotation
+from connection import async_close_all, get_connection_pool
 from dataStorage import DataStorage
+from dedup import BoundedSet
+from storage_profile import DEFAULT_STORAGE_PROFILE
+from player_stats import PlayerStatsAggregator
+from roster import RosterCache, is_tank_role, parse_player_info
+from vip_scheduler import VipExpiryScheduler
 from credentials_manager import CredentialsManager
-from hooks import on_kill, on_tk, on_chat
+from hooks import on_kill, on_tk, on_chat, on_connected, on_disconnected, on_teamswitch
 
 # 设置日志
 logger = Log.log()
 
-processed_ids = set()
+# 已处理的聊天日志，同一秒内可能有多条聊天，用时间戳和原始内容一起去重
+CHAT_DEDUP_SIZE = 2000
+CHAT_DEDUP_TTL_SEC = 600
+processed_ids = BoundedSet(CHAT_DEDUP_SIZE, ttl=CHAT_DEDUP_TTL_SEC)
 
 pattern = r'[a-zA-Z0-9]'
 
@@ -34,6 +43,10 @@ kill_command = ["kill"]
 kick_command = ["kick"]
 map_commands = ["map", "切图"]
 
+# QQ命令和游戏内聊天命令的注册表，命令由下方的 @qq_registry.command / @game_registry.command 注册
+qq_registry = CommandRegistry("QQ", lambda text: parse_quoted_args(text))
+game_registry = CommandRegistry("游戏内", lambda text: parse_quoted_args(text))
+
 # 初始化管理员列表
 admin_list = []
 
@@ -55,24 +68,31 @@ def read_config_value(filename, key, default_value=None):
             logger.warning(f"配置文件 {filename} 不存在，使用默认值")
             return default_value
             
-        with open(config_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip()
-                # 跳过注释和空行
-                if not line or line.startswith('#'):
-                    continue
-                    
-                # 解析键值对
-                if '=' in line:
-                    k, v = line.split('=', 1)
-                    if k.strip() == key:
-                        return v.strip()
+        # 配置文件可能以UTF-8或GBK（Windows记事本默认）保存
+        with open(config_path, 'rb') as f:
+            raw = f.read()
+        try:
+            content = raw.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            content = raw.decode('gbk')
+
+        for line in content.splitlines():
+            line = line.strip()
+            # 跳过注释和空行
+            if not line or line.startswith('#'):
+                continue
+
+            # 解析键值对
+            if '=' in line:
+                k, v = line.split('=', 1)
+                if k.strip() == key:
+                    return v.strip()
         
         # 如果没找到键，返回默认值
-        logger.warning(f"在配置文件 {filename} 中未找到键 {key}，使用默认值")
+        logger.warning(f"在配置文件 {filename} 中未找到键 {key}，使用默认值 {default_value}")
         return default_value
     except Exception as e:
-        logger.error(f"读取配置文件 {filename} 时出错: {e}")
+        logger.error(f"读取配置文件 {filename} 时出错: {e}，{key} 使用默认值 {default_value}")
         return default_value
 
 # 读取QQ群号，如果读取失败则使用默认值
@@ -87,6 +107,9 @@ class Context:
         conn: RCON连接实例
         commands: 命令执行器实例
         data: 数据存储实例
+        player_stats: 玩家统计写后缓存
+        roster: 在线玩家名单缓存
+        vip_scheduler: VIP过期调度器
     """
 
     def __init__(self):
@@ -98,16 +121,19 @@ class Context:
             logger.error("未找到服务器凭证，请先运行 reset_credentials.py 设置凭证")
             raise ValueError("未找到服务器凭证")
             
-        # 创建连接池 - 使用从凭证管理器获取的信息
-        self.connection_pool = HLLConnectionPool(
-            credentials["host"], 
-            int(credentials["port"]),  # 确保端口是整数类型
+        # 使用进程内共享的连接池 - 使用从凭证管理器获取的信息
+        self.connection_pool = get_connection_pool(
+            credentials["host"],
+            credentials["port"],
             credentials["password"]
         )
-        self.commands = Commands()
         self.map = MapList()
-        self.data = DataStorage("data.db")
+        self.data = DataStorage("data.db", read_config_value('config.txt', 'storage_profile', DEFAULT_STORAGE_PROFILE))
         self.data.first_run()
+        self.commands = Commands(self.connection_pool, self.data)
+        self.player_stats = PlayerStatsAggregator(self.data)
+        self.roster = RosterCache(self.commands)
+        self.vip_scheduler = VipExpiryScheduler(self.commands, self.data)
 
     async def initialize(self):
         """异步初始化方法，加载管理员列表"""
@@ -121,7 +147,9 @@ class Context:
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         """清理资源"""
         try:
-            self.connection_pool.close_all()
+            await self.player_stats.close()
+            await self.data.async_close()
+            await async_close_all(self.connection_pool)
         except Exception as e:
             logger.error(f"清理资源时出错: {e}")
 
@@ -130,6 +158,10 @@ class Context:
 ctx = Context()
 
 
+# 命令列表文档
+COMMAND_DOC_URL = "https://docs.qq.com/doc/DYW1jUktWU2VVb3JK"
+
+
 async def qq_Commands(message: list[str], admin=False) -> str | None | list[str] | Any:
     """
     处理QQ命令
@@ -146,497 +178,332 @@ async def qq_Commands(message: list[str], admin=False) -> str | None | list[str]
             return "消息格式错误"
 
         command, args = message
-        command = command.lower()
         if not command:
             return ""
 
-        if command == "帮助" or command == "help":
-            return "命令列表：https://docs.qq.com/doc/DYW1jUktWU2VVb3JK"
-        if command == qq_commands.get("status"):
-            counts = await _get_player_count()
-            server = await ctx.commands.get_server_name()
-            current_map = await ctx.commands.get_map()
-            current_map = ctx.map.parse_map_name(current_map)
-            next_map = await get_next_map()
-
-            return (f"{server}\n"
-                    f"{counts}\t{current_map}\n"
-                    f"下一局: {next_map}")
-
-        if command == "图池":
-            print(1)
-            maps = await ctx.commands.get_map_rotation()
-            return "\n".join(ctx.map.parse_map_list(maps))
+        spec = qq_registry.get(command)
+        if spec is None:
+            return f"未知命令。命令列表：{COMMAND_DOC_URL}" if admin else ""
+        if spec.admin and not admin:
+            return ""
 
-        if command == "v":
-            return await get_vip_info(args.split(" ")[0])
+        call = qq_registry.prepare(spec, command, args)
+        if call is None:
+            return spec.usage
+        return await qq_registry.invoke(spec, call)
 
-        if not admin:
-            return ""
-        if command == "+admin":
-            # 使用parse_quoted_args处理参数，支持引号
-            if not args:
-                return "参数有误，格式：+admin <QQ号> [备注]"
+    except Exception as e:
+        logger.error(f"处理QQ命令出错: {e}", exc_info=True)
+        return f"处理命令时出错: {str(e)}"
 
-            parsed_args = parse_quoted_args(args)
-            if not parsed_args:
-                return "参数有误，格式：+admin <QQ号> [备注]"
 
-            qq_id = parsed_args[0]
-            notes = " ".join(parsed_args[1:]) if len(parsed_args) > 1 else ""
+async def _check_in_game(player_name: str) -> str | None:
+    """玩家在游戏中时返回None，否则返回提示信息"""
+    res = await _is_player_inGame(player_name)
+    if res is None:
+        return "无法找到玩家"
+    return res or None
 
-            if ctx.data.add_qq_admin(qq_id, added_by=str(message[0]), notes=notes):
-                return f"已添加QQ管理员: {qq_id}"
-            else:
-                return f"添加QQ管理员失败: {qq_id}"
 
-        if command == "-admin":
-            # 使用parse_quoted_args处理参数，支持引号
-            if not args:
-                return "参数有误，格式：-admin <QQ号>"
+@qq_registry.command("帮助", "help", admin=False)
+async def _qq_help(call: CommandCall):
+    return f"命令列表：{COMMAND_DOC_URL}"
 
-            parsed_args = parse_quoted_args(args)
-            if not parsed_args:
-                return "参数有误，格式：-admin <QQ号>"
 
-            qq_id = parsed_args[0]
+@qq_registry.command(qq_commands["status"], admin=False)
+async def _qq_status(call: CommandCall):
+    # 一次并发取回所有状态信息，get_next_map 复用同一批结果
+    results = await ctx.commands.batch(["get slots", "get name", "get map", "rotlist"])
+    counts = results["get slots"].split("/")[0] if results["get slots"] else "0"
+    server = results["get name"]
+    current_map = ctx.map.parse_map_name(results["get map"])
+    next_map = await get_next_map(results["get map"], parse_map_rotation(results["rotlist"]))
 
-            if ctx.data.remove_qq_admin(qq_id):
-                return f"已移除QQ管理员: {qq_id}"
-            else:
-                return f"移除QQ管理员失败: {qq_id}"
+    return (f"{server}\n"
+            f"{counts}\t{current_map}\n"
+            f"下一局: {next_map}")
 
-        if command == "addadmin" or command == "aa":
-            if not args:
-                return "参数有误，格式：addadmin <id> <角色> [玩家名]，玩家名包含空格时需要用引号"
 
-            parsed_args = parse_quoted_args(args)
-            if len(parsed_args) < 2:
-                return "参数有误，格式：addadmin <id> <角色> [玩家名]，玩家名包含空格时需要用引号"
+@qq_registry.command("图池", admin=False)
+async def _qq_map_rotation(call: CommandCall):
+    maps = await ctx.commands.get_map_rotation()
+    return "\n".join(ctx.map.parse_map_list(maps))
 
-            # 处理玩家名
-            player_name = parsed_args[0]
 
-            if ctx.commands.add_admin(parsed_args, parsed_args[1], " ".join(parsed_args[2:])):
-                return f"已添加游戏管理员: {player_name}"
-            else:
-                return f"添加游戏管理员失败: {player_name}"
+@qq_registry.command("v", admin=False, min_args=1, parse=ARGS_SPLIT, usage="参数有误，格式：v <玩家ID>")
+async def _qq_vip_info(call: CommandCall):
+    return await get_vip_info(call.args[0])
 
-        if command == "removeadmin" or command == "ra":
-            if not args:
-                return "参数有误，格式：removeadmin <id>，玩家名包含空格时需要用引号"
-            parsed_args = parse_quoted_args(args)
 
-            if ctx.commands.remove_admin(parsed_args[0]):
-                return f"已移除游戏管理员: {parsed_args[0]}"
-            else:
-                return f"移除游戏管理员失败: {parsed_args[0]}"
+@qq_registry.command("+admin", min_args=1, usage="参数有误，格式：+admin <QQ号> [备注]")
+async def _qq_add_qq_admin(call: CommandCall):
+    qq_id = call.args[0]
+    notes = " ".join(call.args[1:])
 
-        if command == "al":
-            admin_list = ctx.data.get_all_qq_admins()
-            if admin_list:
-                return f"当前QQ管理员列表: {', '.join(admin_list)}"
-            else:
-                return "当前无QQ管理员"
+    if await ctx.data.async_add_qq_admin(qq_id, added_by=call.command, notes=notes):
+        return f"已添加QQ管理员: {qq_id}"
+    else:
+        return f"添加QQ管理员失败: {qq_id}"
 
-        if command == "ops":
-            if len(args) == 0:
-                return "请输入要发送的信息"
-            await ops(args[0])
-            return f"向全体玩家发送信息: {args[0]}"
 
-        if command == "+v":
-            if len(args) == 0:
-                return "请输入要添加的玩家ID"
+@qq_registry.command("-admin", min_args=1, usage="参数有误，格式：-admin <QQ号>")
+async def _qq_remove_qq_admin(call: CommandCall):
+    qq_id = call.args[0]
 
-            parsed_args = args.split(" ")
+    if await ctx.data.async_remove_qq_admin(qq_id):
+        return f"已移除QQ管理员: {qq_id}"
+    else:
+        return f"移除QQ管理员失败: {qq_id}"
 
-            return await handle_vip_command(parsed_args[0], parsed_args[1], parsed_args[2] if len(parsed_args) == 3 else None)
 
-        if command == "-v":
-            if len(args) == 0:
-                return "请输入要删除的玩家ID"
+@qq_registry.command("addadmin", qq_commands["add-admin"], min_args=2,
+                     usage="参数有误，格式：addadmin <id> <角色> [玩家名]，玩家名包含空格时需要用引号")
+async def _qq_add_game_admin(call: CommandCall):
+    player_id, role = call.args[0], call.args[1]
 
-            parsed_args = args.split(" ")
+    if await ctx.commands.add_admin(player_id, role, " ".join(call.args[2:])):
+        return f"已添加游戏管理员: {player_id}"
+    else:
+        return f"添加游戏管理员失败: {player_id}"
 
-            return await handle_vip_command(parsed_args[0], "", None, "remove")
 
-        if command == "切图" or command == "map":
-            if not args:
-                return "参数有误，格式：切图|map <地图名> <天气|时间> <模式>\n部分地图无天气/时间选择"
+@qq_registry.command("removeadmin", qq_commands["remove-admin"], min_args=1,
+                     usage="参数有误，格式：removeadmin <id>，玩家名包含空格时需要用引号")
+async def _qq_remove_game_admin(call: CommandCall):
+    if await ctx.commands.remove_admin(call.args[0]):
+        return f"已移除游戏管理员: {call.args[0]}"
+    else:
+        return f"移除游戏管理员失败: {call.args[0]}"
 
-            parsed_args = args.split(" ", 1)
-            if len(parsed_args) < 2:
-                return "参数有误，格式：切图|map <地图名> [天气|时间] <模式>\n部分地图无天气/时间选择"
 
-            return await change_map(f"{parsed_args}")
+@qq_registry.command("al")
+async def _qq_admin_list(call: CommandCall):
+    admins = await ctx.data.async_get_all_qq_admins()
+    if admins:
+        return f"当前QQ管理员列表: {', '.join(admins)}"
+    else:
+        return "当前无QQ管理员"
 
-        if command == qq_commands.get("ban"):
-            # 使用parse_quoted_args处理参数，支持引号
-            if not args:
-                return "参数有误，格式：封禁 <玩家名> <原因> [时间]，玩家名包含空格时需要用引号"
 
-            parsed_args = parse_quoted_args(args)
-            if len(parsed_args) < 2:
-                return "参数有误，格式：封禁 <玩家名> <原因> [时间]，玩家名包含空格时需要用引号"
-            
-            # 处理玩家名
-            target = parsed_args[0]
-            reason = parsed_args[1]
-            duration = parsed_args[2] if len(parsed_args) > 2 else None
-            
-            # 检查玩家是否在游戏中
-            res = await _is_player_inGame(target)
-            if res is None:
-                return "无法找到玩家"
-            elif res != "":
-                return res
-
-            if duration:
-                try:
-                    duration = int(duration)
-                    return await ctx.commands.temp_ban(target, reason=reason, duration_hours=duration, use_id=False)
-                except ValueError:
-                    return f"时间参数错误，必须是数字: {duration}"
-            else:
-                return await ctx.commands.perma_ban(target, reason=reason, use_id=False)
+@qq_registry.command("ops", min_args=1, parse=ARGS_RAW, usage="请输入要发送的信息")
+async def _qq_ops(call: CommandCall):
+    await ops(call.args[0])
+    return f"向全体玩家发送信息: {call.args[0]}"
 
-        elif command == qq_commands.get("banid"):
-            # 使用parse_quoted_args处理参数，支持引号
-            if not args:
-                return "参数有误，格式：ID封禁 <玩家ID> <原因> [时间]"
 
-            parsed_args = parse_quoted_args(args)
-            if len(parsed_args) < 2:
-                return "参数有误，格式：ID封禁 <玩家ID> <原因> [时间]"
-            
-            # 处理玩家ID
-            target_id = parsed_args[0]
-            reason = parsed_args[1]
-            duration = parsed_args[2] if len(parsed_args) > 2 else None
-
-            if duration:
-                try:
-                    duration = int(duration)
-                    return await ctx.commands.temp_ban(target_id, reason=reason, duration_hours=duration, use_id=True)
-                except ValueError:
-                    return f"时间参数错误，必须是数字: {duration}"
-            else:
-                return await ctx.commands.perma_ban(target_id, reason=reason, use_id=True)
+@qq_registry.command("+v", min_args=2, parse=ARGS_SPLIT, usage="参数有误，格式：+v <玩家ID> <描述> [天数]")
+async def _qq_add_vip(call: CommandCall):
+    return await handle_vip_command(call.args[0], call.args[1], call.args[2] if len(call.args) == 3 else None)
 
-        elif command == qq_commands.get("kick"):
-            # 使用parse_quoted_args处理参数，支持引号
-            if not args:
-                return "参数有误，格式：踢出 <玩家名> <原因>，玩家名包含空格时需要用引号"
 
-            parsed_args = parse_quoted_args(args)
-            if len(parsed_args) < 2:
-                return "参数有误，格式：踢出 <玩家名> <原因>，玩家名包含空格时需要用引号"
+@qq_registry.command("-v", min_args=1, parse=ARGS_SPLIT, usage="请输入要删除的玩家ID")
+async def _qq_remove_vip(call: CommandCall):
+    return await handle_vip_command(call.args[0], "", None, "remove")
 
-            # 处理玩家名
-            player_name = parsed_args[0]
 
-            res = await _is_player_inGame(player_name)
-            if res is None:
-                return "无法找到玩家"
-            elif res != "":
-                return res
+@qq_registry.command("切图", "map", min_args=2, parse=ARGS_SPLIT,
+                     usage="参数有误，格式：切图|map <地图名> [天气|时间] <模式>\n部分地图无天气/时间选择")
+async def _qq_change_map(call: CommandCall):
+    return await change_map(call.raw)
 
-            reason = parsed_args[1]
 
-            return await ctx.commands.kick(player_name, reason)
+@qq_registry.command(qq_commands["ban"], min_args=2,
+                     usage="参数有误，格式：封禁 <玩家名> <原因> [时间]，玩家名包含空格时需要用引号")
+async def _qq_ban(call: CommandCall):
+    target, reason = call.args[0], call.args[1]
+    duration = call.args[2] if len(call.args) > 2 else None
 
-        elif command == qq_commands.get("switch"):
-            # 使用parse_quoted_args处理参数，支持引号
-            if not args:
-                return "参数有误，格式：换边 <玩家名>，玩家名包含空格时需要用引号"
+    # 检查玩家是否在游戏中
+    error = await _check_in_game(target)
+    if error:
+        return error
 
-            parsed_args = parse_quoted_args(args)
-            if not parsed_args:
-                return "参数有误，格式：换边 <玩家名>，玩家名包含空格时需要用引号"
+    if duration:
+        try:
+            duration = int(duration)
+        except ValueError:
+            return f"时间参数错误，必须是数字: {duration}"
+        return await ctx.commands.temp_ban(target, reason=reason, duration_hours=duration, use_id=False)
+    return await ctx.commands.perma_ban(target, reason=reason, use_id=False)
 
-            # 处理玩家名
-            player_name = parsed_args[0]
 
-            res = await _is_player_inGame(player_name)
-            if res is None:
-                return "无法找到玩家"
-            elif res != "":
-                return res
+@qq_registry.command(qq_commands["banid"], min_args=2, usage="参数有误，格式：ID封禁 <玩家ID> <原因> [时间]")
+async def _qq_ban_id(call: CommandCall):
+    target_id, reason = call.args[0], call.args[1]
+    duration = call.args[2] if len(call.args) > 2 else None
 
-            return await ctx.commands.switch_player_now(player_name)
+    if duration:
+        try:
+            duration = int(duration)
+        except ValueError:
+            return f"时间参数错误，必须是数字: {duration}"
+        return await ctx.commands.temp_ban(target_id, reason=reason, duration_hours=duration, use_id=True)
+    return await ctx.commands.perma_ban(target_id, reason=reason, use_id=True)
 
-        elif command == qq_commands.get("msg"):
-            # 使用parse_quoted_args处理参数，支持引号
-            if not args:
-                return "参数有误，格式：msg <玩家名> <消息内容>，玩家名包含空格时需要用引号"
 
-            parsed_args = parse_quoted_args(args)
-            if len(parsed_args) < 2:
-                return "参数有误，格式：msg <玩家名> <消息内容>，玩家名包含空格时需要用引号"
+@qq_registry.command(qq_commands["kick"], min_args=2,
+                     usage="参数有误，格式：踢出 <玩家名> <原因>，玩家名包含空格时需要用引号")
+async def _qq_kick(call: CommandCall):
+    player_name, reason = call.args[0], call.args[1]
 
-            # 处理玩家名
-            player_name = parsed_args[0]
+    error = await _check_in_game(player_name)
+    if error:
+        return error
 
-            res = await _is_player_inGame(player_name)
-            if res is None:
-                return "无法找到玩家"
-            elif res != "":
-                return res
+    return await ctx.commands.kick(player_name, reason)
 
-            message = " ".join(parsed_args[1:])
 
-            await ctx.commands.message_player(player_name, message)
-            return f"已向 {player_name} 发送消息：{message}"
+@qq_registry.command(qq_commands["switch"], min_args=1, usage="参数有误，格式：换边 <玩家名>，玩家名包含空格时需要用引号")
+async def _qq_switch(call: CommandCall):
+    player_name = call.args[0]
 
-        elif command == qq_commands.get("unban"):
-            # 使用parse_quoted_args处理参数，支持引号
-            if not args:
-                return "参数有误，格式：解封 <玩家名>，玩家名包含空格时需要用引号"
+    error = await _check_in_game(player_name)
+    if error:
+        return error
 
-            parsed_args = parse_quoted_args(args)
-            if not parsed_args:
-                return "参数有误，格式：解封 <玩家名>，玩家名包含空格时需要用引号"
+    return await ctx.commands.switch_player_now(player_name)
 
-            # 处理玩家名
-            player_name = parsed_args[0]
 
-            res = await ctx.commands.remove_temp_ban(player_name)
-            res1 = await ctx.commands.remove_perma_ban(player_name)
-            return str(res) if res else str(res1)
+@qq_registry.command(qq_commands["msg"], min_args=2,
+                     usage="参数有误，格式：msg <玩家名> <消息内容>，玩家名包含空格时需要用引号")
+async def _qq_message_player(call: CommandCall):
+    player_name = call.args[0]
 
-        elif command == qq_commands.get("search"):
-            # 使用parse_quoted_args处理参数，支持引号
-            if not args:
-                return "参数有误，格式：查询 <玩家名/ID>，玩家名包含空格时需要用引号"
+    error = await _check_in_game(player_name)
+    if error:
+        return error
 
-            parsed_args = parse_quoted_args(args)
-            if not parsed_args:
-                return "参数有误，格式：查询 <玩家名/ID>，玩家名包含空格时需要用引号"
+    message = " ".join(call.args[1:])
+    await ctx.commands.message_player(player_name, message)
+    return f"已向 {player_name} 发送消息：{message}"
 
-            # 处理搜索项
-            search_term = parsed_args[0]
-            logger.info(f"开始查询玩家: {search_term}")
-            
-            # 记录是否找到玩家
-            found_player = False
-            result_message = ""
 
-            # 先尝试获取当前在线玩家的信息
-            try:
-                logger.info(f"尝试获取当前在线玩家信息: {search_term}")
-                current_info = await ctx.commands.get_player_info(search_term)
-                
-                if current_info and current_info != "FAIL":
-                    player_current_info = parse_player_info(current_info)
-                    if player_current_info and player_current_info.get('name'):
-                        logger.info(f"找到当前在线玩家: {player_current_info.get('name')}")
-                        found_player = True
-                        result_message += f"当前在线玩家：{player_current_info.get('name')}\n"
-                        result_message += f"SteamID: {player_current_info.get('steam_id', '未知')}\n"
-                        result_message += f"队伍: {player_current_info.get('team', '未知')}\n"
-                        result_message += f"角色: {player_current_info.get('role', '未知')}\n"
-                        result_message += f"小队: {player_current_info.get('unit', '未知')}\n"
-                        result_message += f"等级: {player_current_info.get('level', '未知')}\n"
-                        
-                        kills = player_current_info.get('kills', 0)
-                        deaths = player_current_info.get('deaths', 0)
-                        result_message += f"击杀: {kills} - 死亡: {deaths}\n\n"
-                else:
-                    logger.info(f"当前在线玩家查询无结果: {search_term}")
-            except Exception as e:
-                logger.error(f"获取当前玩家信息失败: {e}", exc_info=True)
+@qq_registry.command(qq_commands["unban"], min_args=1, usage="参数有误，格式：解封 <玩家名>，玩家名包含空格时需要用引号")
+async def _qq_unban(call: CommandCall):
+    player_name = call.args[0]
 
-            # 查询数据库中的玩家信息
-            try:
-                logger.info(f"尝试从数据库查询玩家名称: {search_term}")
-                player_info = ctx.data.get_player_with_name(search_term)
-                
-                if not player_info:
-                    # 尝试通过ID查询
-                    logger.info(f"通过名称未找到玩家，尝试通过ID查询: {search_term}")
-                    player_info = ctx.data.get_player_with_id(search_term)
-                    
-                    # 如果仍然找不到，尝试使用模糊搜索
-                    if not player_info:
-                        logger.info(f"尝试模糊搜索名称包含: {search_term}")
-                        # 尝试模糊搜索数据库中名称中包含搜索词的玩家
-                        conn, cursor = ctx.data.get_connection()
-                        cursor.execute("""
-                            SELECT 
-                                id AS ID,
-                                name AS 名称,
-                                level AS 等级,
-                                total_kill AS 总击杀,
-                                infantry_kill AS 步兵击杀,
-                                panzer_kill AS 车组击杀,
-                                artillery_kill AS 炮兵击杀,
-                                team_kill AS TK,
-                                total_death AS 总死亡,
-                                apMine_kill AS 反步兵雷击杀,
-                                atMine_kill AS 反坦克雷击杀,
-                                satchel_kill AS 炸药包击杀,
-                                knife_kill AS 刀杀
-                            FROM players
-                            WHERE name LIKE ?
-                            LIMIT 1
-                        """, (f"%{search_term}%",))
-                        
-                        row = cursor.fetchone()
-                        if row:
-                            player_info = dict(row)
-                            logger.info(f"模糊搜索找到玩家: {player_info.get('名称')}")
-            
-                if player_info:
-                    found_player = True
-                    result_message += "数据库玩家记录：\n"
-                    result_message += f"玩家: {player_info.get('名称', '未知')} | ID: {player_info.get('ID', '未知')}\n"
-                    result_message += f"步兵击杀: {player_info.get('步兵击杀', 0)} | 车组击杀: {player_info.get('车组击杀', 0)} | 炮兵击杀: {player_info.get('炮兵击杀', 0)}\n"
-                    result_message += f"AP雷击杀: {player_info.get('反步兵雷击杀', 0)} | AT雷击杀: {player_info.get('反坦克雷击杀', 0)} | 炸药包击杀: {player_info.get('炸药包击杀', 0)} | 刀杀: {player_info.get('刀杀', 0)}\n"
-                    result_message += f"TK: {player_info.get('TK', 0)} | 总击杀: {player_info.get('总击杀', 0)} | 死亡: {player_info.get('总死亡', 0)}"
-            except Exception as e:
-                logger.error(f"查询数据库玩家信息失败: {e}", exc_info=True)
-
-            # 如果都没有找到玩家
-            if not found_player:
-                # 尝试找到相似名称的玩家
-                try:
-                    logger.info(f"尝试查找相似名称的在线玩家: {search_term}")
-                    possible_players = await _fuzzy_search(search_term)
-                    if possible_players and len(possible_players) > 0:
-                        result_message = f"未找到精确匹配的玩家: {search_term}\n可能的在线玩家有:\n"
-                        for idx, player_name in possible_players.items():
-                            result_message += f"{idx}: {player_name}\n"
-                        return result_message
-                except Exception as e:
-                    logger.error(f"查找相似名称的玩家失败: {e}", exc_info=True)
-                    
-                return f"未找到玩家: {search_term}"
-
-            return result_message
-        elif command == "vl" or command == "viplist":
-            logger.info("执行查看VIP列表命令(QQ)")
-            try:
-                vip_list = await get_vip_list()
-                if not vip_list:
-                    return "数据库中没有VIP记录"
-                    
-                result = ["VIP列表："]
-                for idx, vip in enumerate(vip_list, 1):
-                    result.append(f"{idx}. ID: {vip['id']} \n   描述: {vip['description']} \n   到期: {vip['expire']}")
-                
-                return result
-            except Exception as e:
-                logger.error(f"处理VIP列表命令失败: {e}")
-                return f"获取VIP列表失败: {str(e)}"
-        elif command == "pl" or command == "playerlist":
-            logger.info("执行查看玩家列表命令(QQ)")
-            try:
-                player_list = await get_player_list()
-                if not player_list:
-                    return "当前没有在线玩家"
-                    
-                result = [f"当前在线玩家({len(player_list)})："]
-                for idx, player in enumerate(player_list, 1):
-                    result.append(f"{idx}. {player['name']} \n   ID: {player['id']}")
-                
-                return result
-            except Exception as e:
-                logger.error(f"处理玩家列表命令失败: {e}")
-                return f"获取玩家列表失败: {str(e)}"
+    res = await ctx.commands.remove_temp_ban(player_name)
+    res1 = await ctx.commands.remove_perma_ban(player_name)
+    return str(res) if res else str(res1)
+
+
+@qq_registry.command(qq_commands["search"], min_args=1, usage="参数有误，格式：查询 <玩家名/ID>，玩家名包含空格时需要用引号")
+async def _qq_search(call: CommandCall):
+    # 处理搜索项
+    search_term = call.args[0]
+    logger.info(f"开始查询玩家: {search_term}")
 
-        return "未知命令。命令列表：https://docs.qq.com/doc/DYW1jUktWU2VVb3JK"
+    # 记录是否找到玩家
+    found_player = False
+    result_message = ""
 
+    # 先尝试获取当前在线玩家的信息
+    try:
+        logger.info(f"尝试获取当前在线玩家信息: {search_term}")
+        current_info = await ctx.commands.get_player_info(search_term)
+
+        if current_info and current_info != "FAIL":
+            player_current_info = parse_player_info(current_info)
+            if player_current_info and player_current_info.get('name'):
+                logger.info(f"找到当前在线玩家: {player_current_info.get('name')}")
+                found_player = True
+                result_message += f"当前在线玩家：{player_current_info.get('name')}\n"
+                result_message += f"SteamID: {player_current_info.get('steam_id', '未知')}\n"
+                result_message += f"队伍: {player_current_info.get('team', '未知')}\n"
+                result_message += f"角色: {player_current_info.get('role', '未知')}\n"
+                result_message += f"小队: {player_current_info.get('unit', '未知')}\n"
+                result_message += f"等级: {player_current_info.get('level', '未知')}\n"
+
+                kills = player_current_info.get('kills', 0)
+                deaths = player_current_info.get('deaths', 0)
+                result_message += f"击杀: {kills} - 死亡: {deaths}\n\n"
+        else:
+            logger.info(f"当前在线玩家查询无结果: {search_term}")
     except Exception as e:
-        logger.error(f"处理QQ命令出错: {e}", exc_info=True)
-        return f"处理命令时出错: {str(e)}"
+        logger.error(f"获取当前玩家信息失败: {e}", exc_info=True)
 
+    # 查询数据库中的玩家信息
+    try:
+        logger.info(f"尝试从数据库查询玩家名称: {search_term}")
+        player_info = await ctx.data.async_get_player_with_name(search_term)
+
+        if not player_info:
+            # 尝试通过ID查询
+            logger.info(f"通过名称未找到玩家，尝试通过ID查询: {search_term}")
+            player_info = await ctx.data.async_get_player_with_id(search_term)
+
+            # 如果仍然找不到，尝试使用模糊搜索
+            if not player_info:
+                logger.info(f"尝试模糊搜索名称包含: {search_term}")
+                # 尝试模糊搜索数据库中名称中包含搜索词的玩家
+                matches = await ctx.data.async_search_players_by_name(search_term, limit=1)
+                if matches:
+                    player_info = matches[0]
+                    logger.info(f"模糊搜索找到玩家: {player_info.get('名称')}")
+
+        if player_info:
+            found_player = True
+            result_message += "数据库玩家记录：\n"
+            result_message += f"玩家: {player_info.get('名称', '未知')} | ID: {player_info.get('ID', '未知')}\n"
+            result_message += f"步兵击杀: {player_info.get('步兵击杀', 0)} | 车组击杀: {player_info.get('车组击杀', 0)} | 炮兵击杀: {player_info.get('炮兵击杀', 0)}\n"
+            result_message += f"AP雷击杀: {player_info.get('反步兵雷击杀', 0)} | AT雷击杀: {player_info.get('反坦克雷击杀', 0)} | 炸药包击杀: {player_info.get('炸药包击杀', 0)} | 刀杀: {player_info.get('刀杀', 0)}\n"
+            result_message += f"TK: {player_info.get('TK', 0)} | 总击杀: {player_info.get('总击杀', 0)} | 死亡: {player_info.get('总死亡', 0)}"
+    except Exception as e:
+        logger.error(f"查询数据库玩家信息失败: {e}", exc_info=True)
 
-def parse_player_info(info_str: str) -> Dict[str, Any]:
-    """
-    解析玩家信息字符串为字典
+    # 如果都没有找到玩家
+    if not found_player:
+        # 尝试找到相似名称的玩家
+        try:
+            logger.info(f"尝试查找相似名称的在线玩家: {search_term}")
+            possible_players = await _fuzzy_search(search_term)
+            if possible_players and len(possible_players) > 0:
+                result_message = f"未找到精确匹配的玩家: {search_term}\n可能的在线玩家有:\n"
+                for idx, player_name in possible_players.items():
+                    result_message += f"{idx}: {player_name}\n"
+                return result_message
+        except Exception as e:
+            logger.error(f"查找相似名称的玩家失败: {e}", exc_info=True)
 
-    Args:
-        info_str: 玩家信息字符串
+        return f"未找到玩家: {search_term}"
 
-    Returns:
-        包含玩家信息的字典
-    """
-    if not info_str or not isinstance(info_str, str):
-        return {}
+    return result_message
 
-    info_dict = {}
-    lines = info_str.strip().split('\n')
 
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
+@qq_registry.command("vl", "viplist")
+async def _qq_vip_list(call: CommandCall):
+    logger.info("执行查看VIP列表命令(QQ)")
+    try:
+        vip_list = await get_vip_list()
+        if not vip_list:
+            return "数据库中没有VIP记录"
 
-        # 分割键值对
-        if ':' in line:
-            try:
-                key, value = line.split(':', 1)
-                key = key.strip()
-                value = value.strip()
-
-                # 处理特殊键
-                if key == 'Name':
-                    info_dict['name'] = value
-                elif key == 'steamID64':
-                    info_dict['steam_id'] = value
-                elif key == 'Team':
-                    info_dict['team'] = value
-                elif key == 'Role':
-                    info_dict['role'] = value
-                elif key == 'Unit':
-                    info_dict['unit'] = value
-                elif key == 'Loadout':
-                    info_dict['loadout'] = value
-                elif key == 'Kills':
-                    try:
-                        if ' - ' in value:
-                            kills, deaths = value.split(' - ')
-                            info_dict['kills'] = int(kills.replace('Deaths', '').strip())
-                            if 'Deaths:' in deaths:
-                                deaths = deaths.replace('Deaths:', '').strip()
-                            info_dict['deaths'] = int(deaths.strip())
-                        else:
-                            info_dict['kills'] = int(value.strip())
-                            info_dict['deaths'] = 0
-                    except (ValueError, IndexError) as e:
-                        logger.error(f"解析击杀数据出错: {e}, 原始值: {value}")
-                        info_dict['kills'] = 0
-                        info_dict['deaths'] = 0
-                elif key == 'Score':
-                    # 解析分数
-                    try:
-                        scores = {}
-                        score_items = value.split(',')
-                        for score in score_items:
-                            if ' ' in score.strip():
-                                score_type, score_value = score.strip().split(' ', 1)
-                                scores[score_type] = int(score_value)
-                        info_dict['scores'] = scores
-                    except Exception as e:
-                        logger.error(f"解析分数出错: {e}, 原始值: {value}")
-                        info_dict['scores'] = {}
-                elif key == 'Level':
-                    try:
-                        info_dict['level'] = int(value)
-                    except ValueError:
-                        logger.error(f"解析等级出错, 原始值: {value}")
-                        info_dict['level'] = 0
-            except Exception as e:
-                logger.error(f"解析玩家信息行出错: {e}, 行内容: {line}")
+        result = ["VIP列表："]
+        for idx, vip in enumerate(vip_list, 1):
+            result.append(f"{idx}. ID: {vip['id']} \n   描述: {vip['description']} \n   到期: {vip['expire']}")
+
+        return result
+    except Exception as e:
+        logger.error(f"处理VIP列表命令失败: {e}")
+        return f"获取VIP列表失败: {str(e)}"
 
-    # 记录解析结果
-    if info_dict:
-        logger.debug(f"解析到玩家信息: {info_dict}")
-    else:
-        logger.warning(f"未能解析出有效玩家信息，原始内容: {info_str[:100]}...")
 
-    return info_dict
+@qq_registry.command("pl", "playerlist")
+async def _qq_player_list(call: CommandCall):
+    logger.info("执行查看玩家列表命令(QQ)")
+    try:
+        player_list = await get_player_list()
+        if not player_list:
+            return "当前没有在线玩家"
+
+        result = [f"当前在线玩家({len(player_list)})："]
+        for idx, player in enumerate(player_list, 1):
+            result.append(f"{idx}. {player['name']} \n   ID: {player['id']}")
+
+        return result
+    except Exception as e:
+        logger.error(f"处理玩家列表命令失败: {e}")
+        return f"获取玩家列表失败: {str(e)}"
 
 
 async def _get_player_count() -> str:
@@ -764,58 +631,15 @@ async def _get_id(player_name: str) -> str:
             return ""
 
         logger.info(f"正在查找玩家 '{player_name}' 的ID")
-        result = await ctx.commands.get_playerids()
 
-        if not result:
-            logger.warning(f"获取玩家ID列表失败，结果为空")
-            return ""
-
-        # 更健壮的玩家ID解析
-        entries = []
-        if "\t" in result:
-            entries = [entry.strip() for entry in result.split("\t") if entry.strip()]
-        else:
-            entries = [result.strip()]
-
-        logger.debug(f"处理玩家ID列表，共 {len(entries)} 个条目")
-        logger.debug(f"玩家ID列表原始内容: {result[:200]}")  # 只记录前200个字符防止日志过长
-
-        # 精确匹配玩家名称
-        exact_matches = []
-        partial_matches = []
-
-        for entry in entries:
-            # 详细记录每个条目的处理
-            logger.debug(f"处理条目: {entry}")
-
-            # 尝试解析格式为 "玩家名称 : ID" 的条目
-            if " : " in entry:
-                name_part, id_part = entry.split(" : ", 1)
-                name_part = name_part.strip()
-                id_part = id_part.strip()
-
-                logger.debug(f"分割后: 名称='{name_part}', ID='{id_part}'")
-
-                if name_part.lower() == player_name.lower():  # 精确匹配
-                    logger.info(f"找到精确匹配: {name_part} -> {id_part}")
-                    return id_part
-                elif player_name.lower() in name_part.lower():  # 部分匹配
-                    logger.debug(f"找到部分匹配: {name_part} -> {id_part}")
-                    partial_matches.append((name_part, id_part))
-            # 尝试使用正则表达式匹配
-            elif player_name.lower() in entry.lower():
-                logger.debug(f"尝试正则匹配: {entry}")
-                match = re.search(pattern, entry)
-                if match:
-                    player_id = entry[match.start():]
-                    logger.debug(f"使用正则表达式找到可能的ID: {player_id}")
-                    partial_matches.append((entry, player_id))
-
-        # 如果有部分匹配，使用第一个
-        if partial_matches:
-            name, id_part = partial_matches[0]
-            logger.info(f"使用部分匹配 '{name}' 的ID: {id_part}")
-            return id_part
+        # 先查名称索引（精确、忽略大小写、部分匹配），未命中时同步一次在线名单再查
+        match = ctx.roster.directory.find(player_name)
+        if match is None and await ctx.roster.refresh_ids() is not None:
+            match = ctx.roster.directory.find(player_name)
+        if match is not None:
+            name, player_id = match
+            logger.info(f"找到玩家 '{name}' 的ID: {player_id}")
+            return player_id
 
         # 如果未找到匹配，尝试使用玩家信息获取
         try:
@@ -884,18 +708,8 @@ async def _update_player_stats(player_id: str, player_name: str, stats: Dict[str
         更新是否成功
     """
     try:
-        current_stats = ctx.data.get_player_with_id(player_id)
-        if not current_stats:
-            ctx.data.add_player(player_id=player_id, name=player_name)
-            return False
-
-        # 构建更新数据
-        update_data = {}
-        for stat_name, increment in stats.items():
-            current_value = current_stats.get(stat_name, 0)
-            update_data[stat_name] = current_value + increment
-
-        return ctx.data.update_player(player_id, **update_data)
+        # 在写线程中原地累加，不再先读后写
+        return await ctx.data.async_increment_player_stats({player_id: {'name': player_name, **stats}})
     except Exception as e:
         logger.error(f"更新玩家 {player_id} 统计数据失败: {e}")
         return False
@@ -925,93 +739,45 @@ async def handle_kill(commands: Commands, log_data: Dict[str, Any]) -> None:
         # 记录调试信息
         logger.info(f"处理击杀事件: {attacker_name}({attacker_id}) -> {victim_name}({victim_id}) 使用 {weapon}")
 
-        # 更新受害者死亡统计
-        try:
-            # 检查受害者是否存在，不存在则添加
-            victim_data = ctx.data.get_player_with_id(victim_id)
-            if not victim_data:
-                logger.info(f"添加新玩家(受害者): {victim_name}({victim_id})")
-                success = ctx.data.add_player(player_id=victim_id, name=victim_name)
-                if not success:
-                    logger.error(f"添加玩家失败: {victim_name}({victim_id})")
-                    victim_data = {"总死亡": 0}  # 默认值
-                else:
-                    # 重新获取玩家数据
-                    victim_data = ctx.data.get_player_with_id(victim_id) or {"总死亡": 0}
-            
-            # 更新死亡统计
-            current_deaths = victim_data.get("总死亡", 0)
-            logger.info(f"更新玩家死亡统计: {victim_name} 当前死亡数 {current_deaths} -> {current_deaths + 1}")
-            success = ctx.data.update_player(player_id=victim_id, total_death=current_deaths + 1)
-            if not success:
-                logger.error(f"更新玩家死亡统计失败: {victim_name}({victim_id})")
-        except Exception as e:
-            logger.error(f"更新受害者统计时出错: {e}")
+        # 统计增量先累积在内存中，由 ctx.player_stats 批量写入数据库
+        ctx.player_stats.record(victim_id, victim_name, total_death=1)
 
-        # 更新击杀者统计
-        try:
-            # 检查击杀者是否存在，不存在则添加
-            attacker_data = ctx.data.get_player_with_id(attacker_id)
-            if not attacker_data:
-                logger.info(f"添加新玩家(击杀者): {attacker_name}({attacker_id})")
-                success = ctx.data.add_player(player_id=attacker_id, name=attacker_name)
-                if not success:
-                    logger.error(f"添加玩家失败: {attacker_name}({attacker_id})")
-                    attacker_data = {
-                        "总击杀": 0, "步兵击杀": 0, "车组击杀": 0, "炮兵击杀": 0, 
-                        "反步兵雷击杀": 0, "反坦克雷击杀": 0, "炸药包击杀": 0, "刀杀": 0
-                    }  # 默认值
+        stats_to_update = {"total_kill": 1}
+
+        # 根据武器类型更新特定击杀统计
+        if "HOWITZER" in weapon.upper():
+            stats_to_update["artillery_kill"] = 1
+            logger.info(f"检测到炮兵击杀: {attacker_name} 使用 {weapon}")
+        else:
+            try:
+                # 先查名单缓存，名单中没有角色信息时才通过 playerinfo 查询
+                role = await ctx.roster.get_role(attacker_id, attacker_name)
+                if is_tank_role(role):
+                    stats_to_update["panzer_kill"] = 1
+                    logger.info(f"检测到车组击杀: {attacker_name} 角色 {role}")
                 else:
-                    # 重新获取玩家数据
-                    attacker_data = ctx.data.get_player_with_id(attacker_id) or {
-                        "总击杀": 0, "步兵击杀": 0, "车组击杀": 0, "炮兵击杀": 0, 
-                        "反步兵雷击杀": 0, "反坦克雷击杀": 0, "炸药包击杀": 0, "刀杀": 0
-                    }
-
-            # 准备更新数据
-            stats_to_update = {
-                "total_kill": attacker_data.get("总击杀", 0) + 1
-            }
-            
-            # 根据武器类型更新特定击杀统计
-            if "HOWITZER" in weapon.upper():
-                stats_to_update["artillery_kill"] = attacker_data.get("炮兵击杀", 0) + 1
-                logger.info(f"检测到炮兵击杀: {attacker_name} 使用 {weapon}")
-            else:
-                try:
-                    role = await commands.get_player_info(attacker_id)
-                    if role and ("tankcommander" in role.lower() or "crewman" in role.lower()):
-                        stats_to_update["panzer_kill"] = attacker_data.get("车组击杀", 0) + 1
-                        logger.info(f"检测到车组击杀: {attacker_name} 角色 {role}")
-                    else:
-                        stats_to_update["infantry_kill"] = attacker_data.get("步兵击杀", 0) + 1
-                        logger.info(f"检测到步兵击杀: {attacker_name} 角色 {role}")
-                except Exception as e:
-                    logger.error(f"获取玩家角色失败: {e}")
-                    stats_to_update["infantry_kill"] = attacker_data.get("步兵击杀", 0) + 1
-
-            # 特殊武器击杀统计
-            weapon_lower = weapon.lower()
-            if "satchel" in weapon_lower:
-                stats_to_update["satchel_kill"] = attacker_data.get("炸药包击杀", 0) + 1
-                logger.info(f"检测到炸药包击杀")
-            if "ap" in weapon_lower and "mine" in weapon_lower:
-                stats_to_update["apMine_kill"] = attacker_data.get("反步兵雷击杀", 0) + 1
-                logger.info(f"检测到反步兵雷击杀")
-            if "at" in weapon_lower and "mine" in weapon_lower:
-                stats_to_update["atMine_kill"] = attacker_data.get("反坦克雷击杀", 0) + 1
-                logger.info(f"检测到反坦克雷击杀")
-            if "knife" in weapon_lower:
-                stats_to_update["knife_kill"] = attacker_data.get("刀杀", 0) + 1
-                logger.info(f"检测到刀杀")
-
-            # 执行更新
-            logger.info(f"更新击杀者统计: {attacker_name}, 数据: {stats_to_update}")
-            success = ctx.data.update_player(player_id=attacker_id, **stats_to_update)
-            if not success:
-                logger.error(f"更新击杀者统计失败: {attacker_name}({attacker_id})")
-        except Exception as e:
-            logger.error(f"更新击杀者统计时出错: {e}")
+                    stats_to_update["infantry_kill"] = 1
+                    logger.info(f"检测到步兵击杀: {attacker_name} 角色 {role}")
+            except Exception as e:
+                logger.error(f"获取玩家角色失败: {e}")
+                stats_to_update["infantry_kill"] = 1
+
+        # 特殊武器击杀统计
+        weapon_lower = weapon.lower()
+        if "satchel" in weapon_lower:
+            stats_to_update["satchel_kill"] = 1
+            logger.info(f"检测到炸药包击杀")
+        if "ap" in weapon_lower and "mine" in weapon_lower:
+            stats_to_update["apMine_kill"] = 1
+            logger.info(f"检测到反步兵雷击杀")
+        if "at" in weapon_lower and "mine" in weapon_lower:
+            stats_to_update["atMine_kill"] = 1
+            logger.info(f"检测到反坦克雷击杀")
+        if "knife" in weapon_lower:
+            stats_to_update["knife_kill"] = 1
+            logger.info(f"检测到刀杀")
+
+        ctx.player_stats.record(attacker_id, attacker_name, **stats_to_update)
 
         logger.info(f"{attacker_name} 使用 {weapon} 击杀了 {victim_name} - 统计已更新")
 
@@ -1020,11 +786,12 @@ async def handle_kill(commands: Commands, log_data: Dict[str, Any]) -> None:
 
 
 @on_tk
-async def handle_team_kill(log_data: Dict[str, Any]) -> None:
+async def handle_team_kill(commands: Commands, log_data: Dict[str, Any]) -> None:
     """
     处理误杀事件
     
     Args:
+        commands: 命令执行器实例
         log_data: 日志数据
     """
     try:
@@ -1042,51 +809,9 @@ async def handle_team_kill(log_data: Dict[str, Any]) -> None:
         # 记录调试信息
         logger.info(f"处理误杀事件: {attacker_name}({attacker_id}) -> {victim_name}({victim_id}) 使用 {weapon}")
 
-        # 更新受害者死亡统计
-        try:
-            # 检查受害者是否存在，不存在则添加
-            victim_data = ctx.data.get_player_with_id(victim_id)
-            if not victim_data:
-                logger.info(f"添加新玩家(受害者): {victim_name}({victim_id})")
-                success = ctx.data.add_player(player_id=victim_id, name=victim_name)
-                if not success:
-                    logger.error(f"添加玩家失败: {victim_name}({victim_id})")
-                    victim_data = {"总死亡": 0}  # 默认值
-                else:
-                    # 重新获取玩家数据
-                    victim_data = ctx.data.get_player_with_id(victim_id) or {"总死亡": 0}
-            
-            # 更新死亡统计
-            current_deaths = victim_data.get("总死亡", 0)
-            logger.info(f"更新玩家死亡统计(误杀): {victim_name} 当前死亡数 {current_deaths} -> {current_deaths + 1}")
-            success = ctx.data.update_player(player_id=victim_id, total_death=current_deaths + 1)
-            if not success:
-                logger.error(f"更新玩家死亡统计失败: {victim_name}({victim_id})")
-        except Exception as e:
-            logger.error(f"更新受害者统计时出错: {e}")
-
-        # 更新击杀者统计
-        try:
-            # 检查击杀者是否存在，不存在则添加
-            attacker_data = ctx.data.get_player_with_id(attacker_id)
-            if not attacker_data:
-                logger.info(f"添加新玩家(误杀者): {attacker_name}({attacker_id})")
-                success = ctx.data.add_player(player_id=attacker_id, name=attacker_name)
-                if not success:
-                    logger.error(f"添加玩家失败: {attacker_name}({attacker_id})")
-                    attacker_data = {"TK": 0}  # 默认值
-                else:
-                    # 重新获取玩家数据
-                    attacker_data = ctx.data.get_player_with_id(attacker_id) or {"TK": 0}
-            
-            # 更新TK统计
-            current_tks = attacker_data.get("TK", 0)
-            logger.info(f"更新玩家TK统计: {attacker_name} 当前TK数 {current_tks} -> {current_tks + 1}")
-            success = ctx.data.update_player(player_id=attacker_id, team_kill=current_tks + 1)
-            if not success:
-                logger.error(f"更新玩家TK统计失败: {attacker_name}({attacker_id})")
-        except Exception as e:
-            logger.error(f"更新误杀者统计时出错: {e}")
+        # 统计增量先累积在内存中，由 ctx.player_stats 批量写入数据库
+        ctx.player_stats.record(victim_id, victim_name, total_death=1)
+        ctx.player_stats.record(attacker_id, attacker_name, team_kill=1)
 
         # 发送消息给误杀者
         try:
@@ -1103,6 +828,26 @@ async def handle_team_kill(log_data: Dict[str, Any]) -> None:
         logger.error(f"处理误杀事件失败: {e}", exc_info=True)
 
 
+@on_connected
+async def handle_roster_connected(commands: Commands, log_data: Dict[str, Any]) -> None:
+    """玩家进入服务器时加入名单缓存"""
+    fields = log_data["fields"]
+    ctx.roster.on_connected(fields["player_id"], fields["player"])
+
+
+@on_disconnected
+async def handle_roster_disconnected(commands: Commands, log_data: Dict[str, Any]) -> None:
+    """玩家离开服务器时移出名单缓存"""
+    ctx.roster.on_disconnected(log_data["fields"]["player_id"])
+
+
+@on_teamswitch
+async def handle_roster_teamswitch(commands: Commands, log_data: Dict[str, Any]) -> None:
+    """玩家换边时更新名单缓存中的阵营"""
+    fields = log_data["fields"]
+    ctx.roster.on_teamswitch(fields["player"], fields["new_team"])
+
+
 @on_chat
 async def handle_chat(commands: Commands, log_data: Dict[str, Any]) -> None:
     """
@@ -1123,9 +868,8 @@ async def handle_chat(commands: Commands, log_data: Dict[str, Any]) -> None:
         # 记录原始消息，便于调试
         # logger.info(f"收到聊天消息: {log_data}, {type(log_data)}")
 
-        if log_data["timestamp"] in processed_ids:
+        if not processed_ids.add((log_data["timestamp"], log_data.get("message"))):
             return
-        processed_ids.add(log_data["timestamp"])
 
         # 尝试从不同的方式解析聊天消息
         message_content = ""
@@ -1198,232 +942,175 @@ def parse_quoted_args(text):
 
 
 async def _commands_handler(message_content: str, player_name: str):
-    res = None
+    # 命令名之后的文本按各命令声明的方式解析一次
+    parts = message_content.strip().split(maxsplit=1)
+    if not parts:
+        return
+    command = parts[0].strip("\"'“”‘’")
+    raw = parts[1] if len(parts) > 1 else ""
 
-    # 首先检查是否有引号包围的参数，然后再按空格分割
-    args = parse_quoted_args(message_content)
-    command = args[0].lower() if args else ""
+    # 不是命令的聊天直接返回，不再查询玩家ID
+    spec = game_registry.get(command)
+    if spec is None:
+        return
 
-    current_admin_list = admin_list
+    logger.info(f"检查命令: {message_content}")
 
-    logger.info(f"检查命令: {message_content}, 解析参数: {args}")
+    if spec.admin:
+        # 获取玩家ID并记录日志
+        player_id = await _get_id(player_name)
+        logger.info(f"玩家 '{player_name}' 的ID: {player_id}")
 
-    if message_content.lower().strip() in suicide_commands:
-        logger.info(f"执行自杀命令: 玩家={player_name}, 命令={message_content}")
-        await suicide(player_name)
-        logger.info(f"自杀命令执行完成: 玩家={player_name}")
-        return
+        # 检查玩家是否为管理员
+        if not player_id or player_id not in admin_list:
+            logger.info(f"玩家 '{player_name}' (ID: {player_id}) 不是管理员")
+            return
 
-    elif command in report_command:
-        logger.info(f"尝试执行玩家 {player_name} 的举报请求")
-        # 使用解析后的参数处理举报命令
-        if len(args) >= 3:
-            cmd, suspect, reason = args[0], args[1], " ".join(args[2:])
-
-            await ctx.commands.message_player(player_name, f"你举报了 {suspect}，原因：{reason}"
-                                                           f"\n请等待管理员处理\n若长时间无回复可加群{qq_group}求助")
-            for admin in current_admin_list:
-                await ctx.commands.message_player(admin, f"玩家 {player_name} 举报了 {suspect}\n"
-                                                         f"原因：{reason}\n"
-                                                         f"请及时处理并回报")
-            logger.info(f"玩家 {player_name} 执行了举报命令")
-        else:
-            await ctx.commands.message_player(player_name,
-                                              f"举报格式错误，正确格式: report <玩家名> <原因> 或 "
-                                              f"report \"玩家名\" <原因>")
+        logger.info(f"玩家 '{player_name}' (ID: {player_id}) 是管理员，处理管理员命令: {command}")
+
+    call = game_registry.prepare(spec, command, raw, player_name)
+    if call is None:
+        if spec.usage:
+            await ctx.commands.message_player(player_name, spec.usage)
         return
 
-    # 获取玩家ID并记录日志
-    player_id = await _get_id(player_name)
-    logger.info(f"玩家 '{player_name}' 的ID: {player_id}")
+    try:
+        await game_registry.invoke(spec, call)
+    except Exception as e:
+        logger.error(f"处理命令 {command} 失败: {e}")
+        await ctx.commands.message_player(player_name, f"{command}命令执行失败: {str(e)}")
 
-    # 检查玩家是否为管理员
-    if not player_id or player_id not in current_admin_list:
-        logger.info(f"玩家 '{player_name}' (ID: {player_id}) 不是管理员")
-        return
 
-    logger.info(f"玩家 '{player_name}' (ID: {player_id}) 是管理员，处理管理员命令: {command}")
+async def _reply_if_not_in_game(player_name: str, target: str) -> bool:
+    """目标玩家不在游戏中时向命令发送者回复原因，返回是否已回复"""
+    error = await _check_in_game(target)
+    if error:
+        await ctx.commands.message_player(player_name, error)
+        return True
+    return False
 
-    if command in ops_commands:
-        if len(args) > 1:
-            message = " ".join(args[1:])
-            logger.info(f"执行OPS命令: {message}")
-            res = await ops(message)
-            logger.info(f"OPS命令执行完成")
-        else:
-            await ctx.commands.message_player(player_name, "OPS命令格式错误：ops <消息内容>")
-        return
 
-    elif command in ban_command:
-        if len(args) >= 3:
-            # 解析ban命令参数
-            target_player = args[1]
-            reason = args[2]
-            duration = args[3] if len(args) > 3 else None
-            
-            # 检查玩家是否在游戏中
-            res = await _is_player_inGame(target_player)
-            if res is None:
-                await ctx.commands.message_player(player_name, "无法找到玩家")
-                return
-            elif res != "":
-                await ctx.commands.message_player(player_name, res)
-                return
+@game_registry.command(*suicide_commands, admin=False)
+async def _game_suicide(call: CommandCall):
+    # 自杀命令只有命令本身，带参数的聊天不触发
+    if call.args:
+        return
+    player_name = call.caller
+    logger.info(f"执行自杀命令: 玩家={player_name}, 命令={call.command}")
+    await suicide(player_name)
+    logger.info(f"自杀命令执行完成: 玩家={player_name}")
+
+
+@game_registry.command(*report_command, admin=False, min_args=2,
+                       usage="举报格式错误，正确格式: report <玩家名> <原因> 或 report \"玩家名\" <原因>")
+async def _game_report(call: CommandCall):
+    player_name = call.caller
+    logger.info(f"尝试执行玩家 {player_name} 的举报请求")
+    suspect, reason = call.args[0], " ".join(call.args[1:])
+
+    await ctx.commands.message_player(player_name, f"你举报了 {suspect}，原因：{reason}"
+                                                   f"\n请等待管理员处理\n若长时间无回复可加群{qq_group}求助")
+    await ctx.commands.broadcast(admin_list, f"玩家 {player_name} 举报了 {suspect}\n"
+                                             f"原因：{reason}\n"
+                                             f"请及时处理并回报")
+    logger.info(f"玩家 {player_name} 执行了举报命令")
+
+
+@game_registry.command(*ops_commands, min_args=1, parse=ARGS_RAW, usage="OPS命令格式错误：ops <消息内容>")
+async def _game_ops(call: CommandCall):
+    message = call.args[0]
+    logger.info(f"执行OPS命令: {message}")
+    await ops(message)
+    logger.info(f"OPS命令执行完成")
+
+
+@game_registry.command(*ban_command, min_args=2, usage="命令格式错误: ban <玩家名> <原因> [时间]")
+async def _game_ban(call: CommandCall):
+    target_player, reason = call.args[0], call.args[1]
+    duration = call.args[2] if len(call.args) > 2 else None
+
+    # 检查玩家是否在游戏中
+    if await _reply_if_not_in_game(call.caller, target_player):
+        return
 
-            logger.info(f"执行封禁命令: 玩家={target_player}, 原因={reason}, 时长={duration}")
+    logger.info(f"执行封禁命令: 玩家={target_player}, 原因={reason}, 时长={duration}")
+    res = await ban(target_player, reason=reason, duration=duration, use_id=False)
+    await ctx.commands.message_player(call.caller, res)
 
-            try:
-                if duration:
-                    res = await ban(target_player, reason=reason, duration=duration, use_id=False)
-                else:
-                    res = await ban(target_player, reason=reason, use_id=False)
 
-                await ctx.commands.message_player(player_name, res)
-            except Exception as e:
-                logger.error(f"处理封禁命令失败: {e}")
-                await ctx.commands.message_player(player_name, f"封禁命令执行失败: {str(e)}")
-        else:
-            await ctx.commands.message_player(player_name,
-                                              f"命令格式错误: ban <玩家名> <原因> [时间]")
-        return
+@game_registry.command(*banid_command, min_args=2, usage="命令格式错误: banid <玩家ID> <原因> [时间]")
+async def _game_ban_id(call: CommandCall):
+    target_id, reason = call.args[0], call.args[1]
+    duration = call.args[2] if len(call.args) > 2 else None
 
-    elif command in banid_command:
-        if len(args) >= 3:
-            # 解析banid命令参数
-            target_id = args[1]
-            reason = args[2]
-            duration = args[3] if len(args) > 3 else None
+    logger.info(f"执行ID封禁命令: ID={target_id}, 原因={reason}, 时长={duration}")
+    res = await ban(target_id, reason=reason, duration=duration, use_id=True)
+    await ctx.commands.message_player(call.caller, res)
 
-            logger.info(f"执行ID封禁命令: ID={target_id}, 原因={reason}, 时长={duration}")
 
-            try:
-                if duration:
-                    res = await ban(target_id, reason=reason, duration=duration, use_id=True)
-                else:
-                    res = await ban(target_id, reason=reason, use_id=True)
+@game_registry.command(*kick_command, min_args=2, usage="命令格式错误: kick <玩家名> <原因>")
+async def _game_kick(call: CommandCall):
+    target_player, reason = call.args[0], " ".join(call.args[1:])
 
-                await ctx.commands.message_player(player_name, res)
-            except Exception as e:
-                logger.error(f"处理ID封禁命令失败: {e}")
-                await ctx.commands.message_player(player_name, f"ID封禁命令执行失败: {str(e)}")
-        else:
-            await ctx.commands.message_player(player_name,
-                                              f"命令格式错误: banid <玩家ID> <原因> [时间]")
+    if await _reply_if_not_in_game(call.caller, target_player):
         return
 
-    elif command in kick_command:
-        if len(args) >= 3:
-            # 解析kick命令参数
-            target_player = args[1]
+    logger.info(f"执行踢出命令: 玩家={target_player}, 原因={reason}")
+    await kick(target_player, reason)
+    await ctx.commands.message_player(call.caller, f"已踢出玩家 {target_player}，原因: {reason}")
 
-            res = await _is_player_inGame(target_player)
-            if res is None:
-                return "无法找到玩家"
-            elif res != "":
-                return res
 
-            reason = " ".join(args[2:])
+@game_registry.command(*kill_command, min_args=2, usage="命令格式错误: kill <玩家名> <原因>")
+async def _game_kill(call: CommandCall):
+    target_player, reason = call.args[0], " ".join(call.args[1:])
 
-            logger.info(f"执行踢出命令: 玩家={target_player}, 原因={reason}")
-
-            try:
-                res = await kick(target_player, reason)
-                await ctx.commands.message_player(player_name, f"已踢出玩家 {target_player}，原因: {reason}")
-            except Exception as e:
-                logger.error(f"处理踢出命令失败: {e}")
-                await ctx.commands.message_player(player_name, f"踢出命令执行失败: {str(e)}")
-        else:
-            await ctx.commands.message_player(player_name,
-                                              f"命令格式错误: kick <玩家名> <原因>")
+    if await _reply_if_not_in_game(call.caller, target_player):
         return
 
-    elif command in kill_command:
-        if len(args) >= 3:
-            # 解析kill命令参数
-            target_player = args[1]
+    logger.info(f"执行击杀命令: 玩家={target_player}, 原因={reason}")
+    await kill(target_player, reason)
+    await ctx.commands.message_player(call.caller, f"已击杀玩家 {target_player}，原因: {reason}")
 
-            res = await _is_player_inGame(target_player)
-            if res is None:
-                return "无法找到玩家"
-            elif res != "":
-                return res
 
-            reason = " ".join(args[2:])
+@game_registry.command(*switch_commands, min_args=1,
+                       usage="命令格式错误: 换边 <玩家名1>,<玩家名2>,... 或 换边 \"玩家名1\" \"玩家名2\"...")
+async def _game_switch(call: CommandCall):
+    logger.info(f"尝试执行玩家 {call.caller} 的换边请求")
+    # 支持两种方式指定玩家：1. 用逗号分隔（同时支持中英文逗号） 2. 用多个参数
+    first = call.args[0]
+    if "," in first or "，" in first:
+        players = first.replace("，", ",").split(",")
+    else:
+        players = call.args
 
-            logger.info(f"执行击杀命令: 玩家={target_player}, 原因={reason}")
+    for player in players:
+        player = player.strip()
+        if not player:
+            continue
 
-            try:
-                res = await kill(target_player, reason)
-                await ctx.commands.message_player(player_name, f"已击杀玩家 {target_player}，原因: {reason}")
-            except Exception as e:
-                logger.error(f"处理击杀命令失败: {e}")
-                await ctx.commands.message_player(player_name, f"击杀命令执行失败: {str(e)}")
-        else:
-            await ctx.commands.message_player(player_name,
-                                              f"命令格式错误: kill <玩家名> <原因>")
-        return
+        if await _reply_if_not_in_game(call.caller, player):
+            return
 
-    elif command in switch_commands:
-        logger.info(f"尝试执行玩家 {player_name} 的换边请求")
-        if len(args) > 1:
-            # 支持两种方式指定玩家：1. 用逗号分隔 2. 用多个参数
-            if "," in args[1] or "，" in args[1]:
-                # 逗号分隔的方式（同时支持中英文逗号）
-                players = []
-                # 分别处理英文逗号和中文逗号
-                if "," in args[1]:
-                    players.extend(args[1].split(','))
-                if "，" in args[1]:
-                    players.extend(args[1].split('，'))
-            else:
-                # 多个参数方式
-                players = args[1:]
+        res = await ctx.commands.switch_player_now(player)
+        await ctx.commands.message_player(call.caller, f"切换玩家 {player} 结果: {res}")
 
-            for player in players:
-                player = player.strip()
 
-                res = await _is_player_inGame(player)
-                if res is None:
-                    return "无法找到玩家"
-                elif res != "":
-                    return res
+@game_registry.command(*msg_command, min_args=2, usage="命令格式错误: msg <玩家名> <消息内容>")
+async def _game_message_player(call: CommandCall):
+    logger.info(f"尝试发送信息")
+    target_player, message = call.args[0], " ".join(call.args[1:])
 
-                res = await ctx.commands.switch_player_now(player)
-                await ctx.commands.message_player(player_name, f"切换玩家 {player} 结果: {res}")
-        else:
-            await ctx.commands.message_player(player_name,
-                                              f"命令格式错误: 换边 <玩家名1>,<玩家名2>,... 或 换边 \"玩家名1\" \"玩家名2\"...")
+    if await _reply_if_not_in_game(call.caller, target_player):
         return
 
-    elif command in msg_command:
-        logger.info(f"尝试发送信息")
-        if len(args) >= 3:
-            target_player = args[1]
+    await ctx.commands.message_player(target_player, message)
+    await ctx.commands.message_player(call.caller, f"已向 {target_player} 发送消息")
 
-            res = await _is_player_inGame(target_player)
-            if res is None:
-                return "无法找到玩家"
-            elif res != "":
-                return res
 
-            message = " ".join(args[2:])
-
-            await ctx.commands.message_player(target_player, message)
-            await ctx.commands.message_player(player_name, f"已向 {target_player} 发送消息")
-        else:
-            await ctx.commands.message_player(player_name,
-                                              f"命令格式错误: msg <玩家名> <消息内容>")
-        return
-
-    elif command in map_commands:
-        logger.info(f"尝试执行玩家 {player_name} 的切图请求")
-        try:
-            args = message_content.split(" ", 1)[1]
-            res = await change_map(args)
-        except Exception as e:
-            logger.error(f"处理切图命令失败: {e}")
-            await ctx.commands.message_player(player_name, f"切图命令执行失败: {str(e)}")
-            return
+@game_registry.command(*map_commands, min_args=1, parse=ARGS_RAW)
+async def _game_change_map(call: CommandCall):
+    logger.info(f"尝试执行玩家 {call.caller} 的切图请求")
+    await change_map(call.args[0])
 
 
 async def _is_player_inGame(player_name: str) -> str | None:
@@ -1439,8 +1126,13 @@ async def _is_player_inGame(player_name: str) -> str | None:
         如果查询失败，返回None
     """
     try:
-        # 先尝试精确匹配
-        if await ctx.commands.get_player_info(player_name) != "FAIL":
+        # 先在名称索引中精确匹配，未命中时同步一次在线名单，同步失败再回退到 playerinfo
+        if player_name in ctx.roster.directory:
+            return ""
+        if await ctx.roster.refresh_ids() is None:
+            if await ctx.commands.get_player_info(player_name) != "FAIL":
+                return ""
+        elif player_name in ctx.roster.directory:
             return ""
             
         # 如果精确匹配失败，尝试模糊搜索
@@ -1477,25 +1169,19 @@ async def _fuzzy_search(player_name: str) -> dict[int, Any] | None:
     index = 0  # 从0开始索引，与日志保持一致
     
     try:
-        # 获取所有在线玩家
-        players = await _get_players()
-        
+        # 在线玩家来自名称索引，索引为空时同步一次在线名单
+        directory = ctx.roster.directory
+        if not len(directory):
+            await ctx.roster.refresh_ids()
+        players = sorted(name for name, _ in directory.items())
+
         if not players:
             logger.warning("没有在线玩家或获取玩家列表失败")
             return None
-            
-        # 转换为小写进行不区分大小写的搜索
-        search_term = player_name.lower()
-        
-        # 记录原始玩家列表以便调试
-        logger.debug(f"在线玩家列表: {players}")
-        
-        # 查找包含搜索字符串的玩家
-        matching_players = []
-        for player in players:
-            if player and search_term in player.lower():
-                matching_players.append(player)
-        
+
+        # 通过n-gram索引查找包含搜索字符串的玩家（不区分大小写）
+        matching_players = [name for name, _ in directory.search(player_name)]
+
         # 如果找到匹配项，只返回匹配的玩家
         if matching_players:
             logger.info(f"找到 {len(matching_players)} 个匹配 '{player_name}' 的玩家")
@@ -1552,8 +1238,9 @@ async def ops(message: str = "test") -> None:
         # 添加消息前缀
         message = f"[管理通知]\n{formatted_message}"
 
-        for player in players:
-            await ctx.commands.message_player(player, message)
+        result = await ctx.commands.broadcast(players, message)
+        if result.failed:
+            logger.warning(f"OPS消息未送达 {len(result.failed)} 名玩家: {result.failed}")
     except Exception as e:
         logger.error(f"处理OPS事件失败: {e}")
     return res
@@ -1566,10 +1253,9 @@ async def report(player_name: str, suspect: str, reason: str, admins: list):
 
         await ctx.commands.message_player(player_name, f"[举报]\n你举报了 {suspect}，原因：{reason}，请等待管理处理")
 
-        for admin in admins:
-            await ctx.commands.message_player(admin, f"[举报]\n玩家 {player_name} 举报了 {suspect}"
-                                                     f"\n原因：{reason}\n"
-                                                     f"\n请及时处理并回报")
+        await ctx.commands.broadcast(admins, f"[举报]\n玩家 {player_name} 举报了 {suspect}"
+                                             f"\n原因：{reason}\n"
+                                             f"\n请及时处理并回报")
     except Exception as e:
         logger.error(f"处理举报事件失败: {e}")
     return res
@@ -1634,10 +1320,19 @@ async def change_map(map_name: str):
     return res
 
 
-async def get_next_map() -> str:
+async def get_next_map(current: str | None = None, maps: list[str] | None = None) -> str:
+    """
+    获取下一张地图的名称
+
+    Args:
+        current: 当前地图ID，为None时通过RCON查询
+        maps: 地图轮换列表，为None时通过RCON查询
+    """
     try:
-        current = await ctx.commands.get_map()
-        maps = await ctx.commands.get_map_rotation()
+        if current is None:
+            current = await ctx.commands.get_map()
+        if maps is None:
+            maps = await ctx.commands.get_map_rotation()
         
         # 添加详细的日志记录
         logger.debug(f"当前地图: {current}")
@@ -1723,6 +1418,10 @@ async def handle_vip_command(player_id: str, description: str, duration_days: in
                 await ctx.commands.remove_vip(player_id)
                 return f"添加VIP记录失败: 玩家ID {player_id}"
 
+            # 按数据库中实际写入的过期时间调度，永久VIP会从调度中移除
+            vip = await ctx.data.async_get_vip(player_id)
+            ctx.vip_scheduler.schedule(player_id, vip.get("expire_time") if vip else None)
+
             duration_text = "永久" if duration_days is None else f"{duration_days}天"
             return f"已成功添加VIP: 玩家ID {player_id}, 时长: {duration_text}, 描述: {description}"
 
@@ -1734,6 +1433,7 @@ async def handle_vip_command(player_id: str, description: str, duration_days: in
 
             # 删除数据库记录
             await ctx.data.async_remove_vip(player_id)
+            ctx.vip_scheduler.unschedule(player_id)
 
             return f"已成功移除VIP: 玩家ID {player_id}"
 
@@ -1748,7 +1448,7 @@ async def handle_vip_command(player_id: str, description: str, duration_days: in
 async def check_expired_vips():
     """
     检查并清理过期的VIP
-    此方法应该每天执行一次
+    启动时执行一次，之后由 ctx.vip_scheduler 按过期时间处理
     """
     try:
         # 获取过期的VIP列表
@@ -1772,18 +1472,10 @@ async def check_expired_vips():
 
 async def start_vip_check_task():
     """
-    启动VIP检查定时任务
-    每天执行一次
+    启动VIP过期调度任务
+    睡眠到下一个VIP的过期时间再清理，添加或删除VIP时由 handle_vip_command 更新调度
     """
-    while True:
-        try:
-            await check_expired_vips()
-            # 等待24小时
-            await asyncio.sleep(24 * 60 * 60)
-        except Exception as e:
-            logger.error(f"VIP检查任务执行失败: {e}")
-            # 发生错误时等待1小时后重试
-            await asyncio.sleep(3600)
+    await ctx.vip_scheduler.run()
 
 
 async def get_vip_info(player_id: str) -> str:
@@ -1795,21 +1487,14 @@ async def get_vip_info(player_id: str) -> str:
     """
     try:
         # 从数据库获取VIP信息
-        conn, cursor = await ctx.data.async_get_connection()
-        cursor.execute("""
-            SELECT player_id, description, added_time, expire_time, added_by
-            FROM vips
-            WHERE player_id = ?
-        """, (player_id,))
-
-        row = cursor.fetchone()
-        if not row:
-            if player_id in await ctx.commands.get_vip_ids():
+        vip_info = await ctx.data.async_get_vip(player_id)
+        if not vip_info:
+            game_vips = await ctx.commands.get_vip_ids()
+            if game_vips and any(vip['player_id'] == player_id for vip in game_vips):
                 return "玩家是VIP，过期时间未知"
             else:
                 return f"玩家 {player_id} 不是VIP"
 
-        vip_info = dict(row)
         current_time = int(time.time())
 
         # 添加额外信息
@@ -1833,10 +1518,10 @@ async def get_vip_info(player_id: str) -> str:
 
         # 检查游戏系统中的VIP状态
         game_vips = await ctx.commands.get_vip_ids()
-        is_game_vip = any(vip['player_id'] == player_id for vip in game_vips)
+        is_game_vip = game_vips is not None and any(vip['player_id'] == player_id for vip in game_vips)
 
-        # 如果数据库中有记录但游戏中没有，同步游戏状态
-        if not is_game_vip:
+        # 如果数据库中有记录但游戏中没有，同步游戏状态；游戏VIP列表查询失败时不做修改
+        if game_vips is not None and not is_game_vip:
             await ctx.commands.add_vip(player_id, vip_info['description'])
 
         if vip_info['is_permanent']:
@@ -1847,8 +1532,6 @@ async def get_vip_info(player_id: str) -> str:
     except Exception as e:
         logger.error(f"获取VIP信息失败: {e}")
         return "查找失败"
-    finally:
-        await ctx.data.async_close_connection()
 
 
 async def get_vip_list():
@@ -1860,12 +1543,7 @@ async def get_vip_list():
     """
     try:
         # 仅从数据库获取VIP信息（包含到期时间）
-        conn, cursor = await ctx.data.async_get_connection()
-        cursor.execute("""
-            SELECT player_id, description, expire_time
-            FROM vips
-        """)
-        db_vips = cursor.fetchall()
+        db_vips = await ctx.data.async_get_all_vips()
         logger.info(f"从数据库获取到 {len(db_vips)} 个VIP")
         
         # 如果没有VIP记录
@@ -1874,8 +1552,7 @@ async def get_vip_list():
         
         # 构建结果列表
         result = []
-        for vip in db_vips:
-            vip_info = dict(vip)
+        for vip_info in db_vips:
             player_id = vip_info.get('player_id', '未知')
             description = vip_info.get('description', '未知')
             
@@ -1903,8 +1580,6 @@ async def get_vip_list():
     except Exception as e:
         logger.error(f"获取VIP列表失败: {e}", exc_info=True)
         return []
-    finally:
-        await ctx.data.async_close_connection()
 
 
 async def get_player_list():
@@ -1915,36 +1590,13 @@ async def get_player_list():
         玩家信息列表
     """
     try:
-        # 获取当前在线玩家
-        players = await _get_players()
+        # get playerids 同时包含名称和ID，顺便同步名称索引
+        players = await ctx.roster.refresh_ids()
         if not players:
             return []
-        
-        # 获取玩家ID信息
-        player_ids_result = await ctx.commands.get_playerids()
-        logger.debug(f"原始玩家ID信息: {player_ids_result}")
-        
-        # 解析玩家ID信息
-        player_id_dict = {}
-        if player_ids_result and "\t" in player_ids_result:
-            # 跳过第一个元素(通常是数量)
-            id_entries = player_ids_result.split("\t")[1:]
-            for entry in id_entries:
-                if " : " in entry:
-                    name, player_id = entry.split(" : ", 1)
-                    name = name.strip()
-                    player_id = player_id.strip()
-                    player_id_dict[name] = player_id
-        
-        # 构建结果列表
-        result = []
-        for player_name in players:
-            player_id = player_id_dict.get(player_name, "未知")
-            result.append({
-                "name": player_name,
-                "id": player_id
-            })
-        
+
+        result = [{"name": name, "id": player_id} for name, player_id in players]
+
         return result
     
     except Exception as e:
@@ -6,11 +6,32 @@ import threading
 import time
 from typing import Optional, Dict, List, Tuple, Any
 
+from storage_engine import SQLiteEngine, SQLITE_TIMEOUT_SEC
+from migrations import DEFAULT_ADMIN_QQ, run_migrations
+from storage_profile import (DEFAULT_STORAGE_PROFILE, STATEMENT_CACHE_SIZE, apply_profile, check_profile,
+                             get_storage_profile)
+
+# 可以累加的玩家统计列
+PLAYER_STAT_COLUMNS = (
+    'total_kill', 'infantry_kill', 'panzer_kill', 'artillery_kill', 'team_kill',
+    'total_death', 'apMine_kill', 'atMine_kill', 'satchel_kill', 'knife_kill'
+)
+
+# 累加玩家统计的语句，固定文本以便复用连接上缓存的预编译语句
+_INCREMENT_STATS_SQL = f"""
+    INSERT INTO players (id, name, {', '.join(PLAYER_STAT_COLUMNS)})
+    VALUES (?, ?, {', '.join('?' for _ in PLAYER_STAT_COLUMNS)})
+    ON CONFLICT(id) DO UPDATE SET {', '.join(f"{column} = {column} + excluded.{column}" for column in PLAYER_STAT_COLUMNS)}
+"""
+
 
 class DataStorage:
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, profile: str = DEFAULT_STORAGE_PROFILE):
         self.db_path = os.path.join(os.path.dirname(__file__), db_path)
         self.local = threading.local()
+        self.profile = get_storage_profile(profile)
+        # 异步方法通过存储引擎执行：写操作在唯一的写线程中组提交，读操作使用只读连接池
+        self.engine = SQLiteEngine(self.db_path, profile=self.profile)
         self.logger = logging.getLogger(__name__)
         self._setup_logging()
 
@@ -24,14 +45,22 @@ class DataStorage:
             self.logger.setLevel(logging.INFO)
 
     def get_connection(self) -> Tuple[sqlite3.Connection, sqlite3.Cursor]:
-        """获取数据库连接，使用线程本地存储确保线程安全"""
+        """获取数据库连接，使用线程本地存储确保线程安全
+
+        在存储引擎的写线程或读线程中调用时返回该线程的引擎连接
+        """
+        conn = self.engine.current_connection()
+        if conn is not None:
+            return conn, conn.cursor()
         try:
             if not hasattr(self.local, 'conn'):
                 self.local.conn = sqlite3.connect(
                     self.db_path,
-                    timeout=30,
-                    check_same_thread=False
+                    timeout=SQLITE_TIMEOUT_SEC,
+                    check_same_thread=False,
+                    cached_statements=STATEMENT_CACHE_SIZE
                 )
+                apply_profile(self.local.conn, self.profile)
                 self.local.conn.row_factory = sqlite3.Row
                 self.local.cursor = self.local.conn.cursor()
             return self.local.conn, self.local.cursor
@@ -60,6 +89,18 @@ class DataStorage:
         loop = asyncio.get_running_loop()
         await loop.run_in_executor(None, self.close_connection)
 
+    def close(self):
+        """等待排队的写操作提交后关闭存储引擎和当前线程的连接"""
+        self.engine.close()
+        self.logger.info(self.engine.stats())
+        self.close_connection()
+
+    async def async_close(self):
+        """异步关闭存储引擎"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.engine.close)
+        self.logger.info(self.engine.stats())
+
     def first_run(self):
         """初始化数据库和表结构"""
         try:
@@ -68,164 +109,30 @@ class DataStorage:
                     file.close()
 
             conn, cursor = self.get_connection()
+            cursor.execute("PRAGMA journal_mode=WAL").fetchone()
 
-            # 创建玩家表
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS players (
-                    id TEXT UNIQUE PRIMARY KEY,
-                    name TEXT,
-                    level INTEGER DEFAULT 0, 
-                    total_playtime INTEGER DEFAULT 0,
-                    infantry_time INTEGER DEFAULT 0,
-                    panzer_time INTEGER DEFAULT 0,
-                    total_kill INTEGER DEFAULT 0,
-                    infantry_kill INTEGER DEFAULT 0,
-                    panzer_kill INTEGER DEFAULT 0,
-                    artillery_kill INTEGER DEFAULT 0,
-                    team_kill INTEGER DEFAULT 0,
-                    total_death INTEGER DEFAULT 0,
-                    apMine_kill INTEGER DEFAULT 0,
-                    atMine_kill INTEGER DEFAULT 0,
-                    satchel_kill INTEGER DEFAULT 0,
-                    knife_kill INTEGER DEFAULT 0
-                )
-            """)
-
-            # 创建管理员表
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS qq_admins (
-                    qq_id TEXT UNIQUE PRIMARY KEY,
-                    added_time INTEGER NOT NULL,
-                    added_by TEXT,
-                    notes TEXT
-                )
-            """)
-
-            # 创建VIP表
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS vips (
-                    player_id TEXT UNIQUE PRIMARY KEY,
-                    description TEXT,
-                    added_time INTEGER NOT NULL,
-                    expire_time INTEGER,
-                    added_by TEXT
-                )
-            """)
-
-            # 创建索引
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_player_id ON players(id)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_player_name ON players(name)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_vip_expire ON vips(expire_time)")
+            # 按版本号执行尚未应用的迁移，数据库已是最新版本时不做任何修改
+            run_migrations(conn)
 
-            # 检查表结构，添加缺失的列
-            self._check_and_add_missing_columns()
-
-            # 检查默认管理员
-            self._check_default_admin()
-
-            conn.commit()
+            self.check_storage_profile()
             self.logger.info("数据库初始化完成")
         except sqlite3.Error as e:
             self.logger.error(f"数据库初始化失败: {e}")
             raise
 
+    def check_storage_profile(self) -> bool:
+        """检查存储配置的PRAGMA是否生效，不一致时记录警告"""
+        conn, cursor = self.get_connection()
+        mismatches = check_profile(conn, self.profile)
+        if mismatches:
+            self.logger.warning(f"存储配置 {self.profile.name} 未完全生效: {'; '.join(mismatches)}")
+            return False
+        self.logger.info(f"存储配置: {self.profile.name}")
+        return True
+
     async def async_first_run(self):
         """异步初始化数据库和表结构"""
-        loop = asyncio.get_running_loop()
-        await loop.run_in_executor(None, self.first_run)
-
-    def _check_and_add_missing_columns(self):
-        """检查并添加缺失的列"""
-        try:
-            conn, cursor = self.get_connection()
-
-            # 获取表结构
-            cursor.execute("PRAGMA table_info(players)")
-            existing_columns = {row[1] for row in cursor.fetchall()}
-
-            # 检查并添加所有必需的列
-            required_columns = {
-                'id': 'TEXT',
-                'name': 'TEXT',
-                'level': 'INTEGER DEFAULT 0',
-                'total_playtime': 'INTEGER DEFAULT 0',
-                'infantry_time': 'INTEGER DEFAULT 0',
-                'panzer_time': 'INTEGER DEFAULT 0',
-                'total_kill': 'INTEGER DEFAULT 0',
-                'infantry_kill': 'INTEGER DEFAULT 0',
-                'panzer_kill': 'INTEGER DEFAULT 0',
-                'artillery_kill': 'INTEGER DEFAULT 0',
-                'team_kill': 'INTEGER DEFAULT 0',
-                'total_death': 'INTEGER DEFAULT 0',
-                'apMine_kill': 'INTEGER DEFAULT 0',
-                'atMine_kill': 'INTEGER DEFAULT 0',
-                'satchel_kill': 'INTEGER DEFAULT 0',
-                'knife_kill': 'INTEGER DEFAULT 0'
-            }
-
-            for column, data_type in required_columns.items():
-                if column not in existing_columns:
-                    self.logger.info(f"添加缺失的列: {column}")
-                    cursor.execute(f"ALTER TABLE players ADD COLUMN {column} {data_type}")
-
-            # 检查VIP表结构
-            cursor.execute("PRAGMA table_info(vips)")
-            existing_vip_columns = {row[1] for row in cursor.fetchall()}
-            
-            # VIP表必需的列
-            required_vip_columns = {
-                'player_id': 'TEXT UNIQUE PRIMARY KEY',
-                'description': 'TEXT',
-                'added_time': 'INTEGER NOT NULL',
-                'expire_time': 'INTEGER',
-                'added_by': 'TEXT'
-            }
-            
-            # 如果VIP表不存在，创建它
-            if not existing_vip_columns:
-                self.logger.info("创建VIP表")
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS vips (
-                        player_id TEXT UNIQUE PRIMARY KEY,
-                        description TEXT,
-                        added_time INTEGER NOT NULL,
-                        expire_time INTEGER,
-                        added_by TEXT
-                    )
-                """)
-                cursor.execute("CREATE INDEX IF NOT EXISTS idx_vip_expire ON vips(expire_time)")
-            else:
-                # 检查并添加缺失的列
-                for column, data_type in required_vip_columns.items():
-                    if column not in existing_vip_columns:
-                        self.logger.info(f"添加缺失的VIP列: {column}")
-                        cursor.execute(f"ALTER TABLE vips ADD COLUMN {column} {data_type}")
-
-            conn.commit()
-        except sqlite3.Error as e:
-            self.logger.error(f"检查表结构失败: {e}")
-            raise
-
-    def _check_default_admin(self):
-        """确保默认管理员存在"""
-        try:
-            DEFAULT_ADMIN_QQ = "2275016544"  # 默认管理员QQ
-
-            conn, cursor = self.get_connection()
-
-            # 检查默认管理员是否存在
-            cursor.execute("SELECT qq_id FROM qq_admins WHERE qq_id = ?", (DEFAULT_ADMIN_QQ,))
-            if not cursor.fetchone():
-                # 添加默认管理员
-                current_time = int(time.time())
-                cursor.execute("""
-                    INSERT INTO qq_admins (qq_id, added_time, added_by, notes)
-                    VALUES (?, ?, ?, ?)
-                """, (DEFAULT_ADMIN_QQ, current_time, "系统", "默认管理员"))
-                conn.commit()
-                self.logger.info(f"添加默认管理员: {DEFAULT_ADMIN_QQ}")
-        except sqlite3.Error as e:
-            self.logger.error(f"检查默认管理员失败: {e}")
+        await self.engine.write(self.first_run)
 
     def get_all_qq_admins(self) -> List[str]:
         """获取所有QQ管理员ID列表"""
@@ -241,8 +148,7 @@ class DataStorage:
 
     async def async_get_all_qq_admins(self) -> List[str]:
         """异步获取所有QQ管理员ID列表"""
-        loop = asyncio.get_running_loop()
-        return await loop.run_in_executor(None, self.get_all_qq_admins)
+        return await self.engine.read(self.get_all_qq_admins)
 
     def add_qq_admin(self, qq_id: str, added_by: str = "系统", notes: str = "") -> bool:
         """添加QQ管理员
@@ -280,8 +186,7 @@ class DataStorage:
 
     async def async_add_qq_admin(self, qq_id: str, added_by: str = "系统", notes: str = "") -> bool:
         """异步添加QQ管理员"""
-        loop = asyncio.get_running_loop()
-        return await loop.run_in_executor(None, lambda: self.add_qq_admin(qq_id, added_by, notes))
+        return await self.engine.write(self.add_qq_admin, qq_id, added_by, notes)
 
     def remove_qq_admin(self, qq_id: str) -> bool:
         """移除QQ管理员
@@ -294,7 +199,6 @@ class DataStorage:
         """
         try:
             # 不允许移除默认管理员
-            DEFAULT_ADMIN_QQ = "2275016544"
             if qq_id == DEFAULT_ADMIN_QQ:
                 self.logger.warning(f"不能移除默认管理员: {qq_id}")
                 return False
@@ -316,8 +220,7 @@ class DataStorage:
 
     async def async_remove_qq_admin(self, qq_id: str) -> bool:
         """异步移除QQ管理员"""
-        loop = asyncio.get_running_loop()
-        return await loop.run_in_executor(None, lambda: self.remove_qq_admin(qq_id))
+        return await self.engine.write(self.remove_qq_admin, qq_id)
 
     def _validate_player_data(self, player_data: Dict[str, Any]) -> bool:
         """验证玩家数据"""
@@ -356,16 +259,16 @@ class DataStorage:
                     "ID": row[0],
                     "名称": row[1],
                     "等级": row[2],
-                    "总击杀": row[6],
-                    "步兵击杀": row[7],
-                    "车组击杀": row[8],
-                    "炮兵击杀": row[9],
-                    "TK": row[10],
-                    "总死亡": row[11],
-                    "反步兵雷击杀": row[12],
-                    "反坦克雷击杀": row[13],
-                    "炸药包击杀": row[14],
-                    "刀杀": row[15]
+                    "总击杀": row[3],
+                    "步兵击杀": row[4],
+                    "车组击杀": row[5],
+                    "炮兵击杀": row[6],
+                    "TK": row[7],
+                    "总死亡": row[8],
+                    "反步兵雷击杀": row[9],
+                    "反坦克雷击杀": row[10],
+                    "炸药包击杀": row[11],
+                    "刀杀": row[12]
                 }
             return None
         except sqlite3.Error as e:
@@ -374,11 +277,10 @@ class DataStorage:
 
     async def async_get_player_with_id(self, player_id: str) -> Optional[Dict[str, Any]]:
         """异步通过ID查询玩家"""
-        loop = asyncio.get_running_loop()
-        return await loop.run_in_executor(None, lambda: self.get_player_with_id(player_id))
+        return await self.engine.read(self.get_player_with_id, player_id)
 
     def get_player_with_name(self, name: str) -> Optional[Dict[str, Any]]:
-        """通过名称查询玩家"""
+        """通过名称查询玩家，忽略大小写，有完全一致的名称时优先返回"""
         try:
             conn, cursor = self.get_connection()
             cursor.execute("""
@@ -400,8 +302,10 @@ class DataStorage:
                     satchel_kill AS 炸药包击杀,
                     knife_kill AS 刀杀
                 FROM players
-                WHERE name = ?
-            """, (name,))
+                WHERE name = ? COLLATE NOCASE
+                ORDER BY name = ? DESC
+                LIMIT 1
+            """, (name, name))
 
             row = cursor.fetchone()
             if row:
@@ -413,8 +317,7 @@ class DataStorage:
 
     async def async_get_player_with_name(self, name: str) -> Optional[Dict[str, Any]]:
         """异步通过名称查询玩家"""
-        loop = asyncio.get_running_loop()
-        return await loop.run_in_executor(None, lambda: self.get_player_with_name(name))
+        return await self.engine.read(self.get_player_with_name, name)
 
     def add_player(self, player_id: str, name: str) -> bool:
         """添加新玩家
@@ -454,8 +357,7 @@ class DataStorage:
 
     async def async_add_player(self, player_id: str, name: str) -> bool:
         """异步添加新玩家"""
-        loop = asyncio.get_running_loop()
-        return await loop.run_in_executor(None, lambda: self.add_player(player_id, name))
+        return await self.engine.write(self.add_player, player_id, name)
 
     def insert_player(self, **kwargs) -> bool:
         """插入新玩家数据"""
@@ -494,8 +396,7 @@ class DataStorage:
 
     async def async_insert_player(self, **kwargs) -> bool:
         """异步插入新玩家数据"""
-        loop = asyncio.get_running_loop()
-        return await loop.run_in_executor(None, lambda: self.insert_player(**kwargs))
+        return await self.engine.write(self.insert_player, **kwargs)
 
     def update_player(self, player_id: str, **kwargs) -> bool:
         """更新玩家数据"""
@@ -528,8 +429,7 @@ class DataStorage:
 
     async def async_update_player(self, player_id: str, **kwargs) -> bool:
         """异步更新玩家数据"""
-        loop = asyncio.get_running_loop()
-        return await loop.run_in_executor(None, lambda: self.update_player(player_id, **kwargs))
+        return await self.engine.write(self.update_player, player_id, **kwargs)
 
     def batch_update_players(self, player_data_list: List[Dict[str, Any]]) -> bool:
         """批量更新玩家数据"""
@@ -576,8 +476,40 @@ class DataStorage:
 
     async def async_batch_update_players(self, player_data_list: List[Dict[str, Any]]) -> bool:
         """异步批量更新玩家数据"""
-        loop = asyncio.get_running_loop()
-        return await loop.run_in_executor(None, lambda: self.batch_update_players(player_data_list))
+        return await self.engine.write(self.batch_update_players, player_data_list)
+
+    def increment_player_stats(self, increments: Dict[str, Dict[str, Any]]) -> bool:
+        """在一个事务中累加多个玩家的统计数据，玩家不存在时自动添加
+
+        Args:
+            increments: 玩家ID -> {"name": 玩家名称, 统计列: 增量, ...}
+
+        Returns:
+            是否全部写入成功，失败时整个事务回滚
+        """
+        if not increments:
+            return True
+
+        rows = [
+            (player_id, stats.get('name'), *(stats.get(column, 0) for column in PLAYER_STAT_COLUMNS))
+            for player_id, stats in increments.items()
+        ]
+
+        conn = None
+        try:
+            conn, cursor = self.get_connection()
+            cursor.executemany(_INCREMENT_STATS_SQL, rows)
+            conn.commit()
+            return True
+        except sqlite3.Error as e:
+            self.logger.error(f"累加玩家统计失败: {e}")
+            if conn is not None:
+                conn.rollback()
+            return False
+
+    async def async_increment_player_stats(self, increments: Dict[str, Dict[str, Any]]) -> bool:
+        """异步累加玩家统计数据"""
+        return await self.engine.write(self.increment_player_stats, increments)
 
     def add_vip(self, player_id: str, description: str, duration_days: int = None, added_by: str = "系统") -> bool:
         """添加VIP记录
@@ -616,8 +548,7 @@ class DataStorage:
 
     async def async_add_vip(self, player_id: str, description: str, duration_days: int = None, added_by: str = "系统") -> bool:
         """异步添加VIP记录"""
-        loop = asyncio.get_running_loop()
-        return await loop.run_in_executor(None, lambda: self.add_vip(player_id, description, duration_days, added_by))
+        return await self.engine.write(self.add_vip, player_id, description, duration_days, added_by)
 
     def remove_vip(self, player_id: str) -> bool:
         """移除VIP记录
@@ -645,8 +576,7 @@ class DataStorage:
 
     async def async_remove_vip(self, player_id: str) -> bool:
         """异步移除VIP记录"""
-        loop = asyncio.get_running_loop()
-        return await loop.run_in_executor(None, lambda: self.remove_vip(player_id))
+        return await self.engine.write(self.remove_vip, player_id)
 
     def get_expired_vips(self) -> List[Dict[str, Any]]:
         """获取已过期的VIP列表
@@ -671,8 +601,78 @@ class DataStorage:
 
     async def async_get_expired_vips(self) -> List[Dict[str, Any]]:
         """异步获取已过期的VIP列表"""
-        loop = asyncio.get_running_loop()
-        return await loop.run_in_executor(None, self.get_expired_vips)
+        return await self.engine.read(self.get_expired_vips)
+
+    def get_all_active_vips(self) -> List[Dict[str, Any]]:
+        """获取所有未过期的VIP（包括永久VIP）
+
+        Returns:
+            有效VIP的信息列表
+        """
+        try:
+            conn, cursor = self.get_connection()
+            current_time = int(time.time())
+
+            cursor.execute("""
+                SELECT player_id, description, added_time, expire_time, added_by
+                FROM vips
+                WHERE expire_time IS NULL OR expire_time > ?
+            """, (current_time,))
+
+            return [dict(row) for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            self.logger.error(f"获取有效VIP列表失败: {e}")
+            return []
+
+    async def async_get_all_active_vips(self) -> List[Dict[str, Any]]:
+        """异步获取所有未过期的VIP"""
+        return await self.engine.read(self.get_all_active_vips)
+
+    def get_vip_expiries(self) -> List[Tuple[str, int]]:
+        """获取所有有过期时间的VIP
+
+        Returns:
+            (玩家ID, 过期时间戳) 列表，永久VIP不包含在内
+        """
+        try:
+            conn, cursor = self.get_connection()
+            cursor.execute("SELECT player_id, expire_time FROM vips WHERE expire_time IS NOT NULL")
+            return [(row[0], row[1]) for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            self.logger.error(f"获取VIP过期时间失败: {e}")
+            return []
+
+    async def async_get_vip_expiries(self) -> List[Tuple[str, int]]:
+        """异步获取所有有过期时间的VIP"""
+        return await self.engine.read(self.get_vip_expiries)
+
+    def remove_vips(self, player_ids: List[str]) -> int:
+        """在一个事务中删除多个VIP记录
+
+        Args:
+            player_ids: 玩家ID列表
+
+        Returns:
+            删除的记录数，失败时返回0
+        """
+        if not player_ids:
+            return 0
+
+        conn = None
+        try:
+            conn, cursor = self.get_connection()
+            cursor.executemany("DELETE FROM vips WHERE player_id = ?", [(player_id,) for player_id in player_ids])
+            conn.commit()
+            return cursor.rowcount
+        except sqlite3.Error as e:
+            self.logger.error(f"批量删除VIP失败: {e}")
+            if conn is not None:
+                conn.rollback()
+            return 0
+
+    async def async_remove_vips(self, player_ids: List[str]) -> int:
+        """异步批量删除VIP记录"""
+        return await self.engine.write(self.remove_vips, player_ids)
 
     def get_vip(self, player_id: str) -> Optional[Dict[str, Any]]:
         """获取单个VIP的信息
@@ -701,5 +701,65 @@ class DataStorage:
 
     async def async_get_vip(self, player_id: str) -> Optional[Dict[str, Any]]:
         """异步获取单个VIP的信息"""
-        loop = asyncio.get_running_loop()
-        return await loop.run_in_executor(None, lambda: self.get_vip(player_id))
+        return await self.engine.read(self.get_vip, player_id)
+
+    def get_all_vips(self) -> List[Dict[str, Any]]:
+        """获取全部VIP记录（包括已过期的）
+
+        Returns:
+            VIP信息列表
+        """
+        try:
+            conn, cursor = self.get_connection()
+            cursor.execute("""
+                SELECT player_id, description, added_time, expire_time, added_by
+                FROM vips
+            """)
+            return [dict(row) for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            self.logger.error(f"获取VIP列表失败: {e}")
+            return []
+
+    async def async_get_all_vips(self) -> List[Dict[str, Any]]:
+        """异步获取全部VIP记录"""
+        return await self.engine.read(self.get_all_vips)
+
+    def search_players_by_name(self, term: str, limit: int = 1) -> List[Dict[str, Any]]:
+        """查找名称中包含搜索词的玩家
+
+        Args:
+            term: 搜索词
+            limit: 最多返回的记录数
+
+        Returns:
+            玩家信息列表，键名与 get_player_with_name 一致
+        """
+        try:
+            conn, cursor = self.get_connection()
+            cursor.execute("""
+                SELECT 
+                    id AS ID,
+                    name AS 名称,
+                    level AS 等级,
+                    total_kill AS 总击杀,
+                    infantry_kill AS 步兵击杀,
+                    panzer_kill AS 车组击杀,
+                    artillery_kill AS 炮兵击杀,
+                    team_kill AS TK,
+                    total_death AS 总死亡,
+                    apMine_kill AS 反步兵雷击杀,
+                    atMine_kill AS 反坦克雷击杀,
+                    satchel_kill AS 炸药包击杀,
+                    knife_kill AS 刀杀
+                FROM players
+                WHERE name LIKE ?
+                LIMIT ?
+            """, (f"%{term}%", limit))
+            return [dict(row) for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            self.logger.error(f"模糊查询玩家数据失败: {e}")
+            return []
+
+    async def async_search_players_by_name(self, term: str, limit: int = 1) -> List[Dict[str, Any]]:
+        """异步查找名称中包含搜索词的玩家"""
+        return await self.engine.read(self.search_players_by_name, term, limit)
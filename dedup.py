@@ -0,0 +1,56 @@
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+
+
+class BoundedSet:
+    """容量固定的去重集合
+
+    按加入顺序保存元素，超出容量时淘汰最早加入的元素，查询和插入均为O(1)。
+    设置ttl时元素加入超过ttl秒后视为不存在，过期元素在插入时从队首批量清理
+    """
+
+    def __init__(self, maxlen: int, ttl: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        self.maxlen = maxlen
+        self.ttl = ttl
+        self._clock = clock
+        self._items: "OrderedDict[Hashable, float]" = OrderedDict()
+
+    def __contains__(self, item: Hashable) -> bool:
+        added = self._items.get(item)
+        if added is None:
+            return False
+        return self.ttl is None or self._clock() - added < self.ttl
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def _expire(self, now: float) -> None:
+        deadline = now - self.ttl
+        while self._items:
+            item, added = next(iter(self._items.items()))
+            if added > deadline:
+                break
+            self._items.popitem(last=False)
+
+    def add(self, item: Hashable) -> bool:
+        """
+        加入元素
+
+        Returns:
+            元素此前不在集合中（或已过期）时返回True
+        """
+        now = self._clock()
+        if self.ttl is not None:
+            self._expire(now)
+
+        if item in self._items:
+            return False
+
+        self._items[item] = now
+        if len(self._items) > self.maxlen:
+            self._items.popitem(last=False)
+        return True
+
+    def clear(self) -> None:
+        self._items.clear()
@@ -1,39 +1,203 @@
 # log_loop.py
 import asyncio
 import re
+import time
 from collections import deque
-from typing import Iterable, Tuple, Union
+from typing import Any, Deque, Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
 
 from Log import log
 from commands import Commands
+from dedup import BoundedSet
 from hooks import get_hooks
 
 # 设置日志
 logger = log()
 
-# 定义日志正则表达式模式
+# 日志行头部 "[相对时间 (时间戳)] "，与事件类型前缀一起在一次匹配中取出，
+# 前缀按首字母区分，交替分支之间不会回溯
+LOG_LINE = re.compile(
+    r"\[(?P<relative>[^\]\(]*?) \((?P<timestamp>\d+)\)\] "
+    r"(?P<kind>TEAM KILL: |KILL: |CHAT|DISCONNECTED |CONNECTED |TEAMSWITCH |MATCH START |MATCH ENDED |MESSAGE: )"
+)
+
+# 玩家名后面的 "(阵营/ID)"，名称用非贪婪匹配，其余部分都是排除型字符类
+_PLAYER = r"(?P<{name}>.+?)\((?:Allies|Axis)/(?P<{id}>[^()]*)\)"
+_KILL_BODY = (_PLAYER.format(name="attacker", id="attacker_id") + " -> "
+              + _PLAYER.format(name="victim", id="victim_id") + r" with (?P<weapon>.+)")
+
+# 事件正文的正则表达式，从前缀之后的位置开始锚定匹配
 LOG_PATTERNS = {
-    "CHAT": re.compile(r"CHAT\[(Team|Unit)]\[(.*)\((Allies|Axis)/(.*)\)]: (.*)"),
-    "CHAT_SIMPLE": re.compile(r"CHAT.*\[(.*?)]:\s*(.*)"),  # 简化的聊天匹配
-    "LOG_TIME": re.compile(r".*\((\d+)\).*"),
+    "CHAT": re.compile(r"\[(Team|Unit)\]\[(.+?)\((Allies|Axis)/([^()]*)\)\]: (.*)"),
+    "CHAT_SIMPLE": re.compile(r".*\[(.*?)\]:\s*(.*)"),  # 简化的聊天匹配
+    "KILL": re.compile(_KILL_BODY),
+    "TEAM_KILL": re.compile(_KILL_BODY),
+    "CONNECTED": re.compile(r"(?P<player>.+) \((?P<player_id>[^()]*)\)$"),
+    "DISCONNECTED": re.compile(r"(?P<player>.+) \((?P<player_id>[^()]*)\)$"),
+    "TEAMSWITCH": re.compile(r"(?P<player>.+) \((?P<old_team>[^()>]*) > (?P<new_team>[^()]*)\)$"),
+    "MATCH_START": re.compile(r"(?P<map>.+)"),
+    "MATCH_ENDED": re.compile(r"(?P<result>.+)"),
+    "MESSAGE": re.compile(r"player \[(?P<player>.+?)\((?P<player_id>[^()]*)\)\], content \[(?P<content>.*)\]$"),
 }
 
+# 前缀分发表：前缀 -> (事件类型, 依次尝试的正则表达式名称)
+EVENT_DISPATCH = {
+    "TEAM KILL: ": ("TEAM KILL", ("TEAM_KILL",)),
+    "KILL: ": ("KILL", ("KILL",)),
+    "CHAT": ("CHAT", ("CHAT", "CHAT_SIMPLE")),
+    "DISCONNECTED ": ("DISCONNECTED", ("DISCONNECTED",)),
+    "CONNECTED ": ("CONNECTED", ("CONNECTED",)),
+    "TEAMSWITCH ": ("TEAMSWITCH", ("TEAMSWITCH",)),
+    "MATCH START ": ("MATCH START", ("MATCH_START",)),
+    "MATCH ENDED ": ("MATCH ENDED", ("MATCH_ENDED",)),
+    "MESSAGE: ": ("MESSAGE", ("MESSAGE",)),
+}
+
+# 钩子数据中 message 字段使用解析字段而不是原始日志的事件类型
+FIELD_MESSAGE_EVENTS = ("KILL", "TEAM KILL")
+
+
+class LogEvent(NamedTuple):
+    """解析后的日志事件"""
+    type: str  # 事件类型，与 hooks.HookType 一致
+    timestamp: str
+    relative_time: str
+    content: str  # 原始日志行
+    groups: Tuple[str, ...]  # 正则表达式匹配结果
+    fields: Dict[str, str]  # 命名字段，如 attacker、victim_id 等
+
+    def to_hook_data(self) -> Dict[str, Any]:
+        """转换为传给钩子函数的数据"""
+        return {
+            "message": self.fields if self.type in FIELD_MESSAGE_EVENTS else self.content,
+            "timestamp": self.timestamp,
+            "relative_time": self.relative_time,
+            "type": self.type,
+            "match": self.groups,
+            "fields": self.fields,
+        }
+
+
+def classify_log_line(line: str) -> Optional[LogEvent]:
+    """
+    单次解析一行日志：头部、事件类型和字段都在锚定匹配中取出
+
+    Args:
+        line: 去掉首尾空白的日志行
+
+    Returns:
+        解析出的事件，没有订阅价值或无法识别的日志行返回None
+    """
+    header = LOG_LINE.match(line)
+    if header is None:
+        return None
+
+    kind, timestamp, relative_time = header.group("kind", "timestamp", "relative")
+    event_type, pattern_names = EVENT_DISPATCH[kind]
+    body_start = header.end()
+    for pattern_name in pattern_names:
+        match = LOG_PATTERNS[pattern_name].match(line, body_start)
+        if match:
+            return LogEvent(event_type, timestamp, relative_time, line, match.groups(), match.groupdict())
+    return None
+
 # 日志缓存大小
 LOG_CACHE_SIZE = 1000
 
+# 游标回看的秒数，时间戳不早于 最新时间戳-该值 的日志行才会再做去重检查
+LOG_CURSOR_GRACE_SEC = 2
+
+# 日志轮询间隔的默认下限和上限（秒）
+LOG_POLL_FLOOR_SEC = 0.25
+LOG_POLL_CEILING_SEC = 5.0
+
+# 一次轮询得到的新日志达到该行数时视为对局繁忙，缩短轮询间隔
+LOG_POLL_BUSY_LINES = 10
+
+# 通过 get slots 检查服务器人数的间隔（秒）
+LOG_POLL_SLOTS_CHECK_SEC = 30
+
+# 轮询频率指标的统计窗口和输出间隔（秒）
+LOG_POLL_METRICS_WINDOW_SEC = 60
+LOG_POLL_REPORT_SEC = 300
+
 # 日志处理队列
 log_queue = asyncio.Queue()
 
 
-def split_raw_log_lines(raw_logs: Union[str, bytes]) -> Iterable[Tuple[str, str, str]]:
+def _header_timestamp(line: str) -> Optional[Tuple[int, str]]:
+    """
+    从日志行头部 "[相对时间 (时间戳)] " 中取出时间戳和头部之后的正文，不使用正则表达式
+
+    相对时间每次轮询都会变化，去重时只能使用时间戳和正文
+    """
+    end = line.find(")]")
+    if end == -1:
+        return None
+    start = line.rfind("(", 0, end)
+    value = line[start + 1:end]
+    if start == -1 or not value.isdigit():
+        return None
+    return int(value), line[end + 2:].lstrip()
+
+
+class LogCursor:
     """
-    将原始游戏服务器日志分割为相对时间、时间戳和内容
+    增量日志游标
+
+    记录已处理的最新服务器时间戳，每次轮询只从日志窗口末尾向前扫描到该时间戳为止，
+    时间戳相同的日志行用头部之后正文的哈希区分，去重集合容量固定
+    """
+
+    def __init__(self, grace: int = LOG_CURSOR_GRACE_SEC, max_seen: int = LOG_CACHE_SIZE):
+        self.last_timestamp = 0
+        self.grace = grace
+        self.seen = BoundedSet(max_seen)
+
+    def new_lines(self, lines: List[str]) -> List[str]:
+        """
+        从按时间顺序排列的日志行中取出尚未处理过的行
+
+        Args:
+            lines: 一次轮询得到的全部日志行
+
+        Returns:
+            新日志行，保持原有顺序
+        """
+        floor = self.last_timestamp - self.grace
+
+        # 从末尾向前扫描，遇到早于游标窗口的行即停止
+        candidates = []
+        for line in reversed(lines):
+            line = line.strip()
+            if not line:
+                continue
+            header = _header_timestamp(line)
+            if header is None:
+                continue
+            timestamp, body = header
+            if timestamp < floor:
+                break
+            candidates.append((timestamp, body, line))
+
+        result = []
+        for timestamp, body, line in reversed(candidates):
+            if self.seen.add((timestamp, hash(body))):
+                result.append(line)
+                if timestamp > self.last_timestamp:
+                    self.last_timestamp = timestamp
+        return result
+
+
+def parse_raw_logs(raw_logs: Union[str, bytes], cursor: Optional[LogCursor] = None) -> Iterable[LogEvent]:
+    """
+    将原始游戏服务器日志解析为事件，每行只做一次分类匹配
     
     Args:
         raw_logs: 原始日志字符串或字节
+        cursor: 增量日志游标，提供时只解析游标之后的新日志
         
     Yields:
-        包含相对时间、时间戳和日志内容的元组
+        解析出的日志事件，无法识别的日志行会被跳过
     """
     if not raw_logs:
         logger.info("收到空日志")
@@ -67,126 +231,188 @@ def split_raw_log_lines(raw_logs: Union[str, bytes]) -> Iterable[Tuple[str, str,
         return
         
     try:
-        for line in raw_logs.strip().split('\n'):
+        lines = raw_logs.strip().split('\n')
+        if cursor is not None:
+            lines = cursor.new_lines(lines)
+
+        for line in lines:
             line = line.strip()
             if not line:
                 continue
-            
-            # 提取时间戳
-            time_match = LOG_PATTERNS["LOG_TIME"].match(line)
-            if not time_match:
-                logger.debug(f"无法匹配时间戳: {line}")
-                continue
-                
-            timestamp = time_match.group(1)
-            content = line
-            
-            # 提取相对时间（如果有）
-            relative_time = "00:00:00"  # 默认值
-            if "[" in line and "]" in line:
-                time_part = line[line.find("[")+1:line.find("]")]
-                if ":" in time_part:
-                    relative_time = time_part
-            
-            logger.debug(f"解析结果: 时间={relative_time}, 时间戳={timestamp}, 内容={content}")
-            yield relative_time, timestamp, content
+
+            event = classify_log_line(line)
+            if event is not None:
+                yield event
 
     except Exception as e:
-        logger.error(f"分割日志行时出错: {e}")
+        logger.error(f"解析日志行时出错: {e}")
         return
 
 
+class AdaptivePoller:
+    """
+    自适应日志轮询间隔
+
+    出现聊天（可能是玩家命令）时立即降到下限，新日志较多时减半，
+    没有新日志时逐步放大到上限；根据 get slots 判断服务器无人时直接使用上限
+    """
+
+    def __init__(self, floor: float = LOG_POLL_FLOOR_SEC, ceiling: float = LOG_POLL_CEILING_SEC,
+                 busy_lines: int = LOG_POLL_BUSY_LINES, slots_interval: float = LOG_POLL_SLOTS_CHECK_SEC):
+        if floor <= 0 or ceiling < floor:
+            raise ValueError(f"无效的轮询间隔范围: {floor} - {ceiling}")
+        self.floor = floor
+        self.ceiling = ceiling
+        self.busy_lines = busy_lines
+        self.slots_interval = slots_interval
+        self.interval = min(max(1.0, floor), ceiling)
+        self.player_count: Optional[int] = None
+        self._last_slots_check = 0.0
+        # 统计窗口内每次轮询的 (时间, 新日志行数)
+        self._recent: Deque[Tuple[float, int]] = deque()
+        self.total_polls = 0
+        self.total_lines = 0
+
+    @property
+    def server_empty(self) -> bool:
+        return self.player_count == 0
+
+    async def refresh_player_count(self, commands: Commands) -> None:
+        """按固定间隔通过 get slots 更新在线人数，失败时保留上一次的结果"""
+        now = time.monotonic()
+        if now - self._last_slots_check < self.slots_interval:
+            return
+        self._last_slots_check = now
+        try:
+            result = await commands.get_slots()
+            if result:
+                self.player_count = int(result.split("/")[0])
+        except Exception as e:
+            logger.debug(f"获取服务器人数失败: {e}")
+
+    def record(self, new_lines: int, chat_lines: int) -> float:
+        """
+        记录一次轮询的结果并计算下一次的等待时间
+
+        Args:
+            new_lines: 本次轮询得到的新日志事件数
+            chat_lines: 其中的聊天事件数
+
+        Returns:
+            下一次轮询前等待的秒数
+        """
+        now = time.monotonic()
+        self.total_polls += 1
+        self.total_lines += new_lines
+        self._recent.append((now, new_lines))
+        while self._recent and now - self._recent[0][0] > LOG_POLL_METRICS_WINDOW_SEC:
+            self._recent.popleft()
+
+        if chat_lines:
+            self.interval = self.floor
+        elif new_lines >= self.busy_lines:
+            self.interval = max(self.floor, self.interval / 2)
+        elif new_lines == 0:
+            self.interval = min(self.ceiling, self.interval * 1.5)
+
+        if self.server_empty and new_lines == 0:
+            self.interval = self.ceiling
+        return self.interval
+
+    def metrics(self) -> Dict[str, Any]:
+        """返回统计窗口内的实际轮询频率等指标"""
+        polls = len(self._recent)
+        lines = sum(count for _, count in self._recent)
+        span = self._recent[-1][0] - self._recent[0][0] if polls > 1 else 0.0
+        return {
+            "interval": round(self.interval, 3),
+            "polls_per_minute": round((polls - 1) * 60 / span, 1) if span else 0.0,
+            "lines_per_poll": round(lines / polls, 1) if polls else 0.0,
+            "player_count": self.player_count,
+            "total_polls": self.total_polls,
+            "total_lines": self.total_lines,
+        }
+
+
 class LogProcessor:
-    """日志处理器类，用于管理日志处理状态"""
+    """日志处理器类，解析日志事件并分发给所有订阅了该事件的钩子"""
 
-    def __init__(self):
-        self.seen_logs = deque(maxlen=LOG_CACHE_SIZE)
+    def __init__(self, commands: Optional[Commands] = None):
         self.logger = log()
-        self.commands = Commands()  # 每个处理器实例都有自己的命令实例
+        # 未注入时新建的命令实例同样使用进程内共享的连接池
+        self.commands = commands if commands is not None else Commands()
 
-    async def process_log(self, relative_time: str, timestamp: str, content: str) -> None:
+    async def process_event(self, event: LogEvent) -> None:
         try:
-            # 创建唯一标识符
-            log_id = f"{timestamp}:{content}"
-            if log_id in self.seen_logs:
+            # 去重由 LogCursor 完成，解析由 classify_log_line 完成，这里只负责分发
+            hooks = get_hooks(event.type)
+            if not hooks:
                 return
 
-            self.seen_logs.append(log_id)
-            
-            # 处理聊天消息
-            if "CHAT" in content:
-                for chat_type in ["CHAT", "CHAT_SIMPLE"]:
-                    if pattern := LOG_PATTERNS.get(chat_type):
-                        match = pattern.search(content)
-                        if match:
-                            hooks = get_hooks("CHAT")
-                            for hook in hooks:
-                                try:
-                                    await hook(self.commands, {
-                                        "message": content,
-                                        "timestamp": timestamp,
-                                        "relative_time": relative_time,
-                                        "type": "CHAT",
-                                        "match": match.groups()
-                                    })
-                                except Exception as e:
-                                    self.logger.error(f"执行聊天钩子函数失败: {e}")
-                            break
+            hook_data = event.to_hook_data()
+            for hook in hooks:
+                try:
+                    await hook(self.commands, hook_data)
+                except Exception as e:
+                    self.logger.error(f"执行 {event.type} 钩子函数 {getattr(hook, '__name__', hook)} 失败: {e}")
         except Exception as e:
-            self.logger.error(f"处理日志时出错: {e}, 内容: {content}")
+            self.logger.error(f"处理日志时出错: {e}, 内容: {event.content}")
 
 
-async def log_processor_worker():
+async def log_processor_worker(processor: LogProcessor):
     """日志处理工作线程"""
-    processor = LogProcessor()
     while True:
         try:
-            log_data = await log_queue.get()
-            await processor.process_log(*log_data)
+            event = await log_queue.get()
+            await processor.process_event(event)
             log_queue.task_done()
         except Exception as e:
             logger.error(f"日志处理工作线程出错: {e}")
 
 
-async def log_loop():
-    """异步日志循环"""
-    processor = LogProcessor()
-    last_logs = set()
-    current_logs = set()
+async def log_loop(commands: Optional[Commands] = None, poller: Optional[AdaptivePoller] = None):
+    """异步日志循环，所有日志事件只在这里拉取一次
+
+    Args:
+        commands: 使用的命令实例，为None时新建（仍共享进程内的连接池）
+        poller: 轮询间隔调度器，为None时使用默认的上下限
+    """
+    processor = LogProcessor(commands)
+    cursor = LogCursor()
+    poller = poller if poller is not None else AdaptivePoller()
+    last_report = time.monotonic()
     retry_count = 0
     max_retries = 5
     retry_delay = 5  # 重试延迟时间（秒）
 
     # 启动日志处理工作线程
-    worker_task = asyncio.create_task(log_processor_worker())
+    worker_task = asyncio.create_task(log_processor_worker(processor))
 
     try:
         while True:
             try:
-                # 获取最近1分钟的日志
+                await poller.refresh_player_count(processor.commands)
+
+                # 获取最近1分钟的日志，只处理游标之后的新日志
                 raw_logs = await processor.commands.get_log(minutes_ago=1)
-                if not raw_logs:
-                    await asyncio.sleep(1)
-                    continue
-                
-                # 清空当前日志集合
-                current_logs.clear()
-                
-                # 处理新日志
-                for relative_time, timestamp, content in split_raw_log_lines(raw_logs):
-                    log_id = f"{timestamp}:{content}"
-                    if log_id not in last_logs:
-                        current_logs.add(log_id)
-                        await log_queue.put((relative_time, timestamp, content))
-                
-                # 更新最后看到的日志集合
-                last_logs = current_logs.copy()
+                new_lines = 0
+                chat_lines = 0
+                if raw_logs:
+                    for event in parse_raw_logs(raw_logs, cursor):
+                        new_lines += 1
+                        if event.type == "CHAT":
+                            chat_lines += 1
+                        await log_queue.put(event)
                 
                 # 重置重试计数
                 retry_count = 0
+
+                if time.monotonic() - last_report >= LOG_POLL_REPORT_SEC:
+                    last_report = time.monotonic()
+                    logger.info(f"日志轮询状态: {poller.metrics()}")
                 
-                # 等待一段时间
-                await asyncio.sleep(1)
+                # 按服务器活跃程度等待
+                await asyncio.sleep(poller.record(new_lines, chat_lines))
                 
             except Exception as e:
                 logger.error(f"日志循环出错: {e}")
@@ -215,10 +441,10 @@ async def log_loop():
 async def main():
     """主函数"""
     try:
-        logger.info("启动命令监控...")
+        logger.info("启动日志监控...")
         await log_loop()
     except Exception as e:
-        logger.error(f"命令监控异常: {e}")
+        logger.error(f"日志监控异常: {e}")
 
 
 if __name__ == "__main__":
@@ -6,9 +6,11 @@ import subprocess
 from typing import List, Optional
 
 from Log import log
-from customCMDs import ctx, start_vip_check_task, check_expired_vips
-from log_loop import log_loop
-from credentials_manager import CredentialsManager
+from customCMDs import ctx, start_vip_check_task, check_expired_vips, read_config_value, game_registry
+from log_loop import AdaptivePoller, LOG_POLL_CEILING_SEC, LOG_POLL_FLOOR_SEC, log_loop
+from credentials_manager import CredentialsManager, credentials_cache_report
+from connection import async_close_all
+from vip_sync import VipReconciler, VipSyncReport
 
 # 设置日志
 logger = log()
@@ -36,6 +38,12 @@ class HLLBot:
                 name="LogLoop"
             )
             self.tasks.append(log_task)
+
+            # 启动玩家统计批量写入任务
+            self.tasks.append(ctx.player_stats.start())
+
+            # 启动在线玩家名单刷新任务
+            self.tasks.append(ctx.roster.start())
             
             # 程序启动时立即执行一次VIP过期检查
             logger.info("执行启动时VIP过期检查...")
@@ -52,6 +60,10 @@ class HLLBot:
             )
             self.tasks.append(vip_check_task)
 
+            # 数据库与游戏VIP对账任务，启动时先对账一次
+            if read_config_value('config.txt', 'vip_sync', 'true').lower() == 'true':
+                self.tasks.append(asyncio.create_task(self._run_vip_sync(), name="VIPSync"))
+
             logger.info("HLL 机器人启动成功")
 
             # 保持主循环运行
@@ -65,7 +77,11 @@ class HLLBot:
     async def _run_log_loop(self):
         """运行日志循环"""
         try:
-            await log_loop()
+            poller = AdaptivePoller(
+                floor=float(read_config_value('config.txt', 'log_poll_floor', LOG_POLL_FLOOR_SEC)),
+                ceiling=float(read_config_value('config.txt', 'log_poll_ceiling', LOG_POLL_CEILING_SEC)),
+            )
+            await log_loop(ctx.commands, poller)
         except Exception as e:
             logger.error(f"日志循环异常: {e}")
             self.running = False
@@ -77,11 +93,8 @@ class HLLBot:
             
             # 首次启动时清理一次
             try:
-                # 清理数据库中过期的VIP
-                cleaned_count = await ctx.data.async_clean_expired_vips()
-                
-                # 清理游戏中的过期VIP
-                await self._clean_expired_vips_from_game()
+                # 清理游戏和数据库中的过期VIP
+                cleaned_count = await self._clean_expired_vips_from_game()
                 
                 logger.info(f"初始化清理过期VIP: 已从数据库清理 {cleaned_count} 个")
             except Exception as e:
@@ -93,11 +106,8 @@ class HLLBot:
                     # 等待24小时
                     await asyncio.sleep(24 * 3600)
                     
-                    # 清理数据库中过期的VIP
-                    cleaned_count = await ctx.data.async_clean_expired_vips()
-                    
-                    # 清理游戏中的过期VIP
-                    await self._clean_expired_vips_from_game()
+                    # 清理游戏和数据库中的过期VIP
+                    cleaned_count = await self._clean_expired_vips_from_game()
                     
                     if cleaned_count > 0:
                         logger.info(f"定时清理过期VIP: 已从数据库清理 {cleaned_count} 个")
@@ -113,45 +123,19 @@ class HLLBot:
             # 不会导致主程序终止
             return
             
-    async def _clean_expired_vips_from_game(self):
-        """从游戏服务器清理已过期的VIP"""
+    async def _clean_expired_vips_from_game(self) -> int:
+        """从游戏服务器移除已过期的VIP并删除数据库中的过期记录
+
+        Returns:
+            从数据库清理的过期记录数
+        """
         try:
-            # 获取数据库中所有有效的VIP ID
-            active_vips = await ctx.data.async_get_all_active_vips()
-            active_vip_ids = [vip['player_id'] for vip in active_vips]
-            
-            # 获取游戏中所有的VIP
-            game_vips = await ctx.commands.get_vip_ids()
-            if not game_vips:
-                logger.info("游戏服务器中无VIP，无需清理")
-                return
-                
-            # 处理返回结果可能是列表或单个字典的情况
-            if isinstance(game_vips, dict):
-                game_vips = [game_vips]
-                
-            # 计数器
-            removed_count = 0
-            
-            # 移除游戏中已过期的VIP
-            for game_vip in game_vips:
-                player_id = game_vip.get('player_id')
-                player_name = game_vip.get('name', '')
-                
-                if player_id and player_id not in active_vip_ids:
-                    # 从游戏中移除VIP
-                    success = await ctx.commands.remove_vip(player_id)
-                    if success:
-                        removed_count += 1
-                        logger.info(f"已从游戏服务器移除过期VIP: {player_name} ({player_id})")
-                    else:
-                        logger.warning(f"从游戏服务器移除VIP失败: {player_name} ({player_id})")
-            
-            if removed_count > 0:
-                logger.info(f"从游戏服务器清理过期VIP完成，共移除 {removed_count} 个")
+            report = await VipReconciler(ctx.commands, ctx.data).reconcile(add=False)
+            return report.cleaned
         except Exception as e:
             logger.error(f"从游戏服务器清理过期VIP失败: {e}")
             # 不抛出异常，继续执行其他任务
+            return 0
             
     async def _run_vip_sync(self):
         """运行VIP同步定时任务，将数据库中的VIP信息同步到游戏服务器"""
@@ -186,48 +170,14 @@ class HLLBot:
             # 不会导致主程序终止
             return
     
-    async def _sync_vips_to_game(self):
-        """同步数据库中的VIP信息到游戏服务器"""
+    async def _sync_vips_to_game(self, dry_run: bool = False) -> VipSyncReport:
+        """同步数据库中的VIP信息到游戏服务器
+
+        Args:
+            dry_run: 只计算并记录差异，不实际修改
+        """
         try:
-            # 获取数据库中所有有效的VIP
-            vips = await ctx.data.async_get_all_active_vips()
-            logger.info(f"准备同步 {len(vips)} 个VIP到游戏服务器")
-            
-            # 获取游戏中现有的VIP
-            game_vips = await ctx.commands.get_vip_ids()
-            game_vip_ids = [vip.get("player_id") for vip in game_vips] if game_vips else []
-            logger.info(f"游戏服务器中已有 {len(game_vip_ids)} 个VIP")
-            
-            # 同步VIP信息
-            sync_count = 0
-            for vip in vips:
-                player_id = vip.get("player_id")
-                player_name = vip.get("player_name")
-                notes = vip.get("notes", "")
-                
-                # 如果VIP不在游戏中，添加它
-                if player_id not in game_vip_ids:
-                    success = await ctx.commands.add_vip(player_id, notes)
-                    if success:
-                        sync_count += 1
-                        logger.info(f"已同步VIP到游戏服务器: {player_name} ({player_id})")
-                    else:
-                        logger.warning(f"同步VIP失败: {player_name} ({player_id})")
-            
-            # 移除游戏中存在但数据库中已过期的VIP
-            db_vip_ids = [vip.get("player_id") for vip in vips]
-            remove_count = 0
-            
-            for game_vip_id in game_vip_ids:
-                if game_vip_id not in db_vip_ids:
-                    success = await ctx.commands.remove_vip(game_vip_id)
-                    if success:
-                        remove_count += 1
-                        logger.info(f"已从游戏服务器移除过期VIP: {game_vip_id}")
-                    else:
-                        logger.warning(f"移除过期VIP失败: {game_vip_id}")
-            
-            logger.info(f"VIP同步完成: 添加 {sync_count} 个, 移除 {remove_count} 个")
+            return await VipReconciler(ctx.commands, ctx.data).reconcile(dry_run=dry_run)
         except Exception as e:
             logger.error(f"同步VIP信息到游戏服务器失败: {e}")
             raise
@@ -251,13 +201,27 @@ class HLLBot:
                 except asyncio.CancelledError:
                     pass
 
+        # 写入尚未保存的玩家统计
+        try:
+            await ctx.player_stats.close()
+        except Exception as e:
+            logger.error(f"写入玩家统计时出错: {e}")
+
+        # 等待排队的数据库写操作提交后关闭存储引擎
+        try:
+            await ctx.data.async_close()
+        except Exception as e:
+            logger.error(f"关闭数据库时出错: {e}")
+
         # 清理资源
         try:
             # 使用ctx的连接池
-            ctx.connection_pool.close_all()
+            await async_close_all(ctx.connection_pool)
         except Exception as e:
             logger.error(f"断开连接时出错: {e}")
 
+        logger.info(f"RCON结果缓存统计: {ctx.commands.cache.stats()}")
+        logger.info(game_registry.summary())
         logger.info("HLL 机器人已关闭")
         sys.exit(0)
 
@@ -291,6 +255,7 @@ async def main():
     
         # 初始化上下文
         await ctx.initialize()
+        logger.info(credentials_cache_report())
         
         # 创建并启动机器人
         bot = HLLBot()
@@ -0,0 +1,160 @@
+# migrations.py
+import sqlite3
+import time
+from typing import Callable, Dict, NamedTuple, Tuple
+
+from Log import log
+
+logger = log()
+
+# 默认管理员QQ，数据库初始化时添加，不允许移除
+DEFAULT_ADMIN_QQ = "2275016544"
+
+# 旧版本数据库可能缺少的列，版本1迁移时补齐
+_PLAYER_COLUMNS: Dict[str, str] = {
+    'name': 'TEXT',
+    'level': 'INTEGER DEFAULT 0',
+    'total_playtime': 'INTEGER DEFAULT 0',
+    'infantry_time': 'INTEGER DEFAULT 0',
+    'panzer_time': 'INTEGER DEFAULT 0',
+    'total_kill': 'INTEGER DEFAULT 0',
+    'infantry_kill': 'INTEGER DEFAULT 0',
+    'panzer_kill': 'INTEGER DEFAULT 0',
+    'artillery_kill': 'INTEGER DEFAULT 0',
+    'team_kill': 'INTEGER DEFAULT 0',
+    'total_death': 'INTEGER DEFAULT 0',
+    'apMine_kill': 'INTEGER DEFAULT 0',
+    'atMine_kill': 'INTEGER DEFAULT 0',
+    'satchel_kill': 'INTEGER DEFAULT 0',
+    'knife_kill': 'INTEGER DEFAULT 0'
+}
+
+_VIP_COLUMNS: Dict[str, str] = {
+    'description': 'TEXT',
+    'added_time': 'INTEGER NOT NULL DEFAULT 0',
+    'expire_time': 'INTEGER',
+    'added_by': 'TEXT'
+}
+
+
+class Migration(NamedTuple):
+    """一个数据库版本的升级步骤，在一个事务中执行并更新 user_version"""
+    version: int
+    description: str
+    apply: Callable[[sqlite3.Connection], None]
+
+
+def _script(*statements: str) -> Callable[[sqlite3.Connection], None]:
+    """由若干SQL语句组成的迁移"""
+    def apply(conn: sqlite3.Connection) -> None:
+        for statement in statements:
+            conn.execute(statement)
+    return apply
+
+
+def _add_missing_columns(conn: sqlite3.Connection, table: str, columns: Dict[str, str]) -> None:
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    for column, data_type in columns.items():
+        if column not in existing:
+            logger.info(f"添加缺失的列: {table}.{column}")
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {data_type}")
+
+
+def _baseline(conn: sqlite3.Connection) -> None:
+    """创建初始表结构，并补齐引入版本号之前创建的数据库中缺少的列"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS players (
+            id TEXT UNIQUE PRIMARY KEY,
+            name TEXT,
+            level INTEGER DEFAULT 0,
+            total_playtime INTEGER DEFAULT 0,
+            infantry_time INTEGER DEFAULT 0,
+            panzer_time INTEGER DEFAULT 0,
+            total_kill INTEGER DEFAULT 0,
+            infantry_kill INTEGER DEFAULT 0,
+            panzer_kill INTEGER DEFAULT 0,
+            artillery_kill INTEGER DEFAULT 0,
+            team_kill INTEGER DEFAULT 0,
+            total_death INTEGER DEFAULT 0,
+            apMine_kill INTEGER DEFAULT 0,
+            atMine_kill INTEGER DEFAULT 0,
+            satchel_kill INTEGER DEFAULT 0,
+            knife_kill INTEGER DEFAULT 0
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS qq_admins (
+            qq_id TEXT UNIQUE PRIMARY KEY,
+            added_time INTEGER NOT NULL,
+            added_by TEXT,
+            notes TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS vips (
+            player_id TEXT UNIQUE PRIMARY KEY,
+            description TEXT,
+            added_time INTEGER NOT NULL,
+            expire_time INTEGER,
+            added_by TEXT
+        )
+    """)
+    _add_missing_columns(conn, "players", _PLAYER_COLUMNS)
+    _add_missing_columns(conn, "vips", _VIP_COLUMNS)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_vip_expire ON vips(expire_time)")
+    conn.execute("""
+        INSERT OR IGNORE INTO qq_admins (qq_id, added_time, added_by, notes)
+        VALUES (?, ?, ?, ?)
+    """, (DEFAULT_ADMIN_QQ, int(time.time()), "系统", "默认管理员"))
+
+
+# 按版本号排列，只能在末尾追加，已发布的迁移不能修改
+MIGRATIONS: Tuple[Migration, ...] = (
+    Migration(1, "初始表结构", _baseline),
+    Migration(2, "删除主键上的重复索引，玩家名称改用忽略大小写的索引", _script(
+        "DROP INDEX IF EXISTS idx_player_id",
+        "DROP INDEX IF EXISTS idx_player_name",
+        "CREATE INDEX IF NOT EXISTS idx_player_name_nocase ON players(name COLLATE NOCASE)",
+    )),
+)
+
+SCHEMA_VERSION = MIGRATIONS[-1].version
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def run_migrations(conn: sqlite3.Connection) -> int:
+    """
+    把数据库升级到最新版本
+
+    每个迁移在自己的事务中执行，失败时回滚该迁移并抛出异常，已完成的迁移保留。
+    数据库已是最新版本时只读取一次 user_version
+
+    Returns:
+        执行的迁移数量
+    """
+    version = get_schema_version(conn)
+    if version > SCHEMA_VERSION:
+        logger.warning(f"数据库版本 {version} 高于程序支持的版本 {SCHEMA_VERSION}")
+        return 0
+
+    applied = 0
+    for migration in MIGRATIONS:
+        if migration.version <= version:
+            continue
+        try:
+            conn.execute("BEGIN")
+            migration.apply(conn)
+            # user_version 不支持参数绑定，版本号来自上面的常量
+            conn.execute(f"PRAGMA user_version = {migration.version}")
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            logger.error(f"数据库迁移到版本 {migration.version} 失败: {e}")
+            raise
+        logger.info(f"数据库已迁移到版本 {migration.version}: {migration.description}")
+        applied += 1
+    return applied
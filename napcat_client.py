@@ -0,0 +1,107 @@
+# napcat_client.py
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from Log import log
+
+logger = log()
+
+# 同时进行的NapCat请求数，也是保持的keep-alive连接数
+NAPCAT_CONCURRENCY = 4
+
+# 默认超时：(连接, 读取) 秒
+NAPCAT_TIMEOUT_SEC: Tuple[float, float] = (3, 10)
+
+# 拉取消息历史的超时，轮询时宁可跳过一次也不要长时间挂起
+NAPCAT_POLL_TIMEOUT_SEC: Tuple[float, float] = (2, 5)
+
+
+class NapCatError(Exception):
+    """NapCat接口调用失败：网络错误、HTTP错误或返回的status不是ok"""
+
+
+class NapCatClient:
+    """
+    NapCat OneBot HTTP接口的异步客户端
+
+    使用一个持久的 requests.Session 复用keep-alive连接，请求在专用线程池中执行，
+    不会阻塞事件循环，线程池大小即同时进行的请求数上限
+    """
+
+    def __init__(self, port, group_id, host: str = "127.0.0.1", concurrency: int = NAPCAT_CONCURRENCY,
+                 timeout: Tuple[float, float] = NAPCAT_TIMEOUT_SEC):
+        self.base_url = f"http://{host}:{port}"
+        self.group_id = group_id
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update({'Content-Type': 'application/json'})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount("http://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="NapCat")
+        self.requests = 0
+        self.failures = 0
+
+    def _post(self, action: str, payload: Dict[str, Any], timeout: Tuple[float, float]) -> Any:
+        try:
+            response = self.session.post(f"{self.base_url}/{action}", json=payload, timeout=timeout)
+            response.raise_for_status()
+            result = response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise NapCatError(f"{action} 请求失败: {e}") from e
+
+        if result.get("status") != "ok":
+            raise NapCatError(f"{action} 返回错误: retcode={result.get('retcode')} "
+                              f"{result.get('wording') or result.get('message') or ''}")
+        return result.get("data")
+
+    async def call(self, action: str, payload: Dict[str, Any],
+                   timeout: Optional[Tuple[float, float]] = None) -> Any:
+        """
+        调用NapCat接口
+
+        Args:
+            action: 接口名，如 send_group_msg
+            payload: 请求参数
+            timeout: (连接, 读取) 超时秒数，默认使用客户端的超时
+
+        Returns:
+            响应中的data字段
+
+        Raises:
+            NapCatError: 请求失败或NapCat返回错误
+        """
+        loop = asyncio.get_running_loop()
+        self.requests += 1
+        try:
+            return await loop.run_in_executor(self._executor, self._post, action, payload, timeout or self.timeout)
+        except NapCatError:
+            self.failures += 1
+            raise
+
+    async def get_group_msg_history(self, message_seq: int | str = 0, count: int = 20,
+                                    reverse_order: bool = False) -> List[Dict[str, Any]]:
+        """拉取群消息历史"""
+        data = await self.call("get_group_msg_history", {
+            "group_id": self.group_id,
+            "message_seq": str(message_seq),
+            "count": count,
+            "reverseOrder": reverse_order
+        }, timeout=NAPCAT_POLL_TIMEOUT_SEC)
+        return (data or {}).get("messages") or []
+
+    async def send_group_msg(self, message: str) -> Any:
+        """发送群消息"""
+        return await self.call("send_group_msg", {"group_id": self.group_id, "message": message})
+
+    async def send_group_forward_msg(self, messages: List[Dict[str, Any]]) -> Any:
+        """发送群合并转发消息，messages 为node节点列表"""
+        return await self.call("send_group_forward_msg", {"group_id": self.group_id, "messages": messages})
+
+    def close(self) -> None:
+        """关闭线程池和keep-alive连接"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
@@ -0,0 +1,123 @@
+# player_directory.py
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# 部分匹配索引使用的n-gram长度，短于该长度的搜索词直接遍历名称
+NGRAM_SIZE = 3
+
+
+def _ngrams(text: str) -> Set[str]:
+    return {text[i:i + NGRAM_SIZE] for i in range(len(text) - NGRAM_SIZE + 1)}
+
+
+class PlayerDirectory:
+    """
+    在线玩家名称到ID的索引
+
+    同时维护精确名称字典、casefold后的名称字典和n-gram倒排索引，
+    精确和忽略大小写的查找是一次字典访问，部分匹配先用n-gram求交集再校验子串，
+    由 RosterCache 在名单变化时增量更新
+    """
+
+    def __init__(self):
+        self._ids: Dict[str, str] = {}  # 名称 -> ID
+        self._folded: Dict[str, List[str]] = {}  # casefold后的名称 -> 名称列表
+        self._grams: Dict[str, Set[str]] = {}  # n-gram -> casefold后的名称集合
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._ids
+
+    def add(self, name: str, player_id: str) -> None:
+        """添加或更新一名玩家"""
+        if name in self._ids:
+            self._ids[name] = player_id
+            return
+
+        self._ids[name] = player_id
+        folded = name.casefold()
+        names = self._folded.setdefault(folded, [])
+        names.append(name)
+        if len(names) == 1:
+            for gram in _ngrams(folded):
+                self._grams.setdefault(gram, set()).add(folded)
+
+    def remove(self, name: str) -> None:
+        """移除一名玩家，名称不存在时忽略"""
+        if self._ids.pop(name, None) is None:
+            return
+
+        folded = name.casefold()
+        names = self._folded[folded]
+        names.remove(name)
+        if names:
+            return
+
+        del self._folded[folded]
+        for gram in _ngrams(folded):
+            bucket = self._grams.get(gram)
+            if bucket is not None:
+                bucket.discard(folded)
+                if not bucket:
+                    del self._grams[gram]
+
+    def replace_all(self, players: Iterable[Tuple[str, str]]) -> None:
+        """用 (名称, ID) 列表整体替换索引"""
+        self._ids.clear()
+        self._folded.clear()
+        self._grams.clear()
+        for name, player_id in players:
+            self.add(name, player_id)
+
+    def get_id(self, name: str) -> Optional[str]:
+        """按完整名称精确查找ID"""
+        return self._ids.get(name)
+
+    def find(self, name: str) -> Optional[Tuple[str, str]]:
+        """
+        按名称查找玩家，依次尝试精确匹配、忽略大小写匹配和部分匹配
+
+        Returns:
+            (玩家名称, 玩家ID)，没有匹配时返回None
+        """
+        player_id = self._ids.get(name)
+        if player_id is not None:
+            return name, player_id
+
+        names = self._folded.get(name.casefold())
+        if names:
+            return names[0], self._ids[names[0]]
+
+        matches = self.search(name)
+        return matches[0] if matches else None
+
+    def search(self, term: str) -> List[Tuple[str, str]]:
+        """
+        查找名称中包含搜索词（忽略大小写）的玩家
+
+        Returns:
+            按名称排序的 (玩家名称, 玩家ID) 列表
+        """
+        folded_term = term.casefold()
+        if not folded_term:
+            return []
+
+        if len(folded_term) < NGRAM_SIZE:
+            candidates = self._folded.keys()
+        else:
+            buckets = [self._grams.get(gram) for gram in _ngrams(folded_term)]
+            if not all(buckets):
+                return []
+            buckets.sort(key=len)
+            candidates = set.intersection(*buckets)
+
+        return sorted(
+            (name, self._ids[name])
+            for folded in candidates if folded_term in folded
+            for name in self._folded[folded]
+        )
+
+    def items(self) -> List[Tuple[str, str]]:
+        """全部 (玩家名称, 玩家ID)"""
+        return list(self._ids.items())
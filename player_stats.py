@@ -0,0 +1,112 @@
+# player_stats.py
+import asyncio
+from collections import defaultdict
+from typing import Any, Dict, Optional
+
+from Log import log
+from dataStorage import DataStorage, PLAYER_STAT_COLUMNS
+
+logger = log()
+
+# 定时写入数据库的间隔（秒）
+STATS_FLUSH_INTERVAL_SEC = 5
+
+# 累积的统计事件达到该数量时提前写入
+STATS_FLUSH_THRESHOLD = 200
+
+
+class PlayerStatsAggregator:
+    """
+    玩家统计写后缓存
+
+    击杀、死亡等事件只在内存中按玩家ID累加，由后台任务定时或在累积过多时
+    通过 DataStorage.increment_player_stats 在一个事务中写入，关闭时必须调用 close()
+    """
+
+    def __init__(self, data: DataStorage, flush_interval: float = STATS_FLUSH_INTERVAL_SEC,
+                 flush_threshold: int = STATS_FLUSH_THRESHOLD):
+        self.data = data
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._pending_events = 0
+        self._flush_requested = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, player_id: str, name: str, **increments: int) -> None:
+        """
+        记录一个玩家的统计增量
+
+        Args:
+            player_id: 玩家ID
+            name: 玩家名称，玩家不在数据库中时用于新建记录
+            **increments: 统计列及其增量，如 total_kill=1
+        """
+        stats = self._pending.get(player_id)
+        if stats is None:
+            stats = self._pending[player_id] = defaultdict(int)
+        stats['name'] = name
+        for column, value in increments.items():
+            if column not in PLAYER_STAT_COLUMNS:
+                raise ValueError(f"未知的统计列: {column}")
+            stats[column] += value
+
+        self._pending_events += 1
+        if self._pending_events >= self.flush_threshold:
+            self._flush_requested.set()
+
+    async def flush(self) -> bool:
+        """把当前累积的统计写入数据库，失败时把数据并回缓存等待下次写入"""
+        async with self._flush_lock:
+            if not self._pending:
+                return True
+
+            batch, self._pending = self._pending, {}
+            events, self._pending_events = self._pending_events, 0
+
+            success = await self.data.async_increment_player_stats(batch)
+            if success:
+                logger.debug(f"写入 {len(batch)} 个玩家的统计（{events} 个事件）")
+                return True
+
+            # 写入期间新记录的增量与失败的批次合并
+            for player_id, stats in batch.items():
+                merged = self._pending.setdefault(player_id, defaultdict(int))
+                merged.setdefault('name', stats['name'])
+                for column in PLAYER_STAT_COLUMNS:
+                    if column in stats:
+                        merged[column] += stats[column]
+            self._pending_events += events
+            logger.error(f"写入玩家统计失败，{len(batch)} 个玩家的数据将在下次重试")
+            return False
+
+    async def run(self) -> None:
+        """后台写入循环"""
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            try:
+                # 任务被取消时让正在进行的写入完成，close() 会等待它并写入剩余数据
+                await asyncio.shield(self.flush())
+            except Exception as e:
+                logger.error(f"玩家统计写入循环出错: {e}")
+
+    def start(self) -> asyncio.Task:
+        """启动后台写入任务"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run(), name="PlayerStats")
+        return self._task
+
+    async def close(self) -> None:
+        """停止后台任务并写入剩余的统计"""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
@@ -4,11 +4,14 @@ import os
 import time
 from typing import Optional
 
-import requests
-
 from Log import log
-from connection import HLLConnection, async_close_all
-from customCMDs import Context, qq_Commands
+from dedup import BoundedSet
+from connection import AsyncHLLConnection, async_close_all
+from customCMDs import ctx, qq_Commands, qq_registry
+from credentials_manager import credentials_cache_report
+from napcat_client import NapCatClient
+from qq_executor import CommandExecutor
+from qq_ingest import QQ_INBOX_SIZE, HistoryPoller, PushReceiver, QQMessage
 
 # 设置日志
 logger = log()
@@ -17,10 +20,10 @@ logger = log()
 last_activity = time.time()
 keepalive_interval = 30  # 保活间隔（秒）
 max_idle_time = 60  # 最大空闲时间（秒）
-processed_messages = set()  # 存储已处理的消息ID
-
-# 正在处理中的连接请求计数
-pending_connection_requests = 0
+# 已处理的QQ消息ID，推送和轮询可能重复投递同一条消息
+QQ_DEDUP_SIZE = 1000
+QQ_DEDUP_TTL_SEC = 3600
+processed_messages = BoundedSet(QQ_DEDUP_SIZE, ttl=QQ_DEDUP_TTL_SEC)
 
 
 def _command_prefix(message: str) -> str:
@@ -28,27 +31,22 @@ def _command_prefix(message: str) -> str:
 
 
 class Bot:
-    def __init__(self, qq_group, read_amount, port, admin=None, ignore=None):
+    def __init__(self, qq_group, read_amount, port, admin=None, ignore=None, push_port=0, push_secret=""):
         self.port = port
         self.admin = admin if admin else []  # 初始化为空列表，后面会从数据库加载
         self.read_amount = read_amount
         self.qq_group = qq_group
         self.ignore = ignore if ignore else []
-        self.receive_url = f"http://127.0.0.1:{self.port}/get_group_msg_history"
-        self.send_url = f"http://127.0.0.1:{self.port}/send_group_msg"
-        self.receive_payload = {
-            "group_id": qq_group,
-            "message_seq": "0",
-            "count": read_amount,
-            "reverseOrder": False
-        }
-        self.send_payload = {
-            "group_id": qq_group,
-            "message": ""
-        }
-        self.headers_bot = {
-            'Content-Type': 'application/json'
-        }
+        # NapCat接口客户端，请求在专用线程池中执行，不阻塞事件循环
+        self.client = NapCatClient(self.port, qq_group)
+        # 推送接收端口，为0时使用轮询
+        self.push_port = int(push_port or 0)
+        self.push_secret = push_secret
+        # 推送或轮询收到的全部群消息
+        self.inbox: asyncio.Queue[QQMessage] = asyncio.Queue(maxsize=QQ_INBOX_SIZE)
+        self.ingest = None
+        # 并发执行QQ命令，同一用户的命令保持顺序并单独限速
+        self.executor: Optional[CommandExecutor] = None
 
     def update_admin_list(self, new_admin_list):
         """更新管理员列表"""
@@ -89,12 +87,19 @@ class LoginInformation:
 
         credentials = {}
         try:
-            with open(self.file_path, 'r') as file:
-                for line in file:
-                    line = line.strip()
-                    if line and '=' in line:
-                        key, value = line.split('=', 1)
-                        credentials[key] = value
+            # 配置文件可能以UTF-8或GBK（Windows记事本默认）保存
+            with open(self.file_path, 'rb') as file:
+                raw = file.read()
+            try:
+                content = raw.decode('utf-8-sig')
+            except UnicodeDecodeError:
+                content = raw.decode('gbk')
+
+            for line in content.splitlines():
+                line = line.strip()
+                if line and '=' in line:
+                    key, value = line.split('=', 1)
+                    credentials[key] = value
         except Exception as e:
             log.error(f"Error reading file: {e}")
 
@@ -109,40 +114,21 @@ class LoginInformation:
         f.write("# 屏蔽的qq号\nignore=[3821743226]\n\n")
         f.write("read_amount=1\n")
         f.write("qq_group=532933387\n")
+        f.write("# NapCat HTTP上报端口，为0时轮询群消息历史\n")
+        f.write("qq_push_port=0\n")
+        f.write("qq_push_secret=\n")
 
 
-async def get_connection() -> Optional[HLLConnection]:
-    """获取一个可用的连接，使用正确的异步方式"""
-    global pending_connection_requests
-
+async def get_connection() -> Optional[AsyncHLLConnection]:
+    """获取一个可用的连接，连接池已满时异步等待其他命令归还连接"""
     try:
-        # 增加等待连接计数，用于防止连接风暴
-        pending_connection_requests += 1
-
-        # 如果有太多挂起的请求，则立即返回None
-        if pending_connection_requests > 5:
-            logger.warning(f"已有 {pending_connection_requests} 个连接请求，正在等待...")
-            return None
-
-        # 使用同步方法获取连接
-        conn = ctx.connection_pool.get_connection()
-
-        # 如果没有可用连接，等待一下再尝试一次
-        if conn is None:
-            logger.info("没有可用连接，等待500ms后重试...")
-            await asyncio.sleep(0.5)
-            conn = ctx.connection_pool.get_connection()
-
-        return conn
+        return await ctx.connection_pool.get_connection()
     except Exception as e:
         # logger.error(f"获取连接失败: {e}")
         return None
-    finally:
-        # 减少挂起请求计数
-        pending_connection_requests -= 1
 
 
-async def release_connection(conn: Optional[HLLConnection]):
+async def release_connection(conn: Optional[AsyncHLLConnection]):
     """安全地释放连接回连接池"""
     if conn is None:
         # 不需要处理None连接
@@ -170,7 +156,7 @@ async def send_command(command: str) -> str:
                 continue
 
             # 使用连接发送命令
-            response = conn.send_command(command)
+            response = await conn.send_command(command)
             return response
         except Exception as e:
             logger.error(f"发送命令失败 (尝试 {attempt + 1}/{retries}): {e}")
@@ -243,18 +229,14 @@ async def handle_qq_message(message: list[str], is_admin: bool = False) -> None:
         # 发送响应到QQ
         if isinstance(response, str):
             # 普通文本消息
-            payload = bot.send_payload.copy()  # 创建副本避免修改原始对象
-            payload["message"] = response
-            qq_response = requests.post(bot.send_url, json=payload, headers=bot.headers_bot)
+            qq_response = await bot.client.send_group_msg(response)
         elif isinstance(response, list):
             # 合并转发消息
             payload = await send_forward_message(response)
-            # 使用正确的合并转发API
-            forward_url = f"http://127.0.0.1:{bot.port}/send_group_forward_msg"
-            qq_response = requests.post(forward_url, json=payload, headers=bot.headers_bot)
+            qq_response = await bot.client.send_group_forward_msg(payload["messages"])
         
         if qq_response:
-            logger.info(f"发送消息到QQ: {qq_response.json()}")
+            logger.info(f"发送消息到QQ: {qq_response}")
         logger.info(f"执行命令: {message}, 响应: {response} | {type(response)}")
     except Exception as e:
         logger.error(f"处理QQ消息时出错: {e}", exc_info=True)
@@ -282,90 +264,61 @@ async def keepalive_loop():
             await asyncio.sleep(5)  # 出错后等待更长时间
 
 
-async def receive_qq_message():
-    global processed_messages
+async def start_ingestion():
+    """启动QQ消息接收，优先使用NapCat推送，未配置或无法监听端口时改为轮询"""
+    if bot.push_port:
+        receiver = PushReceiver(bot.inbox, bot.qq_group, bot.push_port, secret=bot.push_secret)
+        try:
+            await receiver.start()
+            bot.ingest = receiver
+            return
+        except OSError as e:
+            logger.error(f"无法监听QQ推送端口 {bot.push_port}: {e}，改为轮询消息历史")
 
-    # 清理过旧的消息ID，防止集合过大
-    if len(processed_messages) > 100:
-        logger.info(f"清理消息ID集合，当前大小: {len(processed_messages)}")
-        processed_messages.clear()
+    poller = HistoryPoller(bot.client, bot.inbox)
+    poller.start()
+    bot.ingest = poller
+    logger.info("QQ消息接收使用轮询模式")
 
-    while True:
-        try:
-            response = requests.post(bot.receive_url, json=bot.receive_payload, headers=bot.headers_bot)
-            res = response.json().get('data').get("messages")
 
-            if not res:
-                await asyncio.sleep(0.5)
-                continue
-            if bot.msg_listener(res, "qq") in bot.ignore:
-                continue
-            # 获取消息ID并检查是否已处理过
-            message_id = bot.msg_listener(res, "id")
-            if message_id and str(message_id) in processed_messages:
-                logger.debug(f"跳过已处理的消息ID: {message_id}")
-                await asyncio.sleep(0.5)
-                continue
+async def receive_qq_message():
+    """从消息队列取出下一条消息，返回 (命令, 是否管理员, QQ号)，不是待处理的命令时返回None"""
+    message = await bot.inbox.get()
 
-            # 添加到已处理集合
-            if message_id:
-                processed_messages.add(str(message_id))
-                logger.debug(f"添加消息ID到已处理集合: {message_id}")
-
-            is_admin = bot.msg_listener(res, "role")
-            qq_id = bot.msg_listener(res, "qq")
-
-            # 确保qq_id和ignore中的元素类型匹配
-            if qq_id is not None and bot.ignore:
-                # 转换qq_id和ignore为同一类型进行比较
-                try:
-                    if isinstance(qq_id, int):
-                        ignore_list = [int(x) if isinstance(x, str) and x.isdigit() else x for x in bot.ignore]
-                        if qq_id in ignore_list:
-                            continue
-                    else:
-                        if str(qq_id) in [str(x) for x in bot.ignore]:
-                            continue
-                except Exception as e:
-                    logger.error(f"类型转换出错: {e}")
-                    continue
+    # 确保qq_id和ignore中的元素类型匹配
+    if message.user_id in [str(x) for x in bot.ignore]:
+        return None
 
-            try:
-                res = ''.join(res[0].get('message'))
-                if not res.strip():  # 忽略空消息
-                    continue
-            except IndexError:
-                continue
-            except TypeError as e:
-                logger.error(f"消息拼接出错: {e}")
-                continue
+    # 检查消息ID是否已处理过
+    if not processed_messages.add(message.message_id):
+        logger.debug(f"跳过已处理的消息ID: {message.message_id}")
+        return None
 
-            res = res.split(" ", 1)
-            if len(res) == 1:
-                res.append("")  # 确保res至少有两个元素
+    res = message.text
+    if not res.strip():  # 忽略空消息
+        return None
 
-            logger.info(f"收到新消息: {res[0]}, 消息ID: {message_id}, 是否管理员: {is_admin}")
-            res[0] = _command_prefix(res[0])
-            if not res[0]:
-                return
-            return res, is_admin
-        except Exception as e:
-            logger.error(f"receive_qq_message出错: {e}")
-            await asyncio.sleep(1)
-            return None, False
+    res = res.split(" ", 1)
+    if len(res) == 1:
+        res.append("")  # 确保res至少有两个元素
+
+    is_admin = message.user_id in bot.admin
+    logger.info(f"收到新消息: {res[0]}, 消息ID: {message.message_id}, 是否管理员: {is_admin}")
+    res[0] = _command_prefix(res[0])
+    if not res[0]:
+        return None
+    return res, is_admin, message.user_id
 
 
 async def qq_bot():
     """QQ机器人主循环"""
     keepalive_task = None  # 初始化变量
-    last_message_time = time.time()  # 上次处理消息的时间
     last_admin_refresh_time = time.time()  # 上次刷新管理员列表的时间
     admin_refresh_interval = 60  # 管理员列表刷新间隔（秒）
-    min_message_interval = 0.5  # 最小消息处理间隔（秒）
 
     try:
         # 首次加载管理员列表
-        admin_list = ctx.data.get_all_qq_admins()
+        admin_list = await ctx.data.async_get_all_qq_admins()
         if admin_list:
             bot.update_admin_list(admin_list)
             logger.info(f"从数据库加载管理员列表: {admin_list}")
@@ -374,6 +327,8 @@ async def qq_bot():
         # keepalive_task = asyncio.create_task(keepalive_loop())
 
         # 初始化QQ机器人连接
+        bot.executor = CommandExecutor()
+        await start_ingestion()
         logger.info("QQ机器人启动完成，正在监听消息...")
 
         while True:
@@ -381,28 +336,17 @@ async def qq_bot():
                 # 定期刷新管理员列表
                 current_time = time.time()
                 if current_time - last_admin_refresh_time > admin_refresh_interval:
-                    admin_list = ctx.data.get_all_qq_admins()
+                    admin_list = await ctx.data.async_get_all_qq_admins()
                     bot.update_admin_list(admin_list)
                     last_admin_refresh_time = current_time
 
                 # 接收QQ消息
                 message = await receive_qq_message()
 
-                # 处理消息，包含频率限制
+                # 交给执行器处理，不等待命令完成，限速由执行器按用户进行
                 if message:
-                    current_time = time.time()
-                    time_since_last_message = current_time - last_message_time
-
-                    if time_since_last_message < min_message_interval:
-                        # 如果距离上次处理消息时间太短，等待一下
-                        await asyncio.sleep(min_message_interval - time_since_last_message)
-
-                    # 处理消息
-                    await handle_qq_message(message[0], message[1])
-                    last_message_time = time.time()
-
-                # 适当等待，避免CPU使用率过高
-                await asyncio.sleep(0.2)
+                    command, is_admin, qq_id = message
+                    bot.executor.submit(qq_id, handle_qq_message, command, is_admin)
             except Exception as e:
                 logger.error(f"QQ机器人循环出错: {e}")
                 await asyncio.sleep(1)
@@ -425,11 +369,20 @@ async def main():
     try:
         # 初始化上下文
         await ctx.initialize()
+        logger.info(credentials_cache_report())
 
         logger.info("启动QQ机器人...")
         await qq_bot()
     except Exception as e:
         logger.error(f"QQ机器人异常: {e}")
+    finally:
+        if bot.ingest is not None:
+            await bot.ingest.close()
+        if bot.executor is not None:
+            logger.info(bot.executor.metrics().summary())
+            await bot.executor.close()
+        logger.info(qq_registry.summary())
+        bot.client.close()
 
 
 if __name__ == "__main__":
@@ -443,9 +396,9 @@ if __name__ == "__main__":
         qq_group=credentials.get("qq_group", "532933387"),
         read_amount=credentials.get("read_amount", "1"),
         port=credentials.get("port", "3000"),
-        ignore=ignore_list
+        ignore=ignore_list,
+        push_port=credentials.get("qq_push_port", "0"),
+        push_secret=credentials.get("qq_push_secret", "")
     )
 
-    # 初始化连接池
-    ctx = Context()
     asyncio.run(main())
@@ -0,0 +1,185 @@
+# qq_executor.py
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, NamedTuple, Optional, Tuple
+
+from Log import log
+
+logger = log()
+
+# 同时执行的QQ命令数上限
+QQ_COMMAND_CONCURRENCY = 4
+
+# 每个用户的命令速率：平均每秒条数和允许的突发条数
+QQ_USER_RATE = 1.0
+QQ_USER_BURST = 3
+
+# 每个用户排队等待的命令上限，超出时丢弃新命令
+QQ_USER_QUEUE_LIMIT = 10
+
+# 计算延迟分位数保留的样本数
+QQ_LATENCY_SAMPLES = 200
+
+# 记录执行器指标的间隔（秒）
+QQ_METRICS_REPORT_SEC = 300
+
+
+class ExecutorMetrics(NamedTuple):
+    """QQ命令执行器指标"""
+    queued: int  # 排队等待的命令数
+    running: int  # 正在执行的命令数
+    users: int  # 有待处理命令的用户数
+    executed: int
+    failed: int
+    rejected: int
+    avg_wait: float  # 平均排队时间（秒）
+    avg_latency: float  # 平均从收到到执行完成的时间（秒）
+    p95_latency: float
+    max_latency: float
+
+    def summary(self) -> str:
+        return (f"QQ命令: 排队 {self.queued}，执行中 {self.running}，用户 {self.users}，"
+                f"已执行 {self.executed}（失败 {self.failed}，丢弃 {self.rejected}），"
+                f"平均排队 {self.avg_wait * 1000:.0f}ms，平均延迟 {self.avg_latency * 1000:.0f}ms，"
+                f"P95 {self.p95_latency * 1000:.0f}ms，最大 {self.max_latency * 1000:.0f}ms")
+
+
+class _UserLane:
+    """单个用户的命令队列和令牌桶"""
+    __slots__ = ("pending", "tokens", "updated", "task")
+
+    def __init__(self, burst: int, now: float):
+        self.pending: Deque[Tuple[float, Callable[..., Awaitable[Any]], tuple]] = deque()
+        self.tokens = float(burst)
+        self.updated = now
+        self.task: Optional[asyncio.Task] = None
+
+
+class CommandExecutor:
+    """
+    QQ命令执行器
+
+    不同用户的命令并发执行，总并发数受限；同一用户的命令按收到的顺序逐条执行，
+    并按令牌桶限速，只延后超速用户自己的命令，不影响其他管理员
+    """
+
+    def __init__(self, concurrency: int = QQ_COMMAND_CONCURRENCY, rate: float = QQ_USER_RATE,
+                 burst: int = QQ_USER_BURST, queue_limit: int = QQ_USER_QUEUE_LIMIT,
+                 report_interval: float = QQ_METRICS_REPORT_SEC):
+        self.rate = rate
+        self.burst = burst
+        self.queue_limit = queue_limit
+        self.report_interval = report_interval
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._lanes: Dict[str, _UserLane] = {}
+        self._running = 0
+        self._executed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._total_wait = 0.0
+        self._total_latency = 0.0
+        self._max_latency = 0.0
+        self._latencies: Deque[float] = deque(maxlen=QQ_LATENCY_SAMPLES)
+        self._last_report = time.monotonic()
+
+    def submit(self, user_id: str, func: Callable[..., Awaitable[Any]], *args) -> bool:
+        """
+        提交一条命令
+
+        Args:
+            user_id: 发送命令的QQ号，同一QQ号的命令按顺序执行
+            func: 执行命令的协程函数，以 func(*args) 调用
+
+        Returns:
+            命令被接受时返回True，该用户排队的命令过多时返回False
+        """
+        now = time.monotonic()
+        lane = self._lanes.get(user_id)
+        if lane is None:
+            lane = self._lanes[user_id] = _UserLane(self.burst, now)
+
+        if len(lane.pending) >= self.queue_limit:
+            self._rejected += 1
+            logger.warning(f"QQ用户 {user_id} 排队的命令过多，丢弃新命令")
+            return False
+
+        lane.pending.append((now, func, args))
+        if lane.task is None:
+            lane.task = asyncio.create_task(self._drain(user_id, lane), name=f"QQCommand-{user_id}")
+        return True
+
+    def _take_token(self, lane: _UserLane) -> float:
+        """取一个令牌，返回需要等待的秒数"""
+        now = time.monotonic()
+        lane.tokens = min(self.burst, lane.tokens + (now - lane.updated) * self.rate)
+        lane.updated = now
+        if lane.tokens >= 1:
+            lane.tokens -= 1
+            return 0.0
+        wait = (1 - lane.tokens) / self.rate
+        lane.tokens = 0.0
+        lane.updated = now + wait
+        return wait
+
+    async def _drain(self, user_id: str, lane: _UserLane) -> None:
+        """按顺序执行一个用户的全部待处理命令"""
+        try:
+            while lane.pending:
+                wait = self._take_token(lane)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+
+                received, func, args = lane.pending[0]
+                async with self._semaphore:
+                    started = time.monotonic()
+                    self._running += 1
+                    try:
+                        await func(*args)
+                    except Exception as e:
+                        self._failed += 1
+                        logger.error(f"执行QQ用户 {user_id} 的命令出错: {e}")
+                    finally:
+                        self._running -= 1
+                lane.pending.popleft()
+                self._record(started - received, time.monotonic() - received)
+        finally:
+            # 保留空闲用户的令牌桶，否则等队列清空后再发命令就能绕过限速
+            lane.task = None
+
+    def _record(self, wait: float, latency: float) -> None:
+        self._executed += 1
+        self._total_wait += wait
+        self._total_latency += latency
+        self._max_latency = max(self._max_latency, latency)
+        self._latencies.append(latency)
+
+        now = time.monotonic()
+        if now - self._last_report >= self.report_interval:
+            self._last_report = now
+            logger.info(self.metrics().summary())
+
+    def metrics(self) -> ExecutorMetrics:
+        samples = sorted(self._latencies)
+        p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))] if samples else 0.0
+        executed = self._executed or 1
+        return ExecutorMetrics(
+            queued=sum(len(lane.pending) for lane in self._lanes.values()) - self._running,
+            running=self._running,
+            users=sum(1 for lane in self._lanes.values() if lane.pending),
+            executed=self._executed,
+            failed=self._failed,
+            rejected=self._rejected,
+            avg_wait=self._total_wait / executed,
+            avg_latency=self._total_latency / executed,
+            p95_latency=p95,
+            max_latency=self._max_latency,
+        )
+
+    async def close(self) -> None:
+        """取消所有未完成的命令"""
+        tasks = [lane.task for lane in self._lanes.values() if lane.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._lanes.clear()
@@ -0,0 +1,240 @@
+# qq_ingest.py
+import asyncio
+import hashlib
+import hmac
+import json
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from Log import log
+from napcat_client import NapCatClient, NapCatError
+
+logger = log()
+
+# 推送模式默认监听地址，NapCat 的 HTTP上报 地址应配置为 http://127.0.0.1:<端口>/
+QQ_PUSH_HOST = "127.0.0.1"
+
+# 轮询模式每次拉取的消息数，两次轮询之间新消息超过该数量时较早的消息会丢失
+QQ_POLL_BATCH = 20
+
+# 轮询间隔（秒）
+QQ_POLL_INTERVAL_SEC = 0.5
+
+# 待处理消息队列上限
+QQ_INBOX_SIZE = 1000
+
+# 读取一次上报请求（请求行、头部和请求体）的超时（秒），防止连接不发完请求一直占用
+QQ_PUSH_READ_TIMEOUT_SEC = 5
+
+# 上报请求体上限（字节）
+_MAX_BODY = 1024 * 1024
+
+
+class QQMessage(NamedTuple):
+    """一条群消息"""
+    message_id: str
+    message_seq: int
+    user_id: str
+    text: str
+
+
+def _message_text(message: Any) -> str:
+    """消息内容可能是字符串，也可能是OneBot消息段数组，只保留文本段"""
+    if isinstance(message, str):
+        return message
+    if isinstance(message, list):
+        return ''.join(segment.get("data", {}).get("text", "")
+                       for segment in message
+                       if isinstance(segment, dict) and segment.get("type") == "text")
+    return ""
+
+
+def parse_onebot_message(event: Dict[str, Any]) -> Optional[QQMessage]:
+    """把NapCat上报事件或历史消息转换为QQMessage，无法识别时返回None"""
+    message_id = event.get("message_id")
+    user_id = event.get("user_id")
+    if message_id is None or user_id is None:
+        return None
+
+    text = _message_text(event.get("message"))
+    if not text:
+        text = event.get("raw_message") or ""
+
+    try:
+        message_seq = int(event.get("message_seq") or event.get("real_seq") or 0)
+    except (TypeError, ValueError):
+        message_seq = 0
+    return QQMessage(str(message_id), message_seq, str(user_id), text)
+
+
+def _enqueue(inbox: asyncio.Queue, message: QQMessage) -> bool:
+    try:
+        inbox.put_nowait(message)
+        return True
+    except asyncio.QueueFull:
+        logger.warning(f"QQ消息队列已满，丢弃消息: {message.message_id}")
+        return False
+
+
+class PushReceiver:
+    """
+    接收NapCat HTTP上报的本地服务器
+
+    每个群消息事件都直接放入队列，不再依赖轮询，突发的多条消息不会丢失。
+    配置了secret时校验 X-Signature 头（HMAC-SHA1）
+    """
+
+    def __init__(self, inbox: asyncio.Queue, group_id, port: int, host: str = QQ_PUSH_HOST,
+                 secret: str = ""):
+        self.inbox = inbox
+        self.group_id = str(group_id)
+        self.host = host
+        self.port = port
+        self.secret = secret.encode() if secret else b""
+        self.received = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> None:
+        """开始监听，端口被占用等情况抛出OSError"""
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        logger.info(f"QQ消息推送接收已启动: http://{self.host}:{self.port}/")
+
+    def _verify(self, headers: Dict[str, str], body: bytes) -> bool:
+        if not self.secret:
+            return True
+        expected = "sha1=" + hmac.new(self.secret, body, hashlib.sha1).hexdigest()
+        # 头部按latin-1解码，可能含非ASCII字符，按字节比较，不一致时返回403而不是抛出TypeError
+        return hmac.compare_digest(headers.get("x-signature", "").encode("latin-1"), expected.encode())
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> str:
+        """读取并处理一个上报请求，返回响应状态"""
+        request_line = await reader.readline()
+        method = request_line.split(b" ", 1)[0]
+        headers: Dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get("content-length", 0))
+        if method != b"POST":
+            return "405 Method Not Allowed"
+        if length > _MAX_BODY:
+            return "413 Payload Too Large"
+
+        body = await reader.readexactly(length)
+        if not self._verify(headers, body):
+            logger.warning("QQ推送签名校验失败")
+            return "403 Forbidden"
+
+        event = json.loads(body)
+        if not isinstance(event, dict):
+            raise ValueError(f"上报内容不是JSON对象: {type(event).__name__}")
+        self._dispatch(event)
+        return "204 No Content"
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            status = await asyncio.wait_for(self._read_request(reader), QQ_PUSH_READ_TIMEOUT_SEC)
+        except asyncio.TimeoutError:
+            status = "408 Request Timeout"
+            logger.warning("读取QQ推送请求超时")
+        except (ValueError, asyncio.IncompleteReadError) as e:
+            status = "400 Bad Request"
+            logger.warning(f"无法解析QQ推送请求: {e}")
+        except Exception as e:
+            status = "500 Internal Server Error"
+            logger.error(f"处理QQ推送请求出错: {e}")
+
+        try:
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n".encode())
+            await writer.drain()
+        finally:
+            writer.close()
+
+    def _dispatch(self, event: Dict[str, Any]) -> None:
+        if event.get("post_type") != "message" or event.get("message_type") != "group":
+            return
+        if str(event.get("group_id")) != self.group_id:
+            return
+        message = parse_onebot_message(event)
+        if message is not None and _enqueue(self.inbox, message):
+            self.received += 1
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+
+class HistoryPoller:
+    """
+    轮询模式：定期拉取最近一批群消息，把上次之后的全部消息按顺序放入队列
+
+    启动后的第一次拉取只记录位置，不重复执行重启前的命令
+    """
+
+    def __init__(self, client: NapCatClient, inbox: asyncio.Queue, batch: int = QQ_POLL_BATCH,
+                 interval: float = QQ_POLL_INTERVAL_SEC):
+        self.client = client
+        self.inbox = inbox
+        self.batch = batch
+        self.interval = interval
+        self.last_seq: Optional[int] = None
+        self.received = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def _new_messages(self, raw_messages: List[Dict[str, Any]]) -> List[QQMessage]:
+        messages = sorted((message for message in map(parse_onebot_message, raw_messages) if message is not None),
+                          key=lambda message: message.message_seq)
+        if not messages:
+            if self.last_seq is None:
+                self.last_seq = 0
+            return []
+
+        if self.last_seq is None:
+            self.last_seq = messages[-1].message_seq
+            return []
+
+        new = [message for message in messages if message.message_seq > self.last_seq]
+        if len(new) == len(messages) == self.batch:
+            logger.warning(f"两次轮询之间的QQ消息超过 {self.batch} 条，较早的消息可能未处理")
+        if new:
+            self.last_seq = new[-1].message_seq
+        return new
+
+    async def poll(self) -> int:
+        """拉取一次，返回放入队列的消息数"""
+        raw_messages = await self.client.get_group_msg_history(0, self.batch)
+        count = 0
+        for message in self._new_messages(raw_messages):
+            if _enqueue(self.inbox, message):
+                count += 1
+        self.received += count
+        return count
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.poll()
+            except NapCatError as e:
+                logger.error(f"拉取QQ消息失败: {e}")
+                await asyncio.sleep(1)
+            except Exception as e:
+                logger.error(f"QQ消息轮询出错: {e}")
+                await asyncio.sleep(1)
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> asyncio.Task:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run(), name="QQPoller")
+        return self._task
+
+    async def close(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
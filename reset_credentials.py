@@ -5,7 +5,7 @@
 import os
 import sys
 import traceback
-from credentials_manager import CredentialsManager
+from credentials_manager import CredentialsManager, invalidate_credentials_cache
 
 
 def main():
@@ -27,6 +27,9 @@ def main():
                 print("操作已取消。")
                 return
 
+            # 旧凭证即将作废，丢弃本进程中缓存的密钥和凭证
+            invalidate_credentials_cache()
+
         # 提示用户输入新的凭证
         print("\n请输入新的服务器连接信息:")
         host = input("服务器IP地址: ").strip()
@@ -0,0 +1,304 @@
+# roster.py
+import asyncio
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from Log import log
+from commands import Commands
+from player_directory import PlayerDirectory
+
+logger = log()
+
+# 通过 get playerids 和 playerinfo 全量刷新名单的间隔（秒）
+ROSTER_SWEEP_SEC = 60
+
+# 刷新名单时同时进行的 playerinfo 请求数，给日志循环留出连接池中的连接
+ROSTER_SWEEP_CONCURRENCY = 2
+
+# 车组兵种，角色名称不区分大小写
+TANK_ROLES = ("tankcommander", "crewman")
+
+
+class RosterEntry(NamedTuple):
+    """名单中的一名在线玩家"""
+    player_id: str
+    name: str
+    team: Optional[str] = None
+    role: Optional[str] = None
+    unit: Optional[str] = None
+
+
+def is_tank_role(role: Optional[str]) -> bool:
+    """判断角色是否为车组兵种"""
+    return bool(role) and any(tank_role in role.lower() for tank_role in TANK_ROLES)
+
+
+def parse_playerids(result: str) -> List[Tuple[str, str]]:
+    """
+    解析 get playerids 的返回值
+
+    Args:
+        result: 形如 "数量\\t名称 : ID\\t名称 : ID" 的原始结果
+
+    Returns:
+        (玩家名称, 玩家ID) 列表
+    """
+    players = []
+    if not result:
+        return players
+    for entry in result.split("\t")[1:]:
+        if " : " not in entry:
+            continue
+        name, player_id = entry.rsplit(" : ", 1)
+        name, player_id = name.strip(), player_id.strip()
+        if name and player_id:
+            players.append((name, player_id))
+    return players
+
+
+def parse_player_info(info_str: str) -> Dict[str, Any]:
+    """
+    解析玩家信息字符串为字典
+
+    Args:
+        info_str: 玩家信息字符串
+
+    Returns:
+        包含玩家信息的字典
+    """
+    if not info_str or not isinstance(info_str, str):
+        return {}
+
+    info_dict = {}
+    lines = info_str.strip().split('\n')
+
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+
+        # 分割键值对
+        if ':' in line:
+            try:
+                key, value = line.split(':', 1)
+                key = key.strip()
+                value = value.strip()
+
+                # 处理特殊键
+                if key == 'Name':
+                    info_dict['name'] = value
+                elif key == 'steamID64':
+                    info_dict['steam_id'] = value
+                elif key == 'Team':
+                    info_dict['team'] = value
+                elif key == 'Role':
+                    info_dict['role'] = value
+                elif key == 'Unit':
+                    info_dict['unit'] = value
+                elif key == 'Loadout':
+                    info_dict['loadout'] = value
+                elif key == 'Kills':
+                    try:
+                        if ' - ' in value:
+                            kills, deaths = value.split(' - ')
+                            info_dict['kills'] = int(kills.replace('Deaths', '').strip())
+                            if 'Deaths:' in deaths:
+                                deaths = deaths.replace('Deaths:', '').strip()
+                            info_dict['deaths'] = int(deaths.strip())
+                        else:
+                            info_dict['kills'] = int(value.strip())
+                            info_dict['deaths'] = 0
+                    except (ValueError, IndexError) as e:
+                        logger.error(f"解析击杀数据出错: {e}, 原始值: {value}")
+                        info_dict['kills'] = 0
+                        info_dict['deaths'] = 0
+                elif key == 'Score':
+                    # 解析分数
+                    try:
+                        scores = {}
+                        score_items = value.split(',')
+                        for score in score_items:
+                            if ' ' in score.strip():
+                                score_type, score_value = score.strip().split(' ', 1)
+                                scores[score_type] = int(score_value)
+                        info_dict['scores'] = scores
+                    except Exception as e:
+                        logger.error(f"解析分数出错: {e}, 原始值: {value}")
+                        info_dict['scores'] = {}
+                elif key == 'Level':
+                    try:
+                        info_dict['level'] = int(value)
+                    except ValueError:
+                        logger.error(f"解析等级出错, 原始值: {value}")
+                        info_dict['level'] = 0
+            except Exception as e:
+                logger.error(f"解析玩家信息行出错: {e}, 行内容: {line}")
+
+    # 记录解析结果
+    if info_dict:
+        logger.debug(f"解析到玩家信息: {info_dict}")
+    else:
+        logger.warning(f"未能解析出有效玩家信息，原始内容: {info_str[:100]}...")
+
+    return info_dict
+
+
+class RosterCache:
+    """
+    在线玩家名单缓存
+
+    按玩家ID保存名称、阵营、角色和小队，定时用 get playerids 和 playerinfo 全量刷新，
+    两次刷新之间由 CONNECTED、DISCONNECTED 和 TEAMSWITCH 日志事件增量更新，
+    击杀分类只需查字典，只有名单中没有角色信息的玩家才回退到 RCON 查询；
+    名称索引 directory 随名单一起更新
+    """
+
+    def __init__(self, commands: Commands, sweep_interval: float = ROSTER_SWEEP_SEC,
+                 concurrency: int = ROSTER_SWEEP_CONCURRENCY):
+        self.commands = commands
+        self.sweep_interval = sweep_interval
+        self.concurrency = concurrency
+        self._by_id: Dict[str, RosterEntry] = {}
+        self.directory = PlayerDirectory()
+        self._task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __contains__(self, player_id: str) -> bool:
+        return player_id in self._by_id
+
+    def get(self, player_id: str) -> Optional[RosterEntry]:
+        """按玩家ID取名单条目"""
+        return self._by_id.get(player_id)
+
+    def get_by_name(self, name: str) -> Optional[RosterEntry]:
+        """按完整玩家名称取名单条目"""
+        player_id = self.directory.get_id(name)
+        return self._by_id.get(player_id) if player_id else None
+
+    def entries(self) -> List[RosterEntry]:
+        """当前名单中的全部玩家"""
+        return list(self._by_id.values())
+
+    def _put(self, entry: RosterEntry) -> None:
+        old = self._by_id.get(entry.player_id)
+        if old is not None and old.name != entry.name:
+            self.directory.remove(old.name)
+        self._by_id[entry.player_id] = entry
+        self.directory.add(entry.name, entry.player_id)
+
+    def _remove(self, player_id: str) -> None:
+        old = self._by_id.pop(player_id, None)
+        if old is not None and self.directory.get_id(old.name) == player_id:
+            self.directory.remove(old.name)
+
+    def on_connected(self, player_id: str, name: str) -> None:
+        """玩家进入服务器，角色在下次刷新或首次查询时补全"""
+        old = self._by_id.get(player_id)
+        self._put(old._replace(name=name) if old else RosterEntry(player_id, name))
+
+    def on_disconnected(self, player_id: str) -> None:
+        """玩家离开服务器"""
+        self._remove(player_id)
+
+    def on_teamswitch(self, name: str, new_team: str) -> None:
+        """玩家换边，换边后角色会重新选择，因此清空角色"""
+        player_id = self.directory.get_id(name)
+        if player_id is None:
+            return
+        self._put(self._by_id[player_id]._replace(team=new_team, role=None, unit=None))
+
+    def _apply_player_info(self, player_id: str, name: str, raw: str) -> Optional[RosterEntry]:
+        """用 playerinfo 的返回值更新名单条目"""
+        if not raw or raw == "FAIL":
+            return None
+        info = parse_player_info(raw)
+        if not info:
+            return None
+        entry = RosterEntry(player_id, info.get("name", name), info.get("team"), info.get("role"), info.get("unit"))
+        self._put(entry)
+        return entry
+
+    async def get_role(self, player_id: str, name: str) -> Optional[str]:
+        """
+        取玩家当前角色，名单中没有角色信息时通过 playerinfo 按名称查询
+
+        Args:
+            player_id: 玩家ID
+            name: 玩家名称，playerinfo 只接受名称
+
+        Returns:
+            角色名称，查询失败时返回None
+        """
+        entry = self._by_id.get(player_id)
+        if entry is not None and entry.role:
+            self.hits += 1
+            return entry.role
+
+        self.misses += 1
+        entry = self._apply_player_info(player_id, name, await self.commands.get_player_info(name))
+        return entry.role if entry else None
+
+    async def refresh_ids(self) -> Optional[List[Tuple[str, str]]]:
+        """
+        只用 get playerids 同步在线玩家名单，不查询 playerinfo
+
+        Returns:
+            在线玩家 (名称, ID) 列表，查询失败时返回None并保留现有名单
+        """
+        result = await self.commands.get_playerids()
+        if not result:
+            return None
+
+        players = parse_playerids(result)
+        online = {player_id for _, player_id in players}
+        for player_id in [player_id for player_id in self._by_id if player_id not in online]:
+            self._remove(player_id)
+        for name, player_id in players:
+            old = self._by_id.get(player_id)
+            if old is None or old.name != name:
+                self.on_connected(player_id, name)
+        return players
+
+    async def sweep(self) -> None:
+        """全量刷新名单：同步在线玩家，并为所有在线玩家更新 playerinfo"""
+        players = await self.refresh_ids()
+        if not players:
+            return
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def refresh(name: str, player_id: str) -> None:
+            async with semaphore:
+                raw = await self.commands.get_player_info(name)
+            self._apply_player_info(player_id, name, raw)
+
+        await asyncio.gather(*(refresh(name, player_id) for name, player_id in players), return_exceptions=True)
+        logger.debug(f"名单刷新完成，在线 {len(self._by_id)} 人")
+
+    def stats(self) -> Dict[str, Any]:
+        """名单大小和角色查询的命中情况"""
+        total = self.hits + self.misses
+        return {
+            "players": len(self._by_id),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+    async def run(self) -> None:
+        """后台刷新循环"""
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"刷新玩家名单失败: {e}")
+            await asyncio.sleep(self.sweep_interval)
+
+    def start(self) -> asyncio.Task:
+        """启动后台刷新任务"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run(), name="Roster")
+        return self._task
@@ -0,0 +1,240 @@
+# storage_engine.py
+import asyncio
+import queue
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+from urllib.request import pathname2url
+
+from Log import log
+from storage_profile import STATEMENT_CACHE_SIZE, StorageProfile, apply_profile, get_storage_profile
+
+logger = log()
+
+# 只读连接池大小
+STORAGE_READERS = 2
+
+# 一次组提交最多合并的写操作数
+WRITE_BATCH_MAX = 64
+
+# 等待锁的超时时间（秒）
+SQLITE_TIMEOUT_SEC = 30
+
+_SAVEPOINT = "job"
+
+
+class _WriterConnection(sqlite3.Connection):
+    """
+    写线程使用的连接
+
+    组提交期间每个写操作运行在自己的保存点内，
+    操作内部调用 commit() 不会提前提交整个批次，调用 rollback() 只撤销该操作自己的修改
+    """
+
+    in_group = False
+
+    def commit(self) -> None:
+        if not self.in_group:
+            super().commit()
+
+    def rollback(self) -> None:
+        if self.in_group:
+            self.execute(f"ROLLBACK TO {_SAVEPOINT}")
+        else:
+            super().rollback()
+
+
+class _WriteJob:
+    __slots__ = ("func", "args", "kwargs", "future", "loop")
+
+    def __init__(self, func: Callable, args: tuple, kwargs: dict,
+                 future: asyncio.Future, loop: asyncio.AbstractEventLoop):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.future = future
+        self.loop = loop
+
+
+def _resolve(future: asyncio.Future, result: Any = None, error: Optional[BaseException] = None) -> None:
+    """在事件循环线程中设置结果，调用方已放弃等待时忽略"""
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+class SQLiteEngine:
+    """
+    SQLite访问层
+
+    所有写操作排队交给唯一的写线程串行执行，队列中积压的写操作合并为一个事务提交（组提交）；
+    读操作在一个只读连接池中执行。数据库使用WAL模式，读操作不会被写事务阻塞，
+    也不会占用事件循环线程。每个连接打开时应用同一个存储配置
+    """
+
+    def __init__(self, db_path: str, readers: int = STORAGE_READERS, batch_max: int = WRITE_BATCH_MAX,
+                 profile: StorageProfile | None = None):
+        self.db_path = db_path
+        self.profile = profile or get_storage_profile(None)
+        self.readers = readers
+        self.batch_max = batch_max
+        self._local = threading.local()
+        self._queue: "queue.Queue[Optional[_WriteJob]]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._reader_pool: Optional[ThreadPoolExecutor] = None
+        self._reader_connections = []
+        self._start_lock = threading.Lock()
+        self._closed = False
+        self.commits = 0
+        self.writes = 0
+
+    def current_connection(self) -> Optional[sqlite3.Connection]:
+        """当前线程是写线程或读线程时返回其连接，否则返回None"""
+        return getattr(self._local, "conn", None)
+
+    def _connect(self, read_only: bool) -> sqlite3.Connection:
+        if read_only:
+            conn = sqlite3.connect(f"file:{pathname2url(self.db_path)}?mode=ro", uri=True,
+                                   timeout=SQLITE_TIMEOUT_SEC, check_same_thread=False,
+                                   cached_statements=STATEMENT_CACHE_SIZE)
+        else:
+            conn = sqlite3.connect(self.db_path, timeout=SQLITE_TIMEOUT_SEC, check_same_thread=False,
+                                   isolation_level=None, factory=_WriterConnection,
+                                   cached_statements=STATEMENT_CACHE_SIZE)
+            conn.execute("PRAGMA journal_mode=WAL")
+        apply_profile(conn, self.profile, read_only)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _ensure_started(self) -> None:
+        if self._closed:
+            raise RuntimeError("存储引擎已关闭")
+        if self._writer is not None:
+            return
+        with self._start_lock:
+            if self._closed:
+                raise RuntimeError("存储引擎已关闭")
+            if self._writer is None:
+                # 先打开写连接，确保数据库处于WAL模式后再启动只读连接
+                ready = threading.Event()
+                self._writer = threading.Thread(target=self._writer_loop, args=(ready,),
+                                                name="SQLiteWriter", daemon=True)
+                self._writer.start()
+                ready.wait()
+                self._reader_pool = ThreadPoolExecutor(max_workers=self.readers, thread_name_prefix="SQLiteReader",
+                                                       initializer=self._open_reader)
+
+    def _open_reader(self) -> None:
+        conn = self._connect(read_only=True)
+        self._local.conn = conn
+        self._reader_connections.append(conn)
+
+    def _writer_loop(self, ready: threading.Event) -> None:
+        try:
+            conn = self._connect(read_only=False)
+        except sqlite3.Error as e:
+            logger.error(f"打开数据库写连接失败: {e}")
+            conn = None
+        self._local.conn = conn
+        ready.set()
+
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            batch = [job]
+            stop = False
+            while len(batch) < self.batch_max:
+                try:
+                    job = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    stop = True
+                    break
+                batch.append(job)
+
+            self._run_batch(conn, batch)
+            if stop:
+                break
+
+        if conn is not None:
+            conn.close()
+
+    def _run_batch(self, conn: Optional[_WriterConnection], batch: list) -> None:
+        """在一个事务中执行一批写操作，每个操作使用独立的保存点"""
+        if conn is None:
+            error = sqlite3.OperationalError("数据库写连接不可用")
+            for job in batch:
+                job.loop.call_soon_threadsafe(_resolve, job.future, None, error)
+            return
+
+        results = []
+        try:
+            conn.execute("BEGIN")
+            conn.in_group = True
+            for job in batch:
+                conn.execute(f"SAVEPOINT {_SAVEPOINT}")
+                try:
+                    result = job.func(*job.args, **job.kwargs)
+                    results.append((job, result, None))
+                except Exception as e:
+                    conn.execute(f"ROLLBACK TO {_SAVEPOINT}")
+                    results.append((job, None, e))
+                conn.execute(f"RELEASE {_SAVEPOINT}")
+            conn.in_group = False
+            conn.execute("COMMIT")
+            self.commits += 1
+            self.writes += len(batch)
+        except sqlite3.Error as e:
+            # 提交失败时整批写操作都没有生效
+            conn.in_group = False
+            logger.error(f"数据库组提交失败: {e}")
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            results = [(job, None, e) for job in batch]
+
+        for job, result, error in results:
+            job.loop.call_soon_threadsafe(_resolve, job.future, result, error)
+
+    async def write(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        在写线程中执行 func(*args, **kwargs) 并等待其所在批次提交
+
+        func 通过 DataStorage.get_connection() 获得写连接，内部的 commit() 由组提交统一完成
+        """
+        self._ensure_started()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.put(_WriteJob(func, args, kwargs, future, loop))
+        return await future
+
+    async def read(self, func: Callable, *args, **kwargs) -> Any:
+        """在只读连接池中执行 func(*args, **kwargs)"""
+        self._ensure_started()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._reader_pool, lambda: func(*args, **kwargs))
+
+    def stats(self) -> str:
+        """组提交统计，用于关闭时的日志"""
+        average = self.writes / self.commits if self.commits else 0
+        return f"数据库写操作 {self.writes} 次，提交 {self.commits} 次，平均每次提交 {average:.1f} 个写操作"
+
+    def close(self) -> None:
+        """执行完队列中剩余的写操作后关闭所有连接"""
+        with self._start_lock:
+            if self._closed:
+                return
+            self._closed = True
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join()
+        if self._reader_pool is not None:
+            self._reader_pool.shutdown(wait=True)
+            for conn in self._reader_connections:
+                conn.close()
+            self._reader_connections.clear()
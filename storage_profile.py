@@ -0,0 +1,76 @@
+# storage_profile.py
+import sqlite3
+from typing import Dict, List, NamedTuple, Tuple
+
+# 未配置 storage_profile 时使用的存储配置
+DEFAULT_STORAGE_PROFILE = "durable"
+
+# 每个连接缓存的预编译语句数量
+STATEMENT_CACHE_SIZE = 256
+
+
+class StorageProfile(NamedTuple):
+    """打开数据库连接时应用的一组性能相关PRAGMA"""
+    name: str
+    synchronous: int  # 2 = FULL，每次提交都等待落盘；1 = NORMAL，WAL模式下断电最多丢失最近的提交
+    cache_size: int  # 页缓存大小，负数表示KiB
+    mmap_size: int  # 内存映射读取的字节数，0表示不使用
+    temp_store: int  # 0 = DEFAULT，2 = MEMORY
+    wal_autocheckpoint: int  # WAL达到多少页时自动检查点
+
+    def pragmas(self, read_only: bool = False) -> List[Tuple[str, int]]:
+        """需要在连接上执行的PRAGMA，只读连接跳过只影响写入的设置"""
+        pragmas = [
+            ("cache_size", self.cache_size),
+            ("mmap_size", self.mmap_size),
+            ("temp_store", self.temp_store),
+        ]
+        if not read_only:
+            pragmas += [
+                ("synchronous", self.synchronous),
+                ("wal_autocheckpoint", self.wal_autocheckpoint),
+            ]
+        return pragmas
+
+
+STORAGE_PROFILES: Dict[str, StorageProfile] = {
+    # 默认配置：每次提交都同步到磁盘，适合不能丢失VIP和管理员数据的部署
+    "durable": StorageProfile("durable", synchronous=2, cache_size=-8_000, mmap_size=0,
+                              temp_store=0, wal_autocheckpoint=1000),
+    # 高吞吐配置：WAL + NORMAL 同步，加大缓存并使用内存映射，适合高人数服务器的击杀统计
+    "fast": StorageProfile("fast", synchronous=1, cache_size=-64_000, mmap_size=256 * 1024 * 1024,
+                           temp_store=2, wal_autocheckpoint=4000),
+}
+
+
+def get_storage_profile(name: str) -> StorageProfile:
+    """按名称获取存储配置，名称未知时抛出ValueError"""
+    profile = STORAGE_PROFILES.get((name or DEFAULT_STORAGE_PROFILE).strip().lower())
+    if profile is None:
+        raise ValueError(f"未知的存储配置: {name}，可选: {', '.join(STORAGE_PROFILES)}")
+    return profile
+
+
+def apply_profile(conn: sqlite3.Connection, profile: StorageProfile, read_only: bool = False) -> None:
+    """在新打开的连接上应用存储配置"""
+    for pragma, value in profile.pragmas(read_only):
+        conn.execute(f"PRAGMA {pragma}={value}")
+
+
+def check_profile(conn: sqlite3.Connection, profile: StorageProfile) -> List[str]:
+    """
+    读回连接上的PRAGMA并与存储配置比较
+
+    Returns:
+        不一致项的描述列表，例如SQLite编译时限制了mmap_size或文件系统不支持WAL
+    """
+    mismatches = []
+    journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+    if str(journal_mode).lower() != "wal":
+        mismatches.append(f"journal_mode={journal_mode}（期望 wal）")
+    for pragma, expected in profile.pragmas():
+        actual = conn.execute(f"PRAGMA {pragma}").fetchone()
+        actual = actual[0] if actual else None
+        if actual != expected:
+            mismatches.append(f"{pragma}={actual}（期望 {expected}）")
+    return mismatches
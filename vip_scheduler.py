@@ -0,0 +1,149 @@
+# vip_scheduler.py
+import asyncio
+import heapq
+import time
+from typing import Dict, List, Optional, Tuple
+
+from Log import log
+from commands import Commands
+from dataStorage import DataStorage
+
+logger = log()
+
+# 从游戏中移除过期VIP失败后的重试间隔（秒）
+VIP_EXPIRY_RETRY_SEC = 60
+
+# 从数据库重新载入VIP过期时间的间隔（秒），QQ机器人进程中添加、删除的VIP最迟在该间隔后生效
+VIP_EXPIRY_RELOAD_SEC = 300
+
+
+class VipExpiryScheduler:
+    """
+    VIP过期调度器
+
+    所有带过期时间的VIP按过期时间放入最小堆，后台任务睡眠到最早的过期时间再处理，
+    添加、续期和删除VIP时通过 schedule()/unschedule() 更新，每次变更 O(log n)；
+    被覆盖的旧堆条目不立即删除，出堆时与 _expiry 对照后丢弃。
+    QQ命令在另一个进程中修改VIP，调度器对它们的 schedule() 不可见，因此每隔 reload_interval 秒
+    从数据库重新载入一次，睡眠时间不超过下次载入的时间
+    """
+
+    def __init__(self, commands: Commands, data: DataStorage, reload_interval: float = VIP_EXPIRY_RELOAD_SEC):
+        self.commands = commands
+        self.data = data
+        self.reload_interval = reload_interval
+        self._heap: List[Tuple[int, str]] = []
+        self._expiry: Dict[str, int] = {}  # 玩家ID -> 当前有效的过期时间
+        self._changed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._expiry)
+
+    def schedule(self, player_id: str, expire_time: Optional[int]) -> None:
+        """
+        设置或更新VIP的过期时间
+
+        Args:
+            player_id: 玩家ID
+            expire_time: 过期时间戳（秒），None表示永久VIP，从调度中移除
+        """
+        if expire_time is None:
+            self.unschedule(player_id)
+            return
+
+        self._expiry[player_id] = expire_time
+        heapq.heappush(self._heap, (expire_time, player_id))
+        # 旧条目过多时重建堆，避免频繁续期导致堆无限增长
+        if len(self._heap) > 2 * len(self._expiry) + 64:
+            self._heap = [(when, pid) for pid, when in self._expiry.items()]
+            heapq.heapify(self._heap)
+        self._changed.set()
+
+    def unschedule(self, player_id: str) -> None:
+        """VIP被删除或改为永久时调用"""
+        if self._expiry.pop(player_id, None) is not None:
+            self._changed.set()
+
+    def next_expiry(self) -> Optional[Tuple[int, str]]:
+        """最早过期的 (过期时间, 玩家ID)，丢弃堆顶已失效的条目"""
+        while self._heap:
+            expire_time, player_id = self._heap[0]
+            if self._expiry.get(player_id) == expire_time:
+                return expire_time, player_id
+            heapq.heappop(self._heap)
+        return None
+
+    async def load(self, log_info: bool = True) -> None:
+        """从数据库载入全部带过期时间的VIP，替换当前的调度"""
+        expiries = await self.data.async_get_vip_expiries()
+        self._expiry = dict(expiries)
+        self._heap = [(expire_time, player_id) for player_id, expire_time in self._expiry.items()]
+        heapq.heapify(self._heap)
+        self._changed.set()
+        if log_info:
+            logger.info(f"VIP过期调度已载入 {len(self._expiry)} 个VIP")
+
+    def _pop_due(self, now: int) -> List[str]:
+        due = []
+        while True:
+            entry = self.next_expiry()
+            if entry is None or entry[0] > now:
+                return due
+            heapq.heappop(self._heap)
+            del self._expiry[entry[1]]
+            due.append(entry[1])
+
+    async def _expire(self, player_ids: List[str]) -> None:
+        """从游戏中移除到期的VIP，成功的删除数据库记录，失败的稍后重试"""
+        results = await asyncio.gather(*(self.commands.remove_game_vip(player_id) for player_id in player_ids),
+                                       return_exceptions=True)
+        removed = [player_id for player_id, ok in zip(player_ids, results) if ok is True]
+        failed = [player_id for player_id, ok in zip(player_ids, results) if ok is not True]
+
+        if removed:
+            await self.data.async_remove_vips(removed)
+            logger.info(f"已清理过期VIP: {removed}")
+        if failed:
+            logger.warning(f"移除过期VIP失败，{VIP_EXPIRY_RETRY_SEC} 秒后重试: {failed}")
+            retry_at = int(time.time()) + VIP_EXPIRY_RETRY_SEC
+            for player_id in failed:
+                # 等待期间被重新调度（如续期）的VIP保留新的过期时间，已被其他流程删除的不再重试
+                if player_id not in self._expiry and await self.data.async_get_vip(player_id):
+                    self.schedule(player_id, retry_at)
+
+    async def run(self) -> None:
+        """后台调度循环，睡眠到下一个VIP过期、调度发生变化或需要重新载入"""
+        await self.load()
+        next_reload = time.monotonic() + self.reload_interval
+        while True:
+            try:
+                if time.monotonic() >= next_reload:
+                    await self.load(log_info=False)
+                    next_reload = time.monotonic() + self.reload_interval
+
+                self._changed.clear()
+                due = self._pop_due(int(time.time()))
+                if due:
+                    await self._expire(due)
+                    continue
+
+                timeout = max(0.0, next_reload - time.monotonic())
+                entry = self.next_expiry()
+                if entry is not None:
+                    timeout = min(timeout, max(0.0, entry[0] - time.time()))
+                try:
+                    await asyncio.wait_for(self._changed.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"VIP过期调度出错: {e}")
+                await asyncio.sleep(VIP_EXPIRY_RETRY_SEC)
+
+    def start(self) -> asyncio.Task:
+        """启动后台调度任务"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run(), name="VIPExpiry")
+        return self._task
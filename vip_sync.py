@@ -0,0 +1,140 @@
+# vip_sync.py
+import asyncio
+import time
+from typing import Dict, List, NamedTuple, Optional, Set
+
+from Log import log
+from commands import Commands
+from dataStorage import DataStorage
+
+logger = log()
+
+
+class VipSyncPlan(NamedTuple):
+    """数据库与游戏服务器VIP的差异"""
+    to_add: Dict[str, str]  # 数据库中有效但游戏中没有的VIP：玩家ID -> 描述
+    to_remove: List[str]  # 游戏中仍存在但数据库中已过期的VIP
+    expired: List[str]  # 数据库中已过期的全部VIP
+    db_count: int  # 数据库中有效VIP数
+    game_count: int  # 游戏中VIP数
+    game_available: bool = True  # 是否取得了游戏中的VIP列表，为False时不能据此修改任何一方
+
+
+class VipSyncReport(NamedTuple):
+    """一次VIP同步的结果"""
+    plan: VipSyncPlan
+    added: List[str]
+    removed: List[str]
+    failed: List[str]
+    cleaned: int  # 从数据库删除的过期记录数
+    dry_run: bool
+    elapsed: float
+
+    def summary(self) -> str:
+        """单行摘要，用于日志和QQ回复"""
+        if not self.plan.game_available:
+            return f"VIP同步已跳过: 无法获取游戏中的VIP列表，数据库有效 {self.plan.db_count} 个"
+        mode = "（演练，未实际修改）" if self.dry_run else ""
+        return (f"VIP同步{mode}: 数据库有效 {self.plan.db_count} 个，游戏中 {self.plan.game_count} 个，"
+                f"添加 {len(self.added)}/{len(self.plan.to_add)}，移除 {len(self.removed)}/{len(self.plan.to_remove)}，"
+                f"失败 {len(self.failed)}，清理过期记录 {self.cleaned}，耗时 {self.elapsed:.1f}秒")
+
+
+class VipReconciler:
+    """
+    VIP对账
+
+    把数据库和游戏服务器的VIP分别读入集合，一次求出需要添加和移除的差异，
+    再以连接池大小为并发上限批量执行，移除时不再逐个查询数据库
+    """
+
+    def __init__(self, commands: Commands, data: DataStorage, concurrency: Optional[int] = None):
+        self.commands = commands
+        self.data = data
+        self.concurrency = concurrency or commands.connection_pool.max_connections
+
+    async def plan(self) -> VipSyncPlan:
+        """读取两边的VIP并计算差异"""
+        # 对账必须使用游戏服务器的最新VIP列表
+        self.commands.cache.invalidate("get vipids")
+        active_vips, expired_vips, game_vips = await asyncio.gather(
+            self.data.async_get_all_active_vips(),
+            self.data.async_get_expired_vips(),
+            self.commands.get_vip_ids(),
+        )
+
+        active = {vip["player_id"]: vip.get("description") or "" for vip in active_vips}
+        expired: Set[str] = {vip["player_id"] for vip in expired_vips}
+        if game_vips is None:
+            # 游戏VIP列表查询失败，不能当作游戏中没有VIP处理
+            return VipSyncPlan({}, [], sorted(expired), len(active), 0, game_available=False)
+
+        in_game: Set[str] = {vip["player_id"] for vip in game_vips if vip.get("player_id")}
+
+        return VipSyncPlan(
+            to_add={player_id: active[player_id] for player_id in active.keys() - in_game},
+            to_remove=sorted(in_game & expired),
+            expired=sorted(expired),
+            db_count=len(active),
+            game_count=len(in_game),
+        )
+
+    async def _apply(self, player_ids: List[str], action) -> Dict[str, bool]:
+        """以有限并发对每个玩家执行操作"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run(player_id: str) -> bool:
+            async with semaphore:
+                try:
+                    return await action(player_id)
+                except Exception as e:
+                    logger.error(f"VIP同步操作失败: {player_id}, {e}")
+                    return False
+
+        results = await asyncio.gather(*(run(player_id) for player_id in player_ids))
+        return dict(zip(player_ids, results))
+
+    async def reconcile(self, dry_run: bool = False, add: bool = True, remove: bool = True) -> VipSyncReport:
+        """
+        对账并同步
+
+        Args:
+            dry_run: 只计算差异，不修改游戏服务器和数据库
+            add: 是否把数据库中有效的VIP添加到游戏
+            remove: 是否从游戏移除已过期的VIP，并删除数据库中的过期记录
+
+        Returns:
+            同步结果
+        """
+        start = time.perf_counter()
+        plan = await self.plan()
+        added: List[str] = []
+        removed: List[str] = []
+        failed: List[str] = []
+        cleaned = 0
+
+        if not plan.game_available:
+            logger.warning("无法获取游戏中的VIP列表，本次不添加、移除或清理任何VIP")
+        elif not dry_run:
+            if add and plan.to_add:
+                results = await self._apply(list(plan.to_add),
+                                            lambda player_id: self.commands.add_vip(player_id, plan.to_add[player_id]))
+                added = [player_id for player_id, ok in results.items() if ok]
+                failed.extend(player_id for player_id, ok in results.items() if not ok)
+
+            if remove:
+                if plan.to_remove:
+                    results = await self._apply(plan.to_remove, self.commands.remove_game_vip)
+                    removed = [player_id for player_id, ok in results.items() if ok]
+                    failed.extend(player_id for player_id, ok in results.items() if not ok)
+
+                # 只删除确认已不在游戏中的过期VIP记录，移除未成功的保留到下次对账重试
+                pending = set(plan.to_remove) - set(removed)
+                cleaned = await self.data.async_remove_vips(
+                    [player_id for player_id in plan.expired if player_id not in pending])
+
+        report = VipSyncReport(plan, added, removed, failed, cleaned, dry_run, time.perf_counter() - start)
+        logger.info(report.summary())
+        if failed:
+            logger.warning(f"VIP同步失败的玩家: {failed}")
+        return report